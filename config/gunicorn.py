@@ -0,0 +1,76 @@
+"""
+Gunicorn configuration for production serving.
+
+Usage:
+    uv run gunicorn -c config/gunicorn.py config.asgi:application
+
+Workers are Uvicorn ASGI workers so the async map, search and export views
+can hold many slow clients per process. Every setting can be overridden from
+the environment (GUNICORN_* or WEB_CONCURRENCY). Run them with DB_POOL=True
+(and the pool extra): persistent connections don't work under ASGI.
+
+The Django app is preloaded in the master process and forked, so workers
+share its memory copy-on-write. Because code is loaded before forking, send
+HUP to pick up configuration changes, and USR2 followed by TERM to the old
+master to roll out new code without dropping connections.
+"""
+
+import multiprocessing
+import os
+import tempfile
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+
+# Async workers are I/O bound, so one per core plus one is enough; the sync
+# fallback (GUNICORN_WORKER_CLASS=gthread with config.wsgi) uses the classic
+# 2 * cores + 1 with a few threads each.
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "uvicorn_worker.UvicornWorker")
+if worker_class == "gthread":
+    workers = _env_int("WEB_CONCURRENCY", cpu_count * 2 + 1)
+    threads = _env_int("GUNICORN_THREADS", 4)
+else:
+    workers = _env_int("WEB_CONCURRENCY", cpu_count + 1)
+
+preload_app = True
+
+# Workers write Prometheus metrics to files in this directory so /metrics can
+# aggregate all of them. It must exist and start empty before the app (and
+# prometheus_client) is loaded, so create a fresh one unless one is given.
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+
+# Recycle workers periodically to cap memory growth; jitter avoids restarting
+# every worker at once.
+max_requests = _env_int("GUNICORN_MAX_REQUESTS", 2000)
+max_requests_jitter = _env_int("GUNICORN_MAX_REQUESTS_JITTER", 200)
+
+# Exports stream for a long time, so allow slow responses and give in-flight
+# downloads time to finish during reloads.
+timeout = _env_int("GUNICORN_TIMEOUT", 120)
+graceful_timeout = _env_int("GUNICORN_GRACEFUL_TIMEOUT", 60)
+keepalive = _env_int("GUNICORN_KEEPALIVE", 5)
+
+accesslog = os.environ.get("GUNICORN_ACCESSLOG", "-") or None
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOGLEVEL", "info")
+
+
+def post_fork(server, worker):
+    """Drop any database connection inherited from the preloading master."""
+    from django.db import connections
+
+    connections.close_all()
+
+
+def child_exit(server, worker):
+    """Discard live gauges of a worker that has exited."""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
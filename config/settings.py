@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 
 import environ
@@ -86,6 +87,9 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "mapping_violence.metrics.MetricsMiddleware",
+    "mapping_violence.profiling.ProfilingMiddleware",
+    "mapping_violence.slow_queries.SlowQueryMiddleware",
     "wagtail.contrib.redirects.middleware.RedirectMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -143,9 +147,31 @@ DATABASES = {
         "NAME": env("DB_NAME", default="mapping_violence"),
         "USER": env("DB_USER", default="mapping_violence"),
         "PASSWORD": env("DB_PASS", default="password"),
+        # Persistent connections are off by default: under ASGI every request
+        # runs its queries on a new thread, so connections kept per thread pile
+        # up instead of being reused. Serve ASGI with DB_POOL below; a positive
+        # DB_CONN_MAX_AGE only helps the sync WSGI workers.
+        # https://docs.djangoproject.com/en/5.1/ref/databases/#persistent-connections
+        "CONN_MAX_AGE": env.int("DB_CONN_MAX_AGE", default=0),
+        "CONN_HEALTH_CHECKS": env.bool("DB_CONN_HEALTH_CHECKS", default=True),
     }
 }
 
+# Connection pooling needs psycopg 3 (``uv sync --extra pool``). Django keeps
+# pooled connections itself, so persistent connections must be disabled; this
+# is the setup for the Uvicorn workers in config/gunicorn.py, and the Docker
+# image turns it on.
+# https://docs.djangoproject.com/en/5.1/ref/databases/#connection-pool
+if env.bool("DB_POOL", default=False):
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": env.int("DB_POOL_MIN_SIZE", default=2),
+            "max_size": env.int("DB_POOL_MAX_SIZE", default=10),
+            "timeout": env.int("DB_POOL_TIMEOUT", default=10),
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -236,6 +262,10 @@ else:
     MEDIA_URL = "media/"
     MEDIA_ROOT = os.path.join(BASE_DIR, "mediafiles")
 
+# Pre-built full-dataset exports (see build_export_artifacts), relative to
+# default storage
+EXPORT_ARTIFACTS_DIR = env("EXPORT_ARTIFACTS_DIR", default="exports")
+
 # Cache
 # https://docs.djangoproject.com/en/5.1/topics/cache/
 CACHES = {
@@ -248,6 +278,91 @@ CACHES = {
 # django-ratelimit
 # https://django-ratelimit.readthedocs.io/
 RATELIMIT_USE_CACHE = "default"
+# Disable only for load testing (see util/loadtest.py)
+RATELIMIT_ENABLE = env.bool("RATELIMIT_ENABLE", default=True)
+
+# Request profiling (mapping_violence.profiling): share of requests sampled,
+# samples kept per worker for the admin performance page, and the wall time
+# above which a sample is logged as a warning. Test runs sample nothing unless
+# a test overrides the rate, so profiles don't land in the test output.
+TESTING = sys.argv[1:2] == ["test"]
+PROFILING_SAMPLE_RATE = env.float(
+    "PROFILING_SAMPLE_RATE", default=0 if TESTING else 0.01
+)
+PROFILING_BUFFER_SIZE = env.int("PROFILING_BUFFER_SIZE", default=1000)
+PROFILING_SLOW_MS = env.int("PROFILING_SLOW_MS", default=1000)
+
+# Prometheus metrics (mapping_violence.metrics): bearer token scrapers send to
+# /metrics. Client addresses can't be trusted behind the reverse proxy, so
+# without a token only logged-in staff can read the endpoint.
+METRICS_TOKEN = env("METRICS_TOKEN", default="")
+
+# Slow query capture (mapping_violence.slow_queries): SELECTs slower than
+# SLOW_QUERY_MS are logged with their EXPLAIN plan to SLOW_QUERY_LOG;
+# 0 disables it. EXPLAIN ANALYZE runs each slow query a second time.
+SLOW_QUERY_MS = env.int("SLOW_QUERY_MS", default=0)
+SLOW_QUERY_EXPLAIN_ANALYZE = env.bool("SLOW_QUERY_EXPLAIN_ANALYZE", default=False)
+SLOW_QUERY_LOG = env("SLOW_QUERY_LOG", default=str(BASE_DIR / "slow_queries.jsonl"))
+
+# Related-crimes index (mapping_violence.related): people with one of these
+# names don't link cases together, and through anyone else a crime links to
+# at most this many of their other crimes, the nearest in date
+RELATED_CRIMES_PLACEHOLDER_NAMES = env.list(
+    "RELATED_CRIMES_PLACEHOLDER_NAMES", default=["unknown", "ignoto", "ignota"]
+)
+RELATED_CRIMES_MAX_PER_PERSON = env.int("RELATED_CRIMES_MAX_PER_PERSON", default=50)
+
+# Person network API (mapping_violence.network): deepest walk allowed and
+# the most people and links returned for one person
+PERSON_NETWORK_MAX_DEPTH = env.int("PERSON_NETWORK_MAX_DEPTH", default=3)
+PERSON_NETWORK_MAX_NODES = env.int("PERSON_NETWORK_MAX_NODES", default=200)
+PERSON_NETWORK_MAX_EDGES = env.int("PERSON_NETWORK_MAX_EDGES", default=1000)
+
+# People who perpetrated at least this many crimes are flagged as repeat
+# offenders (mapping_violence.summaries.update_repeat_offenders)
+REPEAT_OFFENDER_MIN_CRIMES = env.int("REPEAT_OFFENDER_MIN_CRIMES", default=2)
+
+# Geocoder for locations.geocoding and the geocode_locations command:
+# "nominatim", "fixture" (the CSV at GEOCODER_FIXTURE, for offline runs) or
+# a dotted path to a geocoder class
+GEOCODER = env("GEOCODER", default="nominatim")
+GEOCODER_FIXTURE = env("GEOCODER_FIXTURE", default="")
+GEOCODER_USER_AGENT = env("GEOCODER_USER_AGENT", default="mapping_violence_chnm")
+GEOCODER_TIMEOUT = env.int("GEOCODER_TIMEOUT", default=10)
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "message": {"format": "%(message)s"},
+    },
+    "handlers": {
+        "slow_queries": {
+            "class": "logging.FileHandler",
+            "filename": SLOW_QUERY_LOG,
+            "formatter": "message",
+            "delay": True,
+        },
+        # One JSON object per profiled request, collected with the container logs
+        "profiling": {
+            "class": "logging.StreamHandler",
+            "formatter": "message",
+        },
+    },
+    "loggers": {
+        "mapping_violence.slow_queries": {
+            "handlers": ["slow_queries"],
+            "level": "WARNING",
+            "propagate": False,
+        },
+        # INFO for every sample, WARNING for samples over PROFILING_SLOW_MS
+        "mapping_violence.profiling": {
+            "handlers": ["profiling"],
+            "level": env("PROFILING_LOG_LEVEL", default="INFO"),
+            "propagate": False,
+        },
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -378,6 +493,11 @@ UNFOLD = {
                         "icon": "group",
                         "link": "/admin/auth/group/",
                     },
+                    {
+                        "title": "Performance",
+                        "icon": "speed",
+                        "link": "/admin/performance/",
+                    },
                 ],
             },
         ],
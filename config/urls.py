@@ -9,23 +9,53 @@ from wagtail.admin import urls as wagtailadmin_urls
 from wagtail.documents import urls as wagtaildocs_urls
 
 from content.views import download_blog_post_markdown
-from locations.views import locations_geojson, map_view
-from mapping_violence.api import person_search
-from mapping_violence.views import crime_detail, crime_export_csv, crime_list, index
+from locations.views import locations_density, locations_geojson, map_view
+from mapping_violence.api import (
+    crime_timeline,
+    person_network,
+    person_profile,
+    person_search,
+)
+from mapping_violence.dashboard import performance_dashboard
+from mapping_violence.metrics import metrics_view
+from mapping_violence.views import (
+    crime_detail,
+    crime_export,
+    crime_export_csv,
+    crime_list,
+    index,
+    person_detail,
+)
 
 urlpatterns = [
     path("", index, name="index"),
     path("map/", map_view, name="map"),
     path("data/", crime_list, name="crime_list"),
     path("data/export.csv", crime_export_csv, name="crime_export_csv"),
+    path("data/export.<str:fmt>", crime_export, name="crime_export"),
     path(
         "api/docs/",
         TemplateView.as_view(template_name="api_docs.html"),
         name="api_docs",
     ),
     path("api/locations.geojson", locations_geojson, name="locations_geojson"),
+    path("api/density", locations_density, name="locations_density"),
+    path("api/timeline", crime_timeline, name="crime_timeline"),
     path("api/persons/search/", person_search, name="person_search"),
+    path("api/persons/<int:person_id>", person_profile, name="person_profile"),
+    path(
+        "api/persons/<int:person_id>/network",
+        person_network,
+        name="person_network",
+    ),
     path("crime/<int:crime_id>/", crime_detail, name="crime_detail"),
+    path("person/<int:person_id>/", person_detail, name="person_detail"),
+    path("metrics", metrics_view, name="metrics"),
+    path(
+        "admin/performance/",
+        admin.site.admin_view(performance_dashboard),
+        name="performance_dashboard",
+    ),
     path("admin/", admin.site.urls),
     path(
         "cms/download-markdown/<int:page_id>/",
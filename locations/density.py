@@ -0,0 +1,68 @@
+"""
+Binned crime density for the map's heatmap.
+
+``grid`` bins location coordinates, weighted by their crime counts, into
+square cells with NumPy, so dense places such as Venice can be drawn as
+one raster instead of thousands of markers.
+"""
+
+import math
+
+import numpy as np
+
+DEFAULT_SIZE = 128
+MAX_SIZE = 512
+
+
+def extent(lons, lats):
+    """Bounding box of the points, padded so that it is never empty."""
+    pad = 1e-4
+    return (
+        float(lons.min()) - pad,
+        float(lats.min()) - pad,
+        float(lons.max()) + pad,
+        float(lats.max()) + pad,
+    )
+
+
+def grid(points, bbox=None, size=DEFAULT_SIZE):
+    """Bin ``points`` of (longitude, latitude, weight) into a density grid.
+
+    ``bbox`` is (west, south, east, north) and defaults to the extent of the
+    points. Cells are square in degrees, ``size`` of them along the longer
+    side. Returns the grid description with its non-empty cells as
+    [row, column, weight], row 0 at the southern edge.
+    """
+    data = np.array(points, dtype=float).reshape(-1, 3)
+    lons, lats, weights = data[:, 0], data[:, 1], data[:, 2]
+    if bbox is None:
+        bbox = extent(lons, lats) if len(data) else (-180.0, -90.0, 180.0, 90.0)
+    west, south, east, north = bbox
+
+    cell = max(east - west, north - south) / size
+    # Rounding can leave a ratio a hair above a whole number
+    cols = max(1, math.ceil((east - west) / cell - 1e-9))
+    rows = max(1, math.ceil((north - south) / cell - 1e-9))
+
+    # The last row and column may reach past the box; only points inside
+    # it are counted
+    inside = (lons >= west) & (lons <= east) & (lats >= south) & (lats <= north)
+    counts, _, _ = np.histogram2d(
+        lats[inside],
+        lons[inside],
+        bins=(rows, cols),
+        range=((south, south + rows * cell), (west, west + cols * cell)),
+        weights=weights[inside],
+    )
+
+    row_idx, col_idx = np.nonzero(counts)
+    values = counts[row_idx, col_idx].astype(int)
+    return {
+        "bbox": [west, south, east, north],
+        "cell_size": cell,
+        "rows": rows,
+        "cols": cols,
+        "total": int(values.sum()),
+        "max": int(values.max()) if len(values) else 0,
+        "cells": np.column_stack((row_idx, col_idx, values)).tolist(),
+    }
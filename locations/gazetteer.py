@@ -0,0 +1,140 @@
+"""
+Local gazetteer of parishes, sestieri and landmarks.
+
+Many archival locations are known only by their parish, sestiere or a
+landmark. ``read_places`` reads such places with their centroids from a CSV
+or GeoJSON file for the import_gazetteer command, and ``Gazetteer`` matches
+locations to them by normalized name, so match_gazetteer can place those
+locations at their parish or landmark rather than at the centre of the
+city, without any network lookups.
+"""
+
+import csv
+import json
+import re
+import unicodedata
+from pathlib import Path
+
+from locations.models import PLACE_KIND_CHOICES, Place
+
+# Location fields tried in turn, the most specific first
+MATCH_FIELDS = ("landmark", "name", "parish_religious_order", "sestiere")
+
+KIND_RANK = {kind: rank for rank, (kind, _) in enumerate(PLACE_KIND_CHOICES)}
+
+# Saint and article prefixes written in many ways ("S. Polo", "San Polo",
+# "Sto. Stefano", "la Giudecca")
+DROP_WORDS = {
+    "s", "san", "sant", "santa", "santo", "santi", "ss", "st", "sta", "sto",
+    "il", "la", "lo", "le", "l",
+}  # fmt: skip
+
+
+def normalize_name(text):
+    """Matching key for a place name: lowercase ASCII words without saint
+    and article prefixes."""
+    text = unicodedata.normalize("NFKD", str(text or ""))
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    words = re.findall(r"[a-z0-9]+", text)
+    kept = [w for w in words if w not in DROP_WORDS]
+    # A name made only of dropped words ("San") keeps them
+    return " ".join(kept or words)
+
+
+def centroid(geometry):
+    """(longitude, latitude) centroid of a GeoJSON Point, Polygon or
+    MultiPolygon; polygons are weighted by the area of their outer rings."""
+    if geometry["type"] == "Point":
+        return tuple(geometry["coordinates"][:2])
+    if geometry["type"] == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif geometry["type"] == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        raise ValueError(f"Unsupported geometry type {geometry['type']}")
+
+    area = cx = cy = 0.0
+    for polygon in polygons:
+        ring = polygon[0]
+        for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1], strict=True):
+            cross = x0 * y1 - x1 * y0
+            area += cross
+            cx += (x0 + x1) * cross
+            cy += (y0 + y1) * cross
+    if not area:
+        # Degenerate ring: average its points
+        points = [point for polygon in polygons for point in polygon[0]]
+        return (
+            sum(p[0] for p in points) / len(points),
+            sum(p[1] for p in points) / len(points),
+        )
+    return (cx / (3 * area), cy / (3 * area))
+
+
+def read_places(path):
+    """Yield dicts of name, kind, latitude, longitude and city (which may be
+    blank) from a CSV with those columns or a GeoJSON FeatureCollection whose
+    features carry name, kind and city properties."""
+    path = Path(path)
+    if path.suffix.lower() in (".json", ".geojson"):
+        with path.open(encoding="utf-8") as f:
+            data = json.load(f)
+        for feature in data["features"]:
+            props = feature.get("properties") or {}
+            longitude, latitude = centroid(feature["geometry"])
+            yield {
+                "name": props.get("name", ""),
+                "kind": props.get("kind", ""),
+                "city": props.get("city", ""),
+                "latitude": latitude,
+                "longitude": longitude,
+            }
+    else:
+        with path.open(newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                yield {
+                    "name": row.get("name", ""),
+                    "kind": row.get("kind", ""),
+                    "city": row.get("city", ""),
+                    "latitude": row.get("latitude"),
+                    "longitude": row.get("longitude"),
+                }
+
+
+class Gazetteer:
+    """Places indexed by city and normalized name.
+
+    ``for_locations`` loads only the places whose names appear in the
+    locations' match fields, in one query on the normalized name index.
+    """
+
+    def __init__(self, places):
+        self.index = {}
+        for place in places:
+            key = (place.city_id, place.normalized_name)
+            current = self.index.get(key)
+            if current is None or KIND_RANK[place.kind] < KIND_RANK[current.kind]:
+                self.index[key] = place
+
+    @classmethod
+    def for_locations(cls, locations):
+        names = {
+            normalize_name(value)
+            for location in locations
+            for value in (getattr(location, field) for field in MATCH_FIELDS)
+            if value
+        }
+        cities = {location.city_id for location in locations}
+        return cls(
+            Place.objects.filter(normalized_name__in=names - {""}, city_id__in=cities)
+        )
+
+    def match(self, location):
+        """Most specific place named by one of the location's fields, or None."""
+        for field in MATCH_FIELDS:
+            value = getattr(location, field)
+            if value:
+                place = self.index.get((location.city_id, normalize_name(value)))
+                if place:
+                    return place
+        return None
@@ -0,0 +1,174 @@
+"""
+Address geocoding with a persistent result cache.
+
+A geocoder is a class with a ``name``, a ``max_workers`` limit, a
+``min_delay`` between requests and a ``geocode(query)`` method returning
+(latitude, longitude) or None, raising GeocodingError when the service
+can't answer right now. ``get_geocoder`` builds the one named by GEOCODER:
+"nominatim", "fixture" (a local CSV of known places, for offline use) or a
+dotted path to a class.
+
+Every answer, misses included, is stored in GeocodeResult keyed by
+geocoder and normalized query, so an address is only looked up once and an
+interrupted batch run (the geocode_locations command) resumes where it
+stopped. Errors are not stored and are retried on the next run.
+"""
+
+import csv
+import re
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from locations.models import GeocodeResult
+
+
+class GeocodingError(Exception):
+    """The geocoder could not answer; the query may succeed later."""
+
+
+def normalize_query(text):
+    """Cache key for an address: lowercased, single-spaced, tidy commas."""
+    text = re.sub(r"\s*,\s*", ", ", " ".join(str(text).split()))
+    return text.strip(", ").lower()
+
+
+def location_query(location):
+    """Address query for a Location, or None without an address and city."""
+    if not location.address or not location.city_id:
+        return None
+    return normalize_query(f"{location.address}, {location.city.name}")
+
+
+class NominatimGeocoder:
+    """OpenStreetMap's Nominatim, limited to one request a second by its
+    usage policy."""
+
+    name = "nominatim"
+    max_workers = 1
+    min_delay = 1.0
+
+    def __init__(self):
+        from geopy.geocoders import Nominatim
+
+        self.client = Nominatim(user_agent=settings.GEOCODER_USER_AGENT)
+
+    def geocode(self, query):
+        from geopy.exc import GeopyError
+
+        try:
+            place = self.client.geocode(query, timeout=settings.GEOCODER_TIMEOUT)
+        except GeopyError as exc:
+            raise GeocodingError(str(exc)) from exc
+        return (place.latitude, place.longitude) if place else None
+
+
+class FixtureGeocoder:
+    """Known places from a CSV with query, latitude and longitude columns."""
+
+    name = "fixture"
+    max_workers = 8
+    min_delay = 0
+
+    def __init__(self, path=None):
+        path = path or settings.GEOCODER_FIXTURE
+        if not path:
+            raise ImproperlyConfigured("GEOCODER_FIXTURE is not set")
+        with open(path, newline="", encoding="utf-8") as f:
+            self.places = {
+                normalize_query(row["query"]): (
+                    Decimal(row["latitude"]),
+                    Decimal(row["longitude"]),
+                )
+                for row in csv.DictReader(f)
+                if row.get("latitude") and row.get("longitude")
+            }
+
+    def geocode(self, query):
+        return self.places.get(normalize_query(query))
+
+
+GEOCODERS = {
+    "nominatim": NominatimGeocoder,
+    "fixture": FixtureGeocoder,
+}
+
+
+def get_geocoder(name=None):
+    """Geocoder named by ``name`` (default GEOCODER)."""
+    name = name or settings.GEOCODER
+    return (GEOCODERS.get(name) or import_string(name))()
+
+
+class RateLimiter:
+    """Spaces calls at least ``min_delay`` seconds apart across threads."""
+
+    def __init__(self, min_delay):
+        self.min_delay = min_delay
+        self.lock = threading.Lock()
+        self.next_at = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.next_at > now:
+                time.sleep(self.next_at - now)
+                now = self.next_at
+            self.next_at = now + self.min_delay
+
+
+def lookup(geocoder, query, limiter=None, retries=2):
+    """Ask ``geocoder`` about ``query``, retrying errors with a growing pause;
+    raise GeocodingError once the retries run out."""
+    for attempt in range(retries + 1):
+        if limiter:
+            limiter.wait()
+        try:
+            return geocoder.geocode(query)
+        except GeocodingError:
+            if attempt == retries:
+                raise
+            time.sleep(attempt + 1)
+
+
+def cached(geocoder, queries):
+    """Stored answers of ``geocoder`` for ``queries``: {query: coordinates or None}."""
+    return {
+        result.query: result.coordinates
+        for result in GeocodeResult.objects.filter(
+            backend=geocoder.name, query__in=queries
+        )
+    }
+
+
+def store(geocoder, answers):
+    """Save ``answers`` ({query: coordinates or None}) to the cache."""
+    GeocodeResult.objects.bulk_create(
+        [
+            GeocodeResult(
+                backend=geocoder.name,
+                query=query,
+                latitude=coordinates[0] if coordinates else None,
+                longitude=coordinates[1] if coordinates else None,
+            )
+            for query, coordinates in answers.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["backend", "query"],
+        update_fields=["latitude", "longitude"],
+    )
+
+
+def geocode(query, geocoder=None):
+    """Coordinates of ``query`` from the cache or, failing that, the geocoder."""
+    geocoder = geocoder or get_geocoder()
+    query = normalize_query(query)
+    answers = cached(geocoder, [query])
+    if query not in answers:
+        answers[query] = lookup(geocoder, query)
+        store(geocoder, answers)
+    return answers[query]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:45
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Q, Subquery
+
+
+def backfill_effective_coordinates(apps, schema_editor):
+    City = apps.get_model("locations", "City")
+    Location = apps.get_model("locations", "Location")
+    own = (
+        Q(latitude__isnull=False, longitude__isnull=False)
+        & ~Q(latitude=0)
+        & ~Q(longitude=0)
+    )
+    city_has = (
+        Q(city__latitude__isnull=False, city__longitude__isnull=False)
+        & ~Q(city__latitude=0)
+        & ~Q(city__longitude=0)
+    )
+    city = City.objects.filter(pk=OuterRef("city_id"))
+    Location.objects.filter(own).update(
+        effective_latitude=F("latitude"),
+        effective_longitude=F("longitude"),
+        precision="precise",
+    )
+    Location.objects.exclude(own).filter(city_has).update(
+        effective_latitude=Subquery(city.values("latitude")),
+        effective_longitude=Subquery(city.values("longitude")),
+        precision="city",
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("locations", "0007_city_country_city_region"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="location",
+            name="effective_latitude",
+            field=models.DecimalField(
+                blank=True, decimal_places=6, editable=False, max_digits=9, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="location",
+            name="effective_longitude",
+            field=models.DecimalField(
+                blank=True, decimal_places=6, editable=False, max_digits=9, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="location",
+            name="precision",
+            field=models.CharField(
+                blank=True,
+                choices=[("precise", "Location"), ("city", "City")],
+                editable=False,
+                help_text="Source of the effective coordinates",
+                max_length=10,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="location",
+            index=models.Index(
+                fields=["effective_latitude", "effective_longitude"],
+                name="location_effective_idx",
+            ),
+        ),
+        migrations.RunPython(backfill_effective_coordinates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("locations", "0008_effective_coordinates"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GeocodeResult",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("backend", models.CharField(max_length=100)),
+                ("query", models.TextField()),
+                (
+                    "latitude",
+                    models.DecimalField(
+                        blank=True, decimal_places=6, max_digits=9, null=True
+                    ),
+                ),
+                (
+                    "longitude",
+                    models.DecimalField(
+                        blank=True, decimal_places=6, max_digits=9, null=True
+                    ),
+                ),
+                ("created", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("backend", "query"), name="unique_geocode_query"
+                    )
+                ],
+            },
+        ),
+    ]
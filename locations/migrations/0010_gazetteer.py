@@ -0,0 +1,99 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("locations", "0009_geocode_result"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="location",
+            name="precision",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("precise", "Location"),
+                    ("gazetteer", "Gazetteer place"),
+                    ("city", "City"),
+                ],
+                editable=False,
+                help_text="Source of the effective coordinates",
+                max_length=10,
+            ),
+        ),
+        migrations.CreateModel(
+            name="Place",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255)),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("landmark", "Landmark"),
+                            ("parish", "Parish"),
+                            ("sestiere", "Sestiere"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("normalized_name", models.CharField(editable=False, max_length=255)),
+                ("latitude", models.DecimalField(decimal_places=6, max_digits=9)),
+                ("longitude", models.DecimalField(decimal_places=6, max_digits=9)),
+                (
+                    "source",
+                    models.CharField(
+                        blank=True,
+                        help_text="File or reference it was imported from",
+                        max_length=255,
+                    ),
+                ),
+                (
+                    "city",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="locations.city"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "gazetteer place",
+                "ordering": ["name"],
+            },
+        ),
+        migrations.AddField(
+            model_name="location",
+            name="place",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Parish, sestiere or landmark whose centroid is used when the location has no coordinates (set by match_gazetteer)",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="locations.place",
+                verbose_name="Gazetteer place",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="place",
+            index=models.Index(
+                fields=["normalized_name"], name="place_normalized_name_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="place",
+            constraint=models.UniqueConstraint(
+                fields=("city", "kind", "normalized_name"), name="unique_place_in_city"
+            ),
+        ),
+    ]
@@ -1,8 +1,5 @@
-import time
-
 from django.db import models
-from geopy.exc import GeocoderServiceError, GeocoderTimedOut
-from geopy.geocoders import Nominatim
+from django.db.models import F, OuterRef, Q, Subquery
 
 
 class City(models.Model):
@@ -49,6 +46,11 @@ class City(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Locations without coordinates of their own use the city's
+        update_effective_coordinates(self.location_set.all())
+
 
 URBAN_RURAL_CHOICES = [
     ("urban", "Urban"),
@@ -56,6 +58,62 @@ URBAN_RURAL_CHOICES = [
     ("unknown", "Unknown"),
 ]
 
+# Where a location's effective coordinates come from; blank when it has none
+PRECISION_CHOICES = [
+    ("precise", "Location"),
+    ("gazetteer", "Gazetteer place"),
+    ("city", "City"),
+]
+
+# Gazetteer places, from the most specific to the least
+PLACE_KIND_CHOICES = [
+    ("landmark", "Landmark"),
+    ("parish", "Parish"),
+    ("sestiere", "Sestiere"),
+]
+
+
+class Place(models.Model):
+    """Gazetteer entry: a named area or landmark of a city with its centroid,
+    used for locations known only by parish, sestiere or landmark"""
+
+    city = models.ForeignKey(City, on_delete=models.CASCADE)
+    name = models.CharField(max_length=255)
+    kind = models.CharField(max_length=20, choices=PLACE_KIND_CHOICES)
+    normalized_name = models.CharField(max_length=255, editable=False)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    source = models.CharField(
+        max_length=255, blank=True, help_text="File or reference it was imported from"
+    )
+
+    class Meta:
+        verbose_name = "gazetteer place"
+        ordering = ["name"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["city", "kind", "normalized_name"],
+                name="unique_place_in_city",
+            )
+        ]
+        indexes = [
+            # Name lookups by locations.gazetteer
+            models.Index(fields=["normalized_name"], name="place_normalized_name_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.get_kind_display()}, {self.city})"
+
+    def save(self, *args, **kwargs):
+        from locations.gazetteer import normalize_name
+
+        self.normalized_name = normalize_name(self.name)
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "normalized_name"}
+        super().save(*args, **kwargs)
+        # Locations matched to the place use its centroid
+        update_effective_coordinates(self.location_set.all())
+
 
 class Location(models.Model):
     """Model for specific locations within cities"""
@@ -113,6 +171,34 @@ class Location(models.Model):
         help_text="Specific location longitude (falls back to city coordinates if empty)",
     )
 
+    place = models.ForeignKey(
+        Place,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        verbose_name="Gazetteer place",
+        help_text="Parish, sestiere or landmark whose centroid is used when the "
+        "location has no coordinates (set by match_gazetteer)",
+    )
+
+    # What the map uses: the coordinates above or, failing that, the
+    # gazetteer place's or the city's.
+    # Kept in step by save() and City.save(); run update_effective_coordinates
+    # after changing coordinates with queryset update() or bulk_create
+    effective_latitude = models.DecimalField(
+        blank=True, null=True, max_digits=9, decimal_places=6, editable=False
+    )
+    effective_longitude = models.DecimalField(
+        blank=True, null=True, max_digits=9, decimal_places=6, editable=False
+    )
+    precision = models.CharField(
+        max_length=10,
+        choices=PRECISION_CHOICES,
+        blank=True,
+        editable=False,
+        help_text="Source of the effective coordinates",
+    )
+
     urban_rural = models.CharField(
         max_length=10,
         choices=URBAN_RURAL_CHOICES,
@@ -140,6 +226,13 @@ class Location(models.Model):
                 & ~models.Q(description_of_location=""),
             )
         ]
+        indexes = [
+            # Bounding-box filters on the map API
+            models.Index(
+                fields=["effective_latitude", "effective_longitude"],
+                name="location_effective_idx",
+            ),
+        ]
 
     def __str__(self):
         if self.category_of_space or self.description_of_location:
@@ -149,34 +242,118 @@ class Location(models.Model):
             return " ".join(parts)
         return self.name
 
-    @property
-    def effective_latitude(self):
-        """Return specific location latitude or fall back to city latitude"""
-        return self.latitude or (self.city.latitude if self.city else None)
+    def save(self, *args, **kwargs):
+        self.set_effective_coordinates()
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {
+                *kwargs["update_fields"],
+                "effective_latitude",
+                "effective_longitude",
+                "precision",
+            }
+        super().save(*args, **kwargs)
 
-    @property
-    def effective_longitude(self):
-        """Return specific location longitude or fall back to city longitude"""
-        return self.longitude or (self.city.longitude if self.city else None)
+    def set_effective_coordinates(self):
+        """Use the specific coordinates if set, or fall back to the gazetteer
+        place's or the city's"""
+        city = self.city if self.city_id else None
+        place = self.place if self.place_id else None
+        if self.latitude and self.longitude:
+            coordinates = (self.latitude, self.longitude, "precise")
+        elif place:
+            coordinates = (place.latitude, place.longitude, "gazetteer")
+        elif city and city.latitude and city.longitude:
+            coordinates = (city.latitude, city.longitude, "city")
+        else:
+            coordinates = (None, None, "")
+        self.effective_latitude, self.effective_longitude, self.precision = coordinates
 
-    def geocode_address(self):
-        if not self.address or not self.city:
+    def geocode_address(self, geocoder=None):
+        """Set coordinates from the address, through the geocoding cache"""
+        from locations.geocoding import GeocodingError, geocode, location_query
+
+        query = location_query(self)
+        if not query:
+            return
+        try:
+            coordinates = geocode(query, geocoder)
+        except GeocodingError:
             return
+        if coordinates:
+            self.latitude, self.longitude = coordinates
+
+
+def update_effective_coordinates(locations=None):
+    """Recompute the effective coordinates of ``locations`` (default: all)
+    in four UPDATEs; return the number of rows written."""
+    if locations is None:
+        locations = Location.objects.all()
+    own = (
+        Q(latitude__isnull=False, longitude__isnull=False)
+        & ~Q(latitude=0)
+        & ~Q(longitude=0)
+    )
+    city_has = (
+        Q(city__latitude__isnull=False, city__longitude__isnull=False)
+        & ~Q(city__latitude=0)
+        & ~Q(city__longitude=0)
+    )
+    place = Place.objects.filter(pk=OuterRef("place_id"))
+    city = City.objects.filter(pk=OuterRef("city_id"))
+
+    rows = locations.filter(own).update(
+        effective_latitude=F("latitude"),
+        effective_longitude=F("longitude"),
+        precision="precise",
+    )
+    rows += (
+        locations.exclude(own)
+        .filter(place__isnull=False)
+        .update(
+            effective_latitude=Subquery(place.values("latitude")),
+            effective_longitude=Subquery(place.values("longitude")),
+            precision="gazetteer",
+        )
+    )
+    unplaced = locations.exclude(own).filter(place__isnull=True)
+    rows += unplaced.filter(city_has).update(
+        effective_latitude=Subquery(city.values("latitude")),
+        effective_longitude=Subquery(city.values("longitude")),
+        precision="city",
+    )
+    rows += unplaced.exclude(city_has).update(
+        effective_latitude=None, effective_longitude=None, precision=""
+    )
+    return rows
+
 
-        geolocator = Nominatim(user_agent="mapping_violence_chnm")
-        full_address = f"{self.address}, {self.city}"
-
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                location = geolocator.geocode(full_address, timeout=10)
-                if location:
-                    self.latitude = location.latitude
-                    self.longitude = location.longitude
-                    return
-            except GeocoderTimedOut:
-                if attempt < max_retries - 1:
-                    time.sleep(1)  # Wait before retrying
-                    continue
-            except GeocoderServiceError:
-                break  # Don't retry on service errors
+class GeocodeResult(models.Model):
+    """A geocoder's answer for a normalized address query; a miss is stored
+    with empty coordinates so it isn't looked up again"""
+
+    backend = models.CharField(max_length=100)
+    # An address and a city name of up to 255 characters each
+    query = models.TextField()
+    latitude = models.DecimalField(
+        blank=True, null=True, max_digits=9, decimal_places=6
+    )
+    longitude = models.DecimalField(
+        blank=True, null=True, max_digits=9, decimal_places=6
+    )
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["backend", "query"], name="unique_geocode_query"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.query} ({self.backend})"
+
+    @property
+    def coordinates(self):
+        if self.latitude is None or self.longitude is None:
+            return None
+        return (self.latitude, self.longitude)
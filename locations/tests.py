@@ -1,9 +1,18 @@
+import io
+import json
+import os
+import tempfile
 from decimal import Decimal
 
+from django.core.cache import cache
+from django.core.management import call_command
 from django.db import IntegrityError
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-from locations.models import City, Location
+from locations import gazetteer, geocoding
+from locations.models import City, GeocodeResult, Location, Place
+from mapping_violence.models import Crime, Person
 
 
 class CityModelTestCase(TestCase):
@@ -105,6 +114,33 @@ class LocationModelTestCase(TestCase):
         self.assertIsNone(location.effective_latitude)
         self.assertIsNone(location.effective_longitude)
 
+    def test_effective_coordinates_stored(self):
+        """Test that stored coordinates follow the city and can be rebuilt"""
+        general = Location.objects.create(name="General Location", city=self.city)
+        specific = Location.objects.create(
+            name="Specific Location", city=self.city, latitude=44.65, longitude=10.93
+        )
+        self.assertEqual((general.precision, specific.precision), ("city", "precise"))
+
+        self.city.latitude = Decimal("44.7")
+        self.city.save()
+        general.refresh_from_db()
+        specific.refresh_from_db()
+        self.assertEqual(general.effective_latitude, Decimal("44.7"))
+        self.assertEqual(specific.effective_latitude, Decimal("44.65"))
+
+        self.city.latitude = None
+        self.city.save()
+        general.refresh_from_db()
+        self.assertEqual(general.precision, "")
+        self.assertIsNone(general.effective_latitude)
+
+        Location.objects.update(effective_latitude=None, precision="")
+        call_command("update_effective_coordinates", stdout=io.StringIO())
+        specific.refresh_from_db()
+        self.assertEqual(specific.precision, "precise")
+        self.assertEqual(specific.effective_latitude, Decimal("44.65"))
+
     def test_unique_constraint(self):
         """Test unique constraint on city + category + description"""
         # Create first location
@@ -194,3 +230,390 @@ class LocationRelationshipTestCase(TestCase):
         self.assertEqual(city_locations.count(), 2)
         self.assertIn(location1, city_locations)
         self.assertIn(location2, city_locations)
+
+
+class GeocodingTestCase(TestCase):
+    """Test the geocoding cache and the geocode_locations command"""
+
+    def setUp(self):
+        with tempfile.NamedTemporaryFile(
+            "w", suffix=".csv", delete=False, encoding="utf-8"
+        ) as fixture:
+            fixture.write(
+                "query,latitude,longitude\n"
+                '"Campo San Polo,  Venice",45.437500,12.328900\n'
+            )
+        self.addCleanup(os.unlink, fixture.name)
+        settings = override_settings(GEOCODER="fixture", GEOCODER_FIXTURE=fixture.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.city = City.objects.create(
+            name="Venice", latitude=Decimal("45.4408"), longitude=Decimal("12.3155")
+        )
+
+    def test_normalize_query(self):
+        """Test that queries differing only in case and spacing share a key"""
+        self.assertEqual(
+            geocoding.normalize_query("  Campo San  Polo ,Venice, "),
+            "campo san polo, venice",
+        )
+
+    def test_geocode_caches_hits_and_misses(self):
+        """Test that answers, misses included, are stored and reused"""
+        geocoder = geocoding.get_geocoder()
+        self.assertEqual(
+            geocoding.geocode("campo san polo, venice", geocoder),
+            (Decimal("45.437500"), Decimal("12.328900")),
+        )
+        self.assertIsNone(geocoding.geocode("Nowhere, Venice", geocoder))
+        self.assertIsNone(geocoding.geocode(f"{'x' * 255}, {'y' * 255}", geocoder))
+        self.assertEqual(GeocodeResult.objects.count(), 3)
+
+        geocoder.places.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                geocoding.geocode("Campo San Polo, Venice", geocoder),
+                (Decimal("45.437500"), Decimal("12.328900")),
+            )
+
+    def test_geocode_locations_command(self):
+        """Test that the command geocodes each address once and resumes"""
+        polo = [
+            Location.objects.create(
+                name=f"Polo {i}", city=self.city, address="Campo San Polo"
+            )
+            for i in range(2)
+        ]
+        nowhere = Location.objects.create(
+            name="Nowhere", city=self.city, address="Nowhere"
+        )
+        placed = Location.objects.create(
+            name="Placed",
+            city=self.city,
+            address="Campo San Polo",
+            latitude=Decimal("45.1"),
+            longitude=Decimal("12.1"),
+        )
+
+        out = io.StringIO()
+        call_command("geocode_locations", stdout=out)
+        self.assertIn("Geocoded 2 locations", out.getvalue())
+        for location in polo:
+            location.refresh_from_db()
+            self.assertEqual(location.precision, "precise")
+            self.assertEqual(location.effective_latitude, Decimal("45.437500"))
+        nowhere.refresh_from_db()
+        self.assertEqual(nowhere.precision, "city")
+        placed.refresh_from_db()
+        self.assertEqual(placed.latitude, Decimal("45.1"))
+        self.assertEqual(GeocodeResult.objects.count(), 2)
+
+        # The miss is cached, so a second run looks nothing up
+        out = io.StringIO()
+        call_command("geocode_locations", stdout=out)
+        self.assertIn("1 addresses cached, 0 found, 0 not found", out.getvalue())
+
+    def test_geocode_address(self):
+        """Test that Location.geocode_address goes through the cache"""
+        location = Location(name="Polo", city=self.city, address="Campo San Polo")
+        location.geocode_address()
+        self.assertEqual(location.latitude, Decimal("45.437500"))
+        self.assertTrue(GeocodeResult.objects.filter(backend="fixture").exists())
+
+
+class GazetteerTestCase(TestCase):
+    """Test the gazetteer importer and matcher"""
+
+    def setUp(self):
+        self.city = City.objects.create(
+            name="Venice", latitude=Decimal("45.4408"), longitude=Decimal("12.3155")
+        )
+
+    def write(self, suffix, content):
+        with tempfile.NamedTemporaryFile(
+            "w", suffix=suffix, delete=False, encoding="utf-8"
+        ) as f:
+            f.write(content)
+        self.addCleanup(os.unlink, f.name)
+        return f.name
+
+    def test_normalize_name(self):
+        """Test that spellings of saints' names share a key"""
+        self.assertEqual(gazetteer.normalize_name("S. Polo"), "polo")
+        self.assertEqual(gazetteer.normalize_name("San  Polo"), "polo")
+        self.assertEqual(gazetteer.normalize_name("Sant'Apollinare"), "apollinare")
+        self.assertEqual(
+            gazetteer.normalize_name("Santa Maria Formosa"), "maria formosa"
+        )
+        self.assertEqual(gazetteer.normalize_name("Cannaregio"), "cannaregio")
+        self.assertEqual(gazetteer.normalize_name("San"), "san")
+
+    def test_centroid(self):
+        """Test polygon centroids"""
+        square = {
+            "type": "Polygon",
+            "coordinates": [[[12, 45], [12.2, 45], [12.2, 45.2], [12, 45.2], [12, 45]]],
+        }
+        longitude, latitude = gazetteer.centroid(square)
+        self.assertAlmostEqual(longitude, 12.1)
+        self.assertAlmostEqual(latitude, 45.1)
+
+    def test_import_and_match(self):
+        """Test that locations fall back to their most specific place"""
+        geojson = self.write(
+            ".geojson",
+            json.dumps(
+                {
+                    "type": "FeatureCollection",
+                    "features": [
+                        {
+                            "type": "Feature",
+                            "properties": {"name": "San Polo", "kind": "sestiere"},
+                            "geometry": {
+                                "type": "Polygon",
+                                "coordinates": [
+                                    [[12.32, 45.43], [12.34, 45.43], [12.34, 45.45],
+                                     [12.32, 45.45], [12.32, 45.43]]
+                                ],
+                            },
+                        }
+                    ],
+                }
+            ),
+        )  # fmt: skip
+        csv_file = self.write(
+            ".csv",
+            "name,kind,latitude,longitude,city\n"
+            "Chiesa di S. Polo,landmark,45.437700,12.329100,Venice\n"
+            "S. Polo,parish,45.437500,12.328900,\n",
+        )
+        call_command("import_gazetteer", geojson, city="Venice", stdout=io.StringIO())
+        call_command("import_gazetteer", csv_file, city="Venice", stdout=io.StringIO())
+        self.assertEqual(Place.objects.count(), 3)
+        sestiere = Place.objects.get(kind="sestiere")
+        self.assertEqual(sestiere.latitude, Decimal("45.440000"))
+
+        landmark = Location.objects.create(
+            name="Somewhere", city=self.city, landmark="Chiesa di San Polo"
+        )
+        # "San Polo" names both the parish and the sestiere; the parish wins
+        parish = Location.objects.create(
+            name="Elsewhere", city=self.city, sestiere="S. Polo"
+        )
+        precise = Location.objects.create(
+            name="Rialto",
+            city=self.city,
+            sestiere="San Polo",
+            latitude=Decimal("45.438"),
+            longitude=Decimal("12.336"),
+        )
+        unknown = Location.objects.create(name="Nowhere", city=self.city)
+
+        out = io.StringIO()
+        with self.assertNumQueries(9):
+            call_command("match_gazetteer", stdout=out)
+        self.assertIn("Matched 2 of 3 locations", out.getvalue())
+
+        for location in (landmark, parish, precise, unknown):
+            location.refresh_from_db()
+        self.assertEqual(landmark.place.kind, "landmark")
+        self.assertEqual(landmark.precision, "gazetteer")
+        self.assertEqual(landmark.effective_latitude, Decimal("45.437700"))
+        self.assertEqual(parish.place.kind, "parish")
+        self.assertIsNone(precise.place)
+        self.assertEqual(precise.precision, "precise")
+        self.assertEqual(unknown.precision, "city")
+        out = io.StringIO()
+        call_command("update_effective_coordinates", stdout=out)
+        self.assertIn(
+            "1 with their own coordinates, 2 at a gazetteer place's, 1 at their city's",
+            out.getvalue(),
+        )
+
+        # Moving or deleting a place moves its locations
+        place = landmark.place
+        place.latitude = Decimal("45.4")
+        place.save()
+        landmark.refresh_from_db()
+        self.assertEqual(landmark.effective_latitude, Decimal("45.4"))
+        place.delete()
+        landmark.refresh_from_db()
+        self.assertEqual(landmark.precision, "city")
+        self.assertEqual(landmark.effective_latitude, Decimal("45.4408"))
+
+
+class LocationsGeoJSONTestCase(TestCase):
+    """Test cases for the map GeoJSON endpoint"""
+
+    def setUp(self):
+        cache.clear()
+        self.city = City.objects.create(
+            name="Venice", country="Italy", latitude=45.4408, longitude=12.3155
+        )
+        self.precise = Location.objects.create(
+            name="Campo San Polo", city=self.city, latitude=45.4380, longitude=12.3280
+        )
+        self.imprecise = Location.objects.create(name="Somewhere", city=self.city)
+        self.person = Person.objects.create(first_name="Angelo", last_name="Badoer")
+
+        crime = Crime.objects.create(
+            crime="assault", year="1542", address=self.precise, fatality=True
+        )
+        crime.victim.add(self.person)
+        Crime.objects.create(crime="insult", year="1600", address=self.imprecise)
+
+    async def get_features(self, **params):
+        response = await self.async_client.get(reverse("locations_geojson"), params)
+        self.assertEqual(response.status_code, 200)
+        return {f["properties"]["name"]: f for f in response.json()["features"]}
+
+    async def test_features_and_precision(self):
+        """Test that each location with crimes becomes one feature"""
+        features = await self.get_features()
+
+        self.assertEqual(set(features), {"Campo San Polo", "Somewhere"})
+        self.assertEqual(
+            features["Campo San Polo"]["properties"]["precision"], "precise"
+        )
+        self.assertEqual(features["Somewhere"]["properties"]["precision"], "city")
+        self.assertEqual(
+            features["Somewhere"]["geometry"]["coordinates"], [12.3155, 45.4408]
+        )
+
+    def test_queries_per_location(self):
+        """Test that the crimes of all locations come from one query"""
+        for name in ("Rialto", "San Marco", "Castello"):
+            location = Location.objects.create(
+                name=name, city=self.city, latitude=45.43, longitude=12.33
+            )
+            crime = Crime.objects.create(crime="theft", year="1550", address=location)
+        crime.victim.add(
+            Person.objects.create(first_name="Lucia", last_name="Zen", gender="F"),
+            Person.objects.create(first_name="Marco", last_name="Amadi", gender="M"),
+        )
+
+        # Locations, then their crimes with victim and perpetrator genders
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("locations_geojson"))
+        features = {f["properties"]["name"]: f for f in response.json()["features"]}
+        self.assertEqual(len(features), 5)
+
+        # The first victim by name with a recorded gender
+        crimes = features["Castello"]["properties"]["crimes"]
+        self.assertEqual(crimes[0]["victim_gender"], "M")
+        self.assertEqual(crimes[0]["perpetrator_gender"], "U")
+
+    async def test_filters(self):
+        """Test that crime-level filters narrow features and embedded crimes"""
+        features = await self.get_features(fatality="true")
+        self.assertEqual(set(features), {"Campo San Polo"})
+
+        features = await self.get_features(person=str(self.person.pk))
+        self.assertEqual(features["Campo San Polo"]["properties"]["crime_count"], 1)
+
+    async def test_canonical_cache_key(self):
+        """Test that equivalent queries share one cache entry"""
+        url = reverse("locations_geojson")
+        pk = self.person.pk
+        response = await self.async_client.get(
+            url,
+            {
+                "fatality": "on",
+                "clustering": "true",
+                "city": "",
+                "person": f"{pk},{pk}",
+            },
+        )
+        self.assertEqual(
+            response["Link"], f'<{url}?fatality=true&person={pk}>; rel="canonical"'
+        )
+
+        # A matching crime added now is hidden by the cached response
+        crime = await Crime.objects.acreate(
+            crime="theft", year="1550", address=self.precise, fatality=True
+        )
+        await crime.victim.aadd(self.person)
+        features = await self.get_features(
+            person=f" {pk}", fatality="TRUE", color_by="gender"
+        )
+        self.assertEqual(features["Campo San Polo"]["properties"]["crime_count"], 1)
+
+        cache.clear()
+        features = await self.get_features(fatality="true", person=str(pk))
+        self.assertEqual(features["Campo San Polo"]["properties"]["crime_count"], 2)
+
+    async def test_city_rollup(self):
+        """Test that city-level locations are merged into one feature per city"""
+        elsewhere = await Location.objects.acreate(name="Elsewhere", city=self.city)
+        await Crime.objects.acreate(crime="theft", year="1580", address=elsewhere)
+        await Crime.objects.acreate(crime="insult", year="1581", address=elsewhere)
+
+        features = await self.get_features(rollup="city")
+        self.assertEqual(set(features), {"Campo San Polo", "Venice"})
+        venice = features["Venice"]
+        self.assertEqual(venice["geometry"]["coordinates"], [12.3155, 45.4408])
+        self.assertEqual(venice["properties"]["precision"], "city")
+        self.assertEqual(venice["properties"]["crime_count"], 3)
+        self.assertEqual(
+            [
+                (loc["name"], loc["crime_count"])
+                for loc in venice["properties"]["locations"]
+            ],
+            [("Elsewhere", 2), ("Somewhere", 1)],
+        )
+        self.assertEqual(
+            [c["location_name"] for c in venice["properties"]["crimes"]],
+            ["Elsewhere", "Elsewhere", "Somewhere"],
+        )
+
+        features = await self.get_features(rollup="city", crime_type="insult")
+        self.assertEqual(set(features), {"Venice"})
+        self.assertEqual(features["Venice"]["properties"]["location_count"], 2)
+
+    async def test_density(self):
+        """Test that crimes are binned by location, within the filters and box"""
+        url = reverse("locations_density")
+        data = (await self.async_client.get(url, {"size": 4})).json()
+        self.assertEqual(data["total"], 2)
+        self.assertEqual(max(data["rows"], data["cols"]), 4)
+
+        bbox = "12.3,45.43,12.34,45.45"
+        data = (await self.async_client.get(url, {"bbox": bbox, "size": 4})).json()
+        self.assertEqual(data["bbox"], [12.3, 45.43, 12.34, 45.45])
+        self.assertEqual((data["rows"], data["cols"]), (2, 4))
+        # Campo San Polo (12.3280, 45.4380), and Somewhere at the city's
+        # coordinates (12.3155, 45.4408), in 0.01 degree cells
+        self.assertEqual(sorted(data["cells"]), [[0, 2, 1], [1, 1, 1]])
+
+        data = (
+            await self.async_client.get(url, {"bbox": bbox, "fatality": "true"})
+        ).json()
+        self.assertEqual(data["total"], 1)
+
+        response = await self.async_client.get(url, {"bbox": "12.4,45,12.3,46"})
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.get(url, {"size": 10000})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_bbox(self):
+        """Test that bbox keeps locations whose effective coordinates are in view"""
+        features = await self.get_features(bbox="12.32,45.43,12.34,45.44")
+        self.assertEqual(set(features), {"Campo San Polo"})
+
+        # Somewhere is placed at the city's coordinates
+        features = await self.get_features(bbox="12.31,45.44,12.32,45.45")
+        self.assertEqual(set(features), {"Somewhere"})
+
+        features = await self.get_features(
+            bbox="12.31,45.44,12.32,45.45", rollup="city"
+        )
+        self.assertEqual(set(features), {"Venice"})
+
+        features = await self.get_features(bbox="0,0,1,1")
+        self.assertEqual(features, {})
+
+        response = await self.async_client.get(
+            reverse("locations_geojson"), {"bbox": "12,45,13"}
+        )
+        self.assertEqual(response.status_code, 400)
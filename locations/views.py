@@ -1,11 +1,49 @@
-from django.db.models import Count, Q
+from collections import defaultdict
+
+from django.db.models import Count, OuterRef, Q, Subquery
 from django.http import JsonResponse
 from django.shortcuts import render
 from django.views.decorators.cache import cache_page
-from django_ratelimit.decorators import ratelimit
 
-from locations.models import Location
+from locations import density
+from locations.models import City, Location
 from mapping_violence.context_helpers import get_filter_context
+from mapping_violence.decorators import (
+    bbox_param,
+    canonical_query,
+    flag_param,
+    id_list_param,
+    id_param,
+    parse_bbox,
+    ratelimit,
+)
+from mapping_violence.models import Crime, Person
+
+# Parameters read by locations_geojson and how each is normalized for the
+# cache key; anything else the map sends is dropped
+GEOJSON_PARAMS = {
+    "country": None,
+    "city": id_param,
+    "location": id_param,
+    "crime_type": None,
+    "year_from": None,
+    "year_to": None,
+    "weapon_category": None,
+    "weapon_subcategory": None,
+    "urban_rural": None,
+    "person": id_list_param,
+    "fatality": flag_param,
+    "repeat_offender": flag_param,
+    "bbox": bbox_param,
+    "rollup": None,
+}
+
+# The density grid takes the same filters, plus the box and grid size
+DENSITY_PARAMS = {
+    **{name: GEOJSON_PARAMS[name] for name in GEOJSON_PARAMS if name != "rollup"},
+    "bbox": bbox_param,
+    "size": id_param,
+}
 
 
 def map_view(request):
@@ -14,119 +52,211 @@ def map_view(request):
     return render(request, "locations/map.html", context)
 
 
-@ratelimit(key="ip", rate="60/m", method="GET", block=True)
-@cache_page(60 * 5)  # 5-minute cache
-def locations_geojson(request):
-    """Return locations with crimes as GeoJSON for the map"""
-    # Start with locations that have crimes
-    locations = Location.objects.select_related("city").filter(crime__isnull=False)
-
-    # Apply filters from request
-    country = request.GET.get("country")
-    city_id = request.GET.get("city")
-    location_id = request.GET.get("location")
-    crime_type = request.GET.get("crime_type")
-    year_from = request.GET.get("year_from")
-    year_to = request.GET.get("year_to")
-    weapon_category = request.GET.get("weapon_category")
-    weapon_subcategory = request.GET.get("weapon_subcategory")
-    urban_rural = request.GET.get("urban_rural")
-    person = request.GET.get("person")
-    fatality = request.GET.get("fatality")
-
-    if country:
+def filter_locations(locations, params):
+    """Apply the location-level filters in ``params``."""
+    if country := params.get("country"):
         locations = locations.filter(city__country=country)
 
-    if location_id:
+    if location_id := params.get("location"):
         locations = locations.filter(id=location_id)
-    elif city_id:
+    elif city_id := params.get("city"):
         locations = locations.filter(city_id=city_id)
 
-    if crime_type:
-        locations = locations.filter(crime__crime=crime_type)
+    if urban_rural := params.get("urban_rural"):
+        locations = locations.filter(urban_rural=urban_rural)
+
+    return locations
+
+
+def in_bbox(bbox):
+    """Q object for locations whose effective coordinates are in ``bbox``."""
+    west, south, east, north = bbox
+    return Q(
+        effective_latitude__range=(south, north),
+        effective_longitude__range=(west, east),
+    )
+
+
+def crime_conditions(params, prefix=""):
+    """Q object for the crime-level filters in ``params``.
+
+    ``prefix`` is the path from the queried model to Crime, e.g. "crime__"
+    for locations. The conditions go into a single filter() call so they
+    share one join; chained filter() calls each join the crime table again,
+    which multiplies rows for locations with many crimes.
+    """
+    conditions = Q(**{f"{prefix}isnull": False}) if prefix else Q()
+
+    if crime_type := params.get("crime_type"):
+        conditions &= Q(**{f"{prefix}crime": crime_type})
+
+    if year_from := params.get("year_from"):
+        conditions &= Q(**{f"{prefix}year__gte": year_from})
 
-    if year_from:
-        locations = locations.filter(crime__year__gte=year_from)
+    if year_to := params.get("year_to"):
+        conditions &= Q(**{f"{prefix}year__lte": year_to})
 
-    if year_to:
-        locations = locations.filter(crime__year__lte=year_to)
+    if weapon_category := params.get("weapon_category"):
+        conditions &= Q(**{f"{prefix}weapon__weapon_category": weapon_category})
 
-    if weapon_category:
-        locations = locations.filter(crime__weapon__weapon_category=weapon_category)
+    if weapon_subcategory := params.get("weapon_subcategory"):
+        conditions &= Q(**{f"{prefix}weapon__weapon_subcategory": weapon_subcategory})
 
-    if weapon_subcategory:
-        locations = locations.filter(
-            crime__weapon__weapon_subcategory=weapon_subcategory
+    person_ids = [
+        int(p) for p in params.get("person", "").split(",") if p.strip().isdigit()
+    ]
+    if person_ids:
+        conditions &= Q(**{f"{prefix}victim__id__in": person_ids}) | Q(
+            **{f"{prefix}perpetrator__id__in": person_ids}
         )
 
-    if urban_rural:
-        locations = locations.filter(urban_rural=urban_rural)
+    if params.get("fatality", "").lower() in ("true", "1", "on"):
+        conditions &= Q(**{f"{prefix}fatality": True})
+
+    if params.get("repeat_offender", "").lower() in ("true", "1", "on"):
+        conditions &= Q(**{f"{prefix}perpetrator__repeat_offender": True})
+
+    return conditions
+
+
+def with_genders(crimes):
+    """``crimes`` with the gender of their first victim and perpetrator.
+
+    A subquery per role rather than prefetching people: a prefetch lists
+    every crime's id as a parameter, and with all crimes on the map SQLite
+    then scans the person table once per id.
+    """
+    people = Person.objects.exclude(gender="").values("gender")
+    return crimes.annotate(
+        victim_gender=Subquery(people.filter(crime_victim=OuterRef("pk"))[:1]),
+        perpetrator_gender=Subquery(
+            people.filter(crime_perpetrator=OuterRef("pk"))[:1]
+        ),
+    )
+
 
-    if person:
-        person_ids = [int(p) for p in person.split(",") if p.strip().isdigit()]
-        if person_ids:
-            locations = locations.filter(
-                Q(crime__victim__id__in=person_ids)
-                | Q(crime__perpetrator__id__in=person_ids)
-            )
+def crime_properties(crime):
+    """Properties of one crime from with_genders, embedded in a feature."""
+    return {
+        "id": crime.id,
+        "crime": crime.crime,
+        "number": crime.number,
+        "date": str(crime.date) if crime.date else None,
+        "year": crime.year,
+        "fatality": crime.fatality,
+        "victim_gender": crime.victim_gender or "U",
+        "perpetrator_gender": crime.perpetrator_gender or "U",
+    }
 
-    if fatality and fatality.lower() in ("true", "1", "on"):
-        locations = locations.filter(crime__fatality=True)
 
-    # Get unique locations with crime counts
-    locations = locations.annotate(crime_count=Count("crime", distinct=True)).distinct()
+async def city_features(locations, conditions):
+    """One feature per city for the city-level ``locations``.
+
+    Counts come from a single grouped query and the crimes from one more,
+    however many locations each city has.
+    """
+    crimes = Crime.objects.filter(conditions, address__in=locations)
+    counts = [
+        row
+        async for row in crimes.values("address__city", "address", "address__name")
+        .annotate(crimes=Count("pk", distinct=True))
+        .order_by("address__city", "-crimes", "address__name")
+    ]
+    cities = await City.objects.ain_bulk({row["address__city"] for row in counts})
+
+    crimes_by_city = defaultdict(list)
+    async for crime in with_genders(
+        crimes.distinct().select_related("address").order_by("date", "year", "pk")
+    ):
+        city = cities[crime.address.city_id]
+        crimes_by_city[city.pk].append(
+            {
+                **crime_properties(crime),
+                "location_id": crime.address_id,
+                "location_name": crime.address.name,
+                "city": city.name,
+                "precision": "city",
+            }
+        )
+
+    locations_by_city = defaultdict(list)
+    for row in counts:
+        locations_by_city[row["address__city"]].append(
+            {
+                "id": row["address"],
+                "name": row["address__name"],
+                "crime_count": row["crimes"],
+            }
+        )
+
+    return [
+        {
+            "type": "Feature",
+            "geometry": {
+                "type": "Point",
+                "coordinates": [float(city.longitude), float(city.latitude)],
+            },
+            "properties": {
+                "id": city.pk,
+                "name": city.name,
+                "city": city.name,
+                "city_id": city.pk,
+                "country": city.country,
+                "precision": "city",
+                "crime_count": len(crimes_by_city[city.pk]),
+                "location_count": len(locations_by_city[city.pk]),
+                "locations": locations_by_city[city.pk],
+                "crimes": crimes_by_city[city.pk],
+            },
+        }
+        for city in sorted(cities.values(), key=lambda c: c.name)
+    ]
+
+
+@ratelimit(key="ip", rate="60/m", method="GET", block=True)
+@canonical_query(GEOJSON_PARAMS)
+@cache_page(60 * 5)  # 5-minute cache
+async def locations_geojson(request):
+    """Return locations with crimes as GeoJSON for the map.
+
+    ``bbox`` (west,south,east,north) limits the response to locations in
+    view. With ``rollup=city``, locations that only have their city's
+    coordinates are merged into one feature per city, listing its locations
+    and crimes.
+    """
+    try:
+        bbox = parse_bbox(request.GET["bbox"]) if "bbox" in request.GET else None
+    except ValueError:
+        return JsonResponse(
+            {"error": "bbox must be west,south,east,north in degrees"}, status=400
+        )
+
+    locations = filter_locations(Location.objects.select_related("city"), request.GET)
+    if bbox:
+        locations = locations.filter(in_bbox(bbox))
 
     features = []
-    for location in locations:
-        # Skip locations without coordinates
-        if not location.effective_latitude or not location.effective_longitude:
-            continue
-
-        # Get crimes for this location (applying same filters)
-        crimes_query = location.crime_set.all()
-        if crime_type:
-            crimes_query = crimes_query.filter(crime=crime_type)
-        if year_from:
-            crimes_query = crimes_query.filter(year__gte=year_from)
-        if year_to:
-            crimes_query = crimes_query.filter(year__lte=year_to)
-        if weapon_category:
-            crimes_query = crimes_query.filter(weapon__weapon_category=weapon_category)
-        if weapon_subcategory:
-            crimes_query = crimes_query.filter(
-                weapon__weapon_subcategory=weapon_subcategory
-            )
-        if person:
-            person_ids = [int(p) for p in person.split(",") if p.strip().isdigit()]
-            if person_ids:
-                crimes_query = crimes_query.filter(
-                    Q(victim__id__in=person_ids) | Q(perpetrator__id__in=person_ids)
-                ).distinct()
-        if fatality and fatality.lower() in ("true", "1", "on"):
-            crimes_query = crimes_query.filter(fatality=True)
-
-        crimes_data = []
-        for crime in crimes_query.order_by("date", "year").prefetch_related(
-            "victim", "perpetrator"
-        ):
-            victim_genders = [v.gender for v in crime.victim.all() if v.gender]
-            perp_genders = [p.gender for p in crime.perpetrator.all() if p.gender]
-            crimes_data.append(
-                {
-                    "id": crime.id,
-                    "crime": crime.crime,
-                    "number": crime.number,
-                    "date": str(crime.date) if crime.date else None,
-                    "year": crime.year,
-                    "fatality": crime.fatality,
-                    "victim_gender": victim_genders[0] if victim_genders else "U",
-                    "perpetrator_gender": perp_genders[0] if perp_genders else "U",
-                }
-            )
-
-        # Determine coordinate precision
-        has_own_coords = bool(location.latitude and location.longitude)
-        precision = "precise" if has_own_coords else "city"
+    if request.GET.get("rollup") == "city":
+        features += await city_features(
+            locations.filter(precision="city"), crime_conditions(request.GET)
+        )
+        locations = locations.exclude(precision="city")
+
+    # Locations without coordinates can't be placed on the map
+    locations = locations.exclude(precision="")
+
+    # All of their crimes (applying same filters) in one query, not one per
+    # location
+    crimes_by_location = defaultdict(list)
+    crimes = Crime.objects.filter(crime_conditions(request.GET), address__in=locations)
+    async for crime in with_genders(crimes.distinct().order_by("date", "year")):
+        crimes_by_location[crime.address_id].append(crime_properties(crime))
+
+    location_features = []
+    async for location in locations.filter(
+        crime_conditions(request.GET, prefix="crime__")
+    ).distinct():
+        crimes_data = crimes_by_location[location.pk]
 
         feature = {
             "type": "Feature",
@@ -149,13 +279,49 @@ def locations_geojson(request):
                 "street": location.street or "",
                 "landmark": location.landmark or "",
                 "urban_rural": location.urban_rural or "unknown",
-                "precision": precision,
+                "precision": location.precision,
                 "crime_count": len(crimes_data),
                 "crimes": crimes_data,
             },
         }
-        features.append(feature)
+        location_features.append(feature)
 
-    geojson = {"type": "FeatureCollection", "features": features}
+    geojson = {"type": "FeatureCollection", "features": location_features + features}
 
     return JsonResponse(geojson)
+
+
+@ratelimit(key="ip", rate="60/m", method="GET", block=True)
+@canonical_query(DENSITY_PARAMS)
+@cache_page(60 * 5)  # 5-minute cache
+async def locations_density(request):
+    """Return crime density on a grid for the map's heatmap.
+
+    Takes the filters of locations_geojson, plus ``bbox`` (west,south,
+    east,north; default: the extent of the data) and ``size`` (cells along
+    the longer side of the box).
+    """
+    try:
+        bbox = parse_bbox(request.GET["bbox"]) if "bbox" in request.GET else None
+    except ValueError:
+        return JsonResponse(
+            {"error": "bbox must be west,south,east,north in degrees"}, status=400
+        )
+    size = request.GET.get("size", str(density.DEFAULT_SIZE))
+    if not size.isdigit() or not 1 <= int(size) <= density.MAX_SIZE:
+        return JsonResponse(
+            {"error": f"size must be between 1 and {density.MAX_SIZE}"}, status=400
+        )
+
+    locations = filter_locations(Location.objects.all(), request.GET)
+    if bbox:
+        locations = locations.filter(in_bbox(bbox))
+    locations = (
+        locations.exclude(precision="")
+        .filter(crime_conditions(request.GET, prefix="crime__"))
+        .values_list("effective_longitude", "effective_latitude")
+        .annotate(crimes=Count("crime", distinct=True))
+        .order_by()
+    )
+    points = [point async for point in locations]
+    return JsonResponse(density.grid(points, bbox, int(size)))
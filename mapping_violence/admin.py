@@ -14,7 +14,8 @@ from unfold.admin import ModelAdmin, StackedInline, TabularInline
 from unfold.contrib.import_export.forms import ExportForm, ImportForm
 from unfold.forms import AdminPasswordChangeForm, UserChangeForm, UserCreationForm
 
-from locations.models import City, Location
+from locations.models import City, Location, Place
+from mapping_violence import merging
 from mapping_violence.forms import CrimeForm, PersonForm
 from mapping_violence.models import (
     STATUS_CHOICES,
@@ -48,6 +49,67 @@ class GroupAdmin(BaseGroupAdmin, ModelAdmin):
     pass
 
 
+class MergeMixin:
+    """Admin action merging the selected records into one of them with
+    mapping_violence.merging, after an optional preview"""
+
+    def has_merge_permission(self, request):
+        # Merging rewrites the kept record's relations and deletes the
+        # others; action permissions pass if any one is held, so need both
+        return self.has_change_permission(request) and self.has_delete_permission(
+            request
+        )
+
+    @admin.action(description="Merge selected records into one", permissions=["merge"])
+    def merge_selected(self, request, queryset):
+        opts = self.model._meta
+        if queryset.count() < 2:
+            self.message_user(
+                request, f"Select at least two {opts.verbose_name_plural} to merge."
+            )
+            return None
+
+        class MergeForm(forms.Form):
+            primary = forms.ModelChoiceField(
+                queryset=queryset,
+                label=f"Keep this {opts.verbose_name}",
+                empty_label=None,
+                widget=forms.RadioSelect,
+            )
+
+        report = None
+        if "apply" in request.POST or "preview" in request.POST:
+            form = MergeForm(request.POST)
+            if form.is_valid():
+                primary = form.cleaned_data["primary"]
+                duplicates = list(queryset.exclude(pk=primary.pk))
+                report = merging.merge(
+                    primary, duplicates, dry_run="apply" not in request.POST
+                )
+                if "apply" in request.POST:
+                    self.message_user(
+                        request,
+                        f"Merged {report['deleted']} {opts.verbose_name_plural} "
+                        f'into "{primary}". ' + "; ".join(merging.describe(report)),
+                    )
+                    return None
+        else:
+            form = MergeForm()
+
+        return render(
+            request,
+            "admin/merge.html",
+            {
+                "title": f"Merge {opts.verbose_name_plural}",
+                "form": form,
+                "queryset": queryset,
+                "opts": opts,
+                "action": "merge_selected",
+                "changes": merging.describe(report) if report else None,
+            },
+        )
+
+
 class PersonRelationTypeChoiceIterator(ModelChoiceIterator):
     """Override ModelChoiceIterator in order to group Person-Person
     relationship types by category"""
@@ -186,13 +248,13 @@ class EventAdmin(ModelAdmin):
 
 
 @admin.register(City)
-class CityAdmin(ModelAdmin):
+class CityAdmin(MergeMixin, ModelAdmin):
     """Admin for City entities"""
 
     list_display = ("name", "country", "region", "parish", "latitude", "longitude")
     list_filter = ("country", "region", "parish")
     search_fields = ("name", "country", "region", "parish")
-    actions = ["assign_country"]
+    actions = ["assign_country", "merge_selected"]
 
     fieldsets = (
         ("Basic Information", {"fields": ("name", "country", "region", "parish")}),
@@ -249,9 +311,10 @@ class CityAdmin(ModelAdmin):
 
 
 @admin.register(Location)
-class LocationAdmin(ModelAdmin):
+class LocationAdmin(MergeMixin, ModelAdmin):
     """Admin for Location entities"""
 
+    actions = ["merge_selected"]
     list_display = (
         "name",
         "city",
@@ -263,8 +326,10 @@ class LocationAdmin(ModelAdmin):
         "city",
         "category_of_space",
         "urban_rural",
+        "precision",
         "city__parish",
     )
+    autocomplete_fields = ("place",)
     search_fields = (
         "name",
         "current_name",
@@ -288,7 +353,7 @@ class LocationAdmin(ModelAdmin):
         ),
         (
             "Specific Coordinates",
-            {"fields": ("latitude", "longitude"), "classes": ("collapse",)},
+            {"fields": ("latitude", "longitude", "place"), "classes": ("collapse",)},
         ),
         (
             "Miscellaneous Fields",
@@ -311,6 +376,15 @@ class LocationAdmin(ModelAdmin):
     get_coordinates.short_description = "Coordinates"
 
 
+@admin.register(Place)
+class PlaceAdmin(ModelAdmin):
+    """Admin for gazetteer places"""
+
+    list_display = ("name", "kind", "city", "latitude", "longitude", "source")
+    list_filter = ("kind", "city", "source")
+    search_fields = ("name", "normalized_name", "city__name")
+
+
 @admin.register(Crime)
 class CrimeAdmin(ImportExportModelAdmin, ModelAdmin):
     """Admin for Crime entities with import/export functionality"""
@@ -694,11 +768,12 @@ class StatusLogAdmin(ModelAdmin):
 
 
 @admin.register(Person)
-class PersonAdmin(ModelAdmin):
+class PersonAdmin(MergeMixin, ModelAdmin):
     """Admin for Person entities"""
 
+    actions = ["merge_selected"]
     list_display = ("__str__", "honorific", "gender", "citizenship", "occupation")
-    list_filter = ("gender", "citizenship", "occupation")
+    list_filter = ("gender", "repeat_offender", "citizenship", "occupation")
     search_fields = (
         "first_name",
         "last_name",
@@ -748,13 +823,13 @@ class PersonAdmin(ModelAdmin):
 
 
 @admin.register(Weapon)
-class WeaponAdmin(ModelAdmin):
+class WeaponAdmin(MergeMixin, ModelAdmin):
     """Admin for Weapon entities"""
 
     list_display = ("__str__", "weapon_category", "weapon_subcategory", "crime_count")
     list_filter = ("weapon_category",)
     search_fields = ("name", "weapon_subcategory")
-    actions = ["merge_weapons"]
+    actions = ["merge_selected"]
     fieldsets = (
         ("Basic Information", {"fields": ("name", "definition")}),
         (
@@ -772,55 +847,3 @@ class WeaponAdmin(ModelAdmin):
 
     crime_count.short_description = "Cases"
     crime_count.admin_order_field = "_crime_count"
-
-    @admin.action(description="Merge selected weapons into one")
-    def merge_weapons(self, request, queryset):
-        if queryset.count() < 2:
-            self.message_user(request, "Select at least two weapons to merge.")
-            return None
-
-        class MergeForm(forms.Form):
-            primary = forms.ModelChoiceField(
-                queryset=queryset,
-                label="Keep this weapon",
-                empty_label=None,
-                widget=forms.RadioSelect,
-            )
-
-        if "apply" in request.POST:
-            form = MergeForm(request.POST)
-            form.fields["primary"].queryset = queryset
-            if form.is_valid():
-                primary = form.cleaned_data["primary"]
-                duplicates = queryset.exclude(pk=primary.pk)
-
-                # Transfer all crime associations from duplicates to primary
-                merged_count = 0
-                for dup in duplicates:
-                    for crime in dup.crime_set.all():
-                        crime.weapon.add(primary)
-                        crime.weapon.remove(dup)
-                        merged_count += 1
-                    dup.delete()
-
-                dup_count = len(duplicates)
-                self.message_user(
-                    request,
-                    f'Merged {dup_count} weapon(s) into "{primary.name}". '
-                    f"{merged_count} crime association(s) transferred.",
-                )
-                return None
-        else:
-            form = MergeForm()
-
-        return render(
-            request,
-            "admin/merge_weapons.html",
-            {
-                "title": "Merge weapons",
-                "form": form,
-                "queryset": queryset,
-                "opts": self.model._meta,
-                "action": "merge_weapons",
-            },
-        )
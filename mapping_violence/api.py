@@ -1,12 +1,17 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.db.models import Q
 from django.http import JsonResponse
-from django_ratelimit.decorators import ratelimit
 
+from . import timeline
+from .decorators import ratelimit
 from .models import Person
+from .network import neighborhood
+from .summaries import profile
 
 
 @ratelimit(key="ip", rate="60/m", method="GET", block=True)
-def person_search(request):
+async def person_search(request):
     """AJAX endpoint for person autocomplete.
 
     GET params:
@@ -32,5 +37,62 @@ def person_search(request):
 
     persons = persons.distinct()[:25]
 
-    results = [{"value": str(p.id), "text": str(p)} for p in persons]
+    results = [{"value": str(p.id), "text": str(p)} async for p in persons]
     return JsonResponse(results, safe=False)
+
+
+@ratelimit(key="ip", rate="60/m", method="GET", block=True)
+async def person_profile(request, person_id):
+    """Summary statistics for a person, as shown on their profile page."""
+    person = await Person.objects.filter(pk=person_id).afirst()
+    if person is None:
+        return JsonResponse({"error": "Person not found"}, status=404)
+    return JsonResponse(await sync_to_async(profile)(person))
+
+
+@ratelimit(key="ip", rate="60/m", method="GET", block=True)
+async def person_network(request, person_id):
+    """Network of people linked to a person through crimes and relations.
+
+    GET params:
+        depth: hops to walk from the person, 1 to PERSON_NETWORK_MAX_DEPTH
+            (default 1)
+    """
+    max_depth = settings.PERSON_NETWORK_MAX_DEPTH
+    try:
+        depth = int(request.GET.get("depth", 1))
+    except ValueError:
+        depth = 0
+    if not 1 <= depth <= max_depth:
+        return JsonResponse(
+            {"error": f"depth must be between 1 and {max_depth}"}, status=400
+        )
+    if not await Person.objects.filter(pk=person_id).aexists():
+        return JsonResponse({"error": "Person not found"}, status=404)
+
+    nodes, edges, truncated = await sync_to_async(neighborhood)(person_id, depth)
+    return JsonResponse(
+        {
+            "person": person_id,
+            "depth": depth,
+            "truncated": truncated,
+            "nodes": nodes,
+            "edges": edges,
+        }
+    )
+
+
+@ratelimit(key="ip", rate="60/m", method="GET", block=True)
+async def crime_timeline(request):
+    """Crime counts per location, period and crime type for the time slider.
+
+    GET params:
+        bucket: "year" (default) or "decade"
+    """
+    bucket = request.GET.get("bucket", "year")
+    if bucket not in timeline.BUCKETS:
+        return JsonResponse(
+            {"error": f"bucket must be one of: {', '.join(timeline.BUCKETS)}"},
+            status=400,
+        )
+    return JsonResponse(await sync_to_async(timeline.cube)(bucket))
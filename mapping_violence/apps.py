@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
 
 
 class AppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "mapping_violence"
+
+    def ready(self):
+        from mapping_violence import signals  # noqa: F401
+
+        if settings.SLOW_QUERY_MS > 0:
+            from mapping_violence.slow_queries import install
+
+            connection_created.connect(install, dispatch_uid="slow_queries")
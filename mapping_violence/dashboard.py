@@ -1,5 +1,9 @@
+from django.conf import settings
+from django.contrib import admin
 from django.db.models import Count
+from django.shortcuts import redirect, render
 
+from mapping_violence import profiling
 from mapping_violence.models import Crime
 
 
@@ -34,3 +38,22 @@ def dashboard_callback(request, context):
         }
     )
     return context
+
+
+def performance_dashboard(request):
+    """Staff page listing the slowest endpoints and worst repeated queries."""
+    if request.method == "POST":
+        profiling.clear_samples()
+        return redirect("performance_dashboard")
+
+    sampled = profiling.samples()
+    context = {
+        **admin.site.each_context(request),
+        "title": "Performance",
+        "sample_count": len(sampled),
+        "sample_rate": settings.PROFILING_SAMPLE_RATE,
+        "buffer_size": settings.PROFILING_BUFFER_SIZE,
+        "endpoints": profiling.summarize_endpoints(sampled),
+        "duplicates": profiling.summarize_duplicates(sampled),
+    }
+    return render(request, "admin/performance.html", context)
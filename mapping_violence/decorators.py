@@ -0,0 +1,145 @@
+"""View decorators shared by the public data and API views."""
+
+import math
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import QueryDict
+from django.utils.http import urlencode
+from django.utils.module_loading import import_string
+from django_ratelimit import ALL
+from django_ratelimit.core import is_ratelimited
+from django_ratelimit.decorators import ratelimit as sync_ratelimit
+from django_ratelimit.exceptions import Ratelimited
+
+
+def ratelimit(group=None, key=None, rate=None, method=ALL, block=True):
+    """``django_ratelimit.decorators.ratelimit`` that also accepts async views.
+
+    django-ratelimit only wraps sync views; for coroutine views the cache
+    lookup runs in a worker thread and the view itself stays async.
+    """
+
+    def decorator(fn):
+        if not iscoroutinefunction(fn):
+            return sync_ratelimit(group, key, rate, method, block)(fn)
+
+        @wraps(fn)
+        async def _wrapped(request, *args, **kw):
+            old_limited = getattr(request, "limited", False)
+            ratelimited = await sync_to_async(is_ratelimited)(
+                request=request,
+                group=group,
+                fn=fn,
+                key=key,
+                rate=rate,
+                method=method,
+                increment=True,
+            )
+            request.limited = ratelimited or old_limited
+            if ratelimited and block:
+                cls = getattr(settings, "RATELIMIT_EXCEPTION_CLASS", Ratelimited)
+                raise (import_string(cls) if isinstance(cls, str) else cls)()
+            return await fn(request, *args, **kw)
+
+        return _wrapped
+
+    return decorator
+
+
+def flag_param(value):
+    """Canonical form of a boolean filter: "true", or None when off."""
+    return "true" if value.lower() in ("true", "1", "on") else None
+
+
+def id_param(value):
+    """Canonical form of an integer id ("007" and "7" are the same)."""
+    return str(int(value)) if value.isdigit() else value
+
+
+def id_list_param(value):
+    """Sorted, de-duplicated comma-separated ids; other items are dropped."""
+    ids = sorted({int(p) for p in value.split(",") if p.strip().isdigit()})
+    return ",".join(map(str, ids)) or None
+
+
+def parse_bbox(value):
+    """Parse "west,south,east,north" in degrees; raise ValueError if invalid."""
+    west, south, east, north = (float(v) for v in value.split(","))
+    if not (-180 <= west < east <= 180 and -90 <= south < north <= 90):
+        raise ValueError(f"Invalid bounding box: {value}")
+    return west, south, east, north
+
+
+def bbox_param(value):
+    """Canonical bounding box, widened to 4 decimals (about 10 m) so that
+    nearby viewports share a cache entry. Invalid boxes are left for the
+    view to reject."""
+    try:
+        west, south, east, north = parse_bbox(value)
+    except ValueError:
+        return value
+    corners = (
+        math.floor(west * 1e4),
+        math.floor(south * 1e4),
+        math.ceil(east * 1e4),
+        math.ceil(north * 1e4),
+    )
+    return ",".join(f"{c / 1e4:.4f}" for c in corners)
+
+
+def canonical_query_string(query, params):
+    """Encode the parameters of ``query`` named in ``params`` canonically.
+
+    ``params`` maps each parameter a view reads to a function returning its
+    canonical value, or None to drop it. Other parameters and blank values
+    are dropped, the last of repeated values wins (as with
+    ``QueryDict.get``) and keys are sorted.
+    """
+    canonical = {}
+    for name, normalize in params.items():
+        value = query.get(name, "").strip()
+        if value and normalize is not None:
+            value = normalize(value)
+        if value:
+            canonical[name] = value
+    return urlencode(sorted(canonical.items()))
+
+
+def canonical_query(params):
+    """Rewrite the query string to its canonical form before the view runs.
+
+    Place it above ``cache_page`` so that one logical query is cached once,
+    whatever the parameter order, blank values or UI-only parameters (such
+    as ``clustering``) a client sends. The canonical URL is returned in a
+    ``Link: <...>; rel="canonical"`` header for clients to reuse.
+    """
+
+    def canonicalize(request):
+        query_string = canonical_query_string(request.GET, params)
+        request.META["QUERY_STRING"] = query_string
+        request.GET = QueryDict(query_string)
+
+    def link(request, response):
+        response["Link"] = f'<{request.get_full_path()}>; rel="canonical"'
+        return response
+
+    def decorator(fn):
+        if iscoroutinefunction(fn):
+
+            @wraps(fn)
+            async def _wrapped(request, *args, **kw):
+                canonicalize(request)
+                return link(request, await fn(request, *args, **kw))
+
+        else:
+
+            @wraps(fn)
+            def _wrapped(request, *args, **kw):
+                canonicalize(request)
+                return link(request, fn(request, *args, **kw))
+
+        return _wrapped
+
+    return decorator
@@ -0,0 +1,361 @@
+"""Bulk export of crime records in CSV, JSON Lines, GeoJSON and Parquet.
+
+Every format is generated from the same ``CrimeFilter``-filtered queryset and
+streamed in chunks, so the public download endpoint and the ``export_crimes``
+management command produce identical files.
+"""
+
+import csv
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, HttpResponseRedirect
+
+from mapping_violence.filters import CrimeFilter
+from mapping_violence.models import Crime
+
+CHUNK_SIZE = 500
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    "geojson": ("application/geo+json", "geojson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def get_export_queryset(params):
+    """Return crimes filtered by ``CrimeFilter`` with the joins every format needs."""
+    crimes = (
+        Crime.objects.select_related("address", "address__city", "connected_event")
+        .prefetch_related("victim", "perpetrator", "weapon")
+        .order_by("-date", "-year")
+    )
+    return CrimeFilter(params, queryset=crimes).qs
+
+
+def export_filename(fmt):
+    return f"mapping_violence_data.{EXPORT_FORMATS[fmt][1]}"
+
+
+# ── CSV ─────────────────────────────────────────────────────────────────────
+
+CSV_COLUMNS = [
+    ("Case Number", lambda c: c.number),
+    ("Crime", lambda c: c.crime),
+    ("Date", lambda c: str(c.date) if c.date else ""),
+    ("Year", lambda c: c.year),
+    ("Month", lambda c: c.month),
+    ("Day", lambda c: c.day),
+    ("City", lambda c: c.address.city.name if c.address and c.address.city else ""),
+    ("Location", lambda c: c.address.name if c.address else ""),
+    ("Victim(s)", lambda c: "; ".join(str(v) for v in c.victim.all())),
+    (
+        "Victim Gender",
+        lambda c: "; ".join(v.gender for v in c.victim.all() if v.gender),
+    ),
+    ("Perpetrator(s)", lambda c: "; ".join(str(p) for p in c.perpetrator.all())),
+    (
+        "Perpetrator Gender",
+        lambda c: "; ".join(p.gender for p in c.perpetrator.all() if p.gender),
+    ),
+    ("Weapon", lambda c: "; ".join(str(w) for w in c.weapon.all())),
+    ("Motive", lambda c: c.motive),
+    ("Fatality", lambda c: "Y" if c.fatality else "N"),
+    (
+        "Convicted",
+        lambda c: "Y" if c.convicted else "N" if c.convicted is False else "",
+    ),
+    ("Sentence", lambda c: c.sentence),
+    ("Description", lambda c: c.description_of_case),
+    (
+        "Connected Event",
+        lambda c: str(c.connected_event) if c.connected_event else "",
+    ),
+    ("Archival Location", lambda c: c.archival_location),
+    ("Reference", lambda c: c.reference),
+]
+
+
+class Echo:
+    """Pseudo-buffer for StreamingHttpResponse with csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(queryset):
+    writer = csv.writer(Echo())
+    yield writer.writerow([col[0] for col in CSV_COLUMNS])
+    for crime in queryset.iterator(chunk_size=CHUNK_SIZE):
+        yield writer.writerow([col[1](crime) for col in CSV_COLUMNS])
+
+
+async def aiter_csv(queryset):
+    """Async counterpart of ``iter_csv`` for ASGI streaming responses."""
+    writer = csv.writer(Echo())
+    yield writer.writerow([col[0] for col in CSV_COLUMNS])
+    async for crime in queryset.aiterator(chunk_size=CHUNK_SIZE):
+        yield writer.writerow([col[1](crime) for col in CSV_COLUMNS])
+
+
+# ── Typed records (JSON Lines, GeoJSON, Parquet) ────────────────────────────
+
+
+def _int_or_none(value):
+    value = (value or "").strip()
+    return int(value) if value.isdigit() else None
+
+
+def _float_or_none(value):
+    return float(value) if value is not None else None
+
+
+def _names(people):
+    return [str(p) for p in people]
+
+
+def _genders(people):
+    return [p.gender for p in people if p.gender]
+
+
+# (field name, Parquet type, accessor). Parquet types are resolved lazily so
+# pyarrow is only imported when a Parquet export is actually requested.
+RECORD_FIELDS = [
+    ("id", "int64", lambda c: c.pk),
+    ("number", "string", lambda c: c.number),
+    ("crime", "string", lambda c: c.crime),
+    ("offense_category", "string", lambda c: c.offense_category),
+    ("date", "date32", lambda c: c.date),
+    ("year", "int32", lambda c: _int_or_none(c.year)),
+    ("month", "int32", lambda c: _int_or_none(c.month)),
+    ("day", "int32", lambda c: _int_or_none(c.day)),
+    ("country", "string", lambda c: c.address.city.country if c.address else None),
+    ("city_id", "int64", lambda c: c.address.city_id if c.address else None),
+    ("city", "string", lambda c: c.address.city.name if c.address else None),
+    ("location_id", "int64", lambda c: c.address_id),
+    ("location", "string", lambda c: c.address.name if c.address else None),
+    ("urban_rural", "string", lambda c: c.address.urban_rural if c.address else None),
+    (
+        "latitude",
+        "float64",
+        lambda c: _float_or_none(c.address.effective_latitude) if c.address else None,
+    ),
+    (
+        "longitude",
+        "float64",
+        lambda c: _float_or_none(c.address.effective_longitude) if c.address else None,
+    ),
+    (
+        "precision",
+        "string",
+        lambda c: (c.address.precision or None) if c.address else None,
+    ),
+    ("victims", "list<string>", lambda c: _names(c.victim.all())),
+    ("victim_genders", "list<string>", lambda c: _genders(c.victim.all())),
+    ("perpetrators", "list<string>", lambda c: _names(c.perpetrator.all())),
+    ("perpetrator_genders", "list<string>", lambda c: _genders(c.perpetrator.all())),
+    ("weapons", "list<string>", lambda c: _names(c.weapon.all())),
+    ("motive", "string", lambda c: c.motive),
+    ("fatality", "bool", lambda c: c.fatality),
+    ("convicted", "bool", lambda c: c.convicted),
+    ("sentence", "string", lambda c: c.sentence),
+    ("description", "string", lambda c: c.description_of_case),
+    (
+        "connected_event",
+        "string",
+        lambda c: str(c.connected_event) if c.connected_event else None,
+    ),
+    ("archival_location", "string", lambda c: c.archival_location),
+    ("reference", "string", lambda c: c.reference),
+]
+
+
+def crime_record(crime):
+    """Return a dict of typed values for one crime, keyed by field name."""
+    return {name: accessor(crime) for name, _, accessor in RECORD_FIELDS}
+
+
+def _dumps(obj):
+    return json.dumps(obj, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def iter_jsonl(queryset):
+    for crime in queryset.iterator(chunk_size=CHUNK_SIZE):
+        yield _dumps(crime_record(crime)) + "\n"
+
+
+def iter_geojson(queryset):
+    """Yield a GeoJSON FeatureCollection with one Point feature per crime.
+
+    Crimes without an effective coordinate are kept with a ``null`` geometry,
+    which RFC 7946 permits for unlocated features.
+    """
+    yield '{"type": "FeatureCollection", "features": [\n'
+    separator = ""
+    for crime in queryset.iterator(chunk_size=CHUNK_SIZE):
+        properties = crime_record(crime)
+        lat = properties["latitude"]
+        lon = properties["longitude"]
+        geometry = (
+            {"type": "Point", "coordinates": [lon, lat]}
+            if lat is not None and lon is not None
+            else None
+        )
+        feature = {"type": "Feature", "geometry": geometry, "properties": properties}
+        yield separator + _dumps(feature)
+        separator = ",\n"
+    yield "\n]}\n"
+
+
+# ── Parquet ─────────────────────────────────────────────────────────────────
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _parquet_schema():
+    import pyarrow as pa
+
+    types = {
+        "int32": pa.int32(),
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+        "bool": pa.bool_(),
+        "date32": pa.date32(),
+        "string": pa.string(),
+        "list<string>": pa.list_(pa.string()),
+    }
+    return pa.schema([(name, types[kind]) for name, kind, _ in RECORD_FIELDS])
+
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever pyarrow has written."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_parquet(queryset):
+    """Yield a Parquet file as bytes, one row group per ``CHUNK_SIZE`` crimes."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+
+    def flush(batch):
+        table = pa.Table.from_pylist(batch, schema=schema)
+        writer.write_table(table, row_group_size=CHUNK_SIZE)
+        return sink.drain()
+
+    batch = []
+    for crime in queryset.iterator(chunk_size=CHUNK_SIZE):
+        batch.append(crime_record(crime))
+        if len(batch) >= CHUNK_SIZE:
+            yield flush(batch)
+            batch = []
+    if batch:
+        yield flush(batch)
+    writer.close()
+    yield sink.drain()
+
+
+def iter_export(fmt, queryset):
+    """Return the chunk iterator for ``fmt`` (one of ``EXPORT_FORMATS``)."""
+    return {
+        "csv": iter_csv,
+        "jsonl": iter_jsonl,
+        "geojson": iter_geojson,
+        "parquet": iter_parquet,
+    }[fmt](queryset)
+
+
+# ── Pre-built artifacts ─────────────────────────────────────────────────────
+
+ARTIFACT_MANIFEST = "manifest.json"
+ARTIFACT_CACHE_KEY = "export_artifacts_manifest"
+
+
+def artifact_path(name):
+    return f"{settings.EXPORT_ARTIFACTS_DIR.rstrip('/')}/{name}"
+
+
+def load_artifact_manifest(refresh=False):
+    """Return the manifest written by ``build_export_artifacts``, or None.
+
+    The manifest is cached for five minutes so unfiltered downloads don't
+    touch storage on every request. A worker may keep serving the previous
+    build for that long, which is why the build command keeps its files.
+    ``refresh`` reads it from storage regardless.
+    """
+    manifest = None if refresh else cache.get(ARTIFACT_CACHE_KEY)
+    if manifest is None:
+        path = artifact_path(ARTIFACT_MANIFEST)
+        manifest = {}
+        if default_storage.exists(path):
+            with default_storage.open(path) as fh:
+                manifest = json.load(fh)
+        cache.set(ARTIFACT_CACHE_KEY, manifest, 60 * 5)
+    return manifest or None
+
+
+def artifact_response(fmt):
+    """Return a response serving the pre-built full export for ``fmt``, if any.
+
+    Object storage serves the file itself, so the response redirects to it;
+    media files are only served by Django in DEBUG, so without object
+    storage the file is streamed from default storage.
+    """
+    manifest = load_artifact_manifest()
+    if not manifest or fmt not in manifest.get("files", {}):
+        return None
+    path = artifact_path(manifest["files"][fmt]["path"])
+    if settings.OBJ_STORAGE:
+        return HttpResponseRedirect(default_storage.url(path))
+    try:
+        fh = default_storage.open(path)
+    except FileNotFoundError:
+        return None
+    return FileResponse(
+        fh,
+        as_attachment=True,
+        filename=export_filename(fmt),
+        content_type=EXPORT_FORMATS[fmt][0],
+    )
+
+
+def is_unfiltered(params):
+    """True when ``params`` sets no ``CrimeFilter`` field to a non-empty value."""
+    return not any(params.get(name) for name in CrimeFilter.base_filters)
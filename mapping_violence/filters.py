@@ -60,6 +60,11 @@ class CrimeFilter(django_filters.FilterSet):
 
     fatality = django_filters.BooleanFilter(label="Fatal Only")
 
+    repeat_offender = django_filters.BooleanFilter(
+        label="Repeat Offenders Only",
+        method="filter_repeat_offender",
+    )
+
     weapon_category = django_filters.ChoiceFilter(
         choices=WEAPON_CATEGORY_CHOICES,
         field_name="weapon__weapon_category",
@@ -119,6 +124,12 @@ class CrimeFilter(django_filters.FilterSet):
             Q(victim__in=matching_people) | Q(perpetrator__in=matching_people)
         ).distinct()
 
+    def filter_repeat_offender(self, queryset, name, value):
+        """Filter crimes with a repeat offender among the perpetrators."""
+        if value:
+            return queryset.filter(perpetrator__repeat_offender=True).distinct()
+        return queryset
+
     def filter_year_from(self, queryset, name, value):
         if value:
             return queryset.filter(year__gte=str(value))
@@ -141,6 +152,7 @@ class CrimeFilter(django_filters.FilterSet):
             "year_from",
             "year_to",
             "fatality",
+            "repeat_offender",
             "weapon_category",
             "weapon_subcategory",
             "urban_rural",
@@ -0,0 +1,111 @@
+"""
+Measure per-request latency of person_search with and without a connection pool.
+
+Usage:
+    uv run --extra pool manage.py benchmark_connections
+    uv run --extra pool manage.py benchmark_connections --requests 500 --query ba
+
+Sends the same search through the ASGI handler, as the Uvicorn workers do
+(middleware, request_started/request_finished signals, a new thread per
+request for the ORM), twice: once opening a new database connection per
+request, and once with Django's psycopg 3 pool (DB_POOL). Persistent
+connections (CONN_MAX_AGE) are not measured: under ASGI they are kept per
+thread and are not reused.
+"""
+
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, override_settings
+from django.urls import reverse
+
+
+class Command(BaseCommand):
+    help = "Benchmark person_search latency with and without a connection pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=200,
+            help="Requests per run (default: 200)",
+        )
+        parser.add_argument(
+            "--query",
+            default="an",
+            help="Search term sent to person_search (default: an)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            import psycopg_pool  # noqa: F401
+        except ImportError as err:
+            raise CommandError(
+                "Connection pooling needs the pool extra (uv sync --extra pool)"
+            ) from err
+
+        url = reverse("person_search")
+        params = {"q": options["query"]}
+        client = AsyncClient(HTTP_HOST="localhost")
+
+        # Every thread's connection is built from this settings dict
+        settings_dict = connection.settings_dict
+        configured = (settings_dict["CONN_MAX_AGE"], settings_dict["OPTIONS"])
+        pool = settings_dict["OPTIONS"].get("pool") or True
+        runs = [
+            ("new connection per request", {}),
+            ("connection pool", {"pool": pool}),
+        ]
+
+        results = []
+        with override_settings(RATELIMIT_ENABLE=False):
+            for label, pool_options in runs:
+                connection.close()
+                settings_dict["CONN_MAX_AGE"] = 0
+                db_options = {**configured[1], **pool_options}
+                if not pool_options:
+                    db_options.pop("pool", None)
+                settings_dict["OPTIONS"] = db_options
+                try:
+                    latencies = asyncio.run(
+                        self.measure(client, url, params, options["requests"])
+                    )
+                finally:
+                    connection.close()
+                    connection.close_pool()
+                    settings_dict["CONN_MAX_AGE"], settings_dict["OPTIONS"] = configured
+                results.append((label, latencies))
+
+        self.stdout.write(
+            f"{'mode':<28} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}"
+        )
+        for label, latencies in results:
+            latencies.sort()
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            self.stdout.write(
+                f"{label:<28} {statistics.mean(latencies):>8.2f} "
+                f"{statistics.median(latencies):>8.2f} {p95:>8.2f} "
+                f"{latencies[-1]:>8.2f}"
+            )
+
+        baseline = statistics.mean(results[0][1])
+        pooled = statistics.mean(results[1][1])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"The pool saves {baseline - pooled:.2f} ms per request "
+                f"({(1 - pooled / baseline) * 100:.0f}%)"
+            )
+        )
+
+    async def measure(self, client, url, params, requests):
+        """Latencies in ms of ``requests`` sequential GETs after a warm-up."""
+        await client.get(url, params)  # warm up URL resolution and caches
+        latencies = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            await client.get(url, params)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
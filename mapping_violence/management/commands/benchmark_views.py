@@ -0,0 +1,333 @@
+"""
+Benchmark query count, wall time and peak memory of every public view.
+
+Usage:
+    uv run manage.py benchmark_views                      # 1k, 10k and 100k crimes
+    uv run manage.py benchmark_views --sizes 1000 10000
+    uv run manage.py benchmark_views --update-budgets     # record current counts
+
+For each dataset size the command reseeds test data with
+generate_test_data --bulk (from a fixed random seed, so the same size always
+produces the same data) using the skewed "realistic" distribution profile,
+so hot locations and prolific perpetrators are exercised. It then requests
+every view across a set of filter combinations and compares the query
+count against the budgets recorded in mapping_violence/query_budgets.json.
+It exits with an error when any view exceeds its budget, so an N+1
+regression fails the run.
+
+Only records created by generate_test_data are touched; they are cleared
+again at the end unless --keep is given.
+"""
+
+import json
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from mapping_violence.management.commands.generate_test_data import PROFILES, TAG
+from mapping_violence.models import Crime, Person
+
+BUDGETS_PATH = Path(__file__).resolve().parents[2] / "query_budgets.json"
+
+# (name, url name, url kwargs, query params). Callables receive the context
+# built by ``benchmark_context`` so scenarios can point at seeded records.
+SCENARIOS = [
+    ("index", "index", {}, {}),
+    ("crime_list", "crime_list", {}, {}),
+    ("crime_list fatal", "crime_list", {}, {"fatality": "true"}),
+    (
+        "crime_list years+weapon",
+        "crime_list",
+        {},
+        {"year_from": 1550, "year_to": 1650, "weapon_category": "blade"},
+    ),
+    ("crime_list city", "crime_list", {}, lambda ctx: {"city": ctx["city_id"]}),
+    ("crime_list person", "crime_list", {}, lambda ctx: {"person": ctx["person_id"]}),
+    ("crime_detail", "crime_detail", lambda ctx: {"crime_id": ctx["crime_id"]}, {}),
+    ("locations_geojson", "locations_geojson", {}, {}),
+    ("locations_geojson fatal", "locations_geojson", {}, {"fatality": "true"}),
+    ("locations_geojson rollup", "locations_geojson", {}, {"rollup": "city"}),
+    (
+        "locations_geojson bbox",
+        "locations_geojson",
+        {},
+        {"bbox": "12.28,45.42,12.38,45.46"},
+    ),
+    ("locations_density", "locations_density", {}, {}),
+    (
+        "locations_density bbox",
+        "locations_density",
+        {},
+        {"bbox": "12.28,45.42,12.38,45.46", "size": 256},
+    ),
+    ("crime_timeline", "crime_timeline", {}, {}),
+    ("crime_timeline decade", "crime_timeline", {}, {"bucket": "decade"}),
+    (
+        "locations_geojson years",
+        "locations_geojson",
+        {},
+        {"year_from": 1550, "year_to": 1650},
+    ),
+    (
+        "locations_geojson city",
+        "locations_geojson",
+        {},
+        lambda ctx: {"city": ctx["city_id"]},
+    ),
+    (
+        "locations_geojson person",
+        "locations_geojson",
+        {},
+        lambda ctx: {"person": ctx["person_id"]},
+    ),
+    ("person_search", "person_search", {}, {"q": "gri"}),
+    (
+        "person_search city",
+        "person_search",
+        {},
+        lambda ctx: {"q": "gri", "city": ctx["city_id"]},
+    ),
+    (
+        "person_detail",
+        "person_detail",
+        lambda ctx: {"person_id": ctx["person_id"]},
+        {},
+    ),
+    (
+        "person_profile",
+        "person_profile",
+        lambda ctx: {"person_id": ctx["person_id"]},
+        {},
+    ),
+    (
+        "person_network",
+        "person_network",
+        lambda ctx: {"person_id": ctx["person_id"]},
+        {"depth": 2},
+    ),
+    ("crime_export_csv years", "crime_export_csv", {}, {"year_from": 1600}),
+    (
+        "crime_export_csv city",
+        "crime_export_csv",
+        {},
+        lambda ctx: {"city": ctx["city_id"]},
+    ),
+]
+
+
+def benchmark_context():
+    """Pick representative seeded records for scenarios that need IDs."""
+    crimes = Crime.objects.filter(source__startswith=TAG)
+    busiest_person = (
+        Person.objects.filter(notes__startswith=TAG)
+        .annotate(n=Count("crime_perpetrator") + Count("crime_victim"))
+        .order_by("-n", "pk")
+        .first()
+    )
+    busiest_city = (
+        crimes.values("address__city")
+        .annotate(n=Count("pk"))
+        .order_by("-n", "address__city")
+        .first()
+    )
+    return {
+        "crime_id": crimes.order_by("pk").values_list("pk", flat=True).first(),
+        "person_id": busiest_person.pk if busiest_person else "",
+        "city_id": busiest_city["address__city"] if busiest_city else "",
+    }
+
+
+class QueryCounter:
+    """Execute wrapper counting queries on a connection.
+
+    CaptureQueriesContext can't be used here: the test client fires
+    request_started, which resets connection.queries mid-capture.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def consume(response):
+    """Read a response body fully and return its size in bytes."""
+    if not response.streaming:
+        return len(response.content)
+    if response.is_async:
+
+        async def read():
+            return sum([len(chunk) async for chunk in response.streaming_content])
+
+        return async_to_sync(read)()
+    return sum(len(chunk) for chunk in response.streaming_content)
+
+
+class Command(BaseCommand):
+    help = "Benchmark public views and enforce query-count budgets"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=[1000, 10000, 100000],
+            help="Numbers of crimes to seed (default: 1000 10000 100000)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Timed requests per scenario; the median is reported (default: 3)",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=1500,
+            help="Random seed for generated data (default: 1500)",
+        )
+        parser.add_argument(
+            "--profile",
+            default="realistic",
+            choices=sorted(PROFILES),
+            help="generate_test_data distribution profile (default: realistic)",
+        )
+        parser.add_argument(
+            "--budgets",
+            default=str(BUDGETS_PATH),
+            help="Query budget file (default: mapping_violence/query_budgets.json)",
+        )
+        parser.add_argument(
+            "--update-budgets",
+            action="store_true",
+            help="Record measured query counts as the new budgets",
+        )
+        parser.add_argument(
+            "--output",
+            help="Also write all measurements to this JSON file",
+        )
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Leave the last generated dataset in place",
+        )
+
+    def handle(self, *args, **options):
+        budgets_path = Path(options["budgets"])
+        budgets = {}
+        if budgets_path.exists():
+            budgets = json.loads(budgets_path.read_text())
+
+        client = Client(HTTP_HOST="localhost")
+        measurements = {}
+        failures = []
+
+        with override_settings(RATELIMIT_ENABLE=False, PROFILING_SAMPLE_RATE=0):
+            try:
+                for size in options["sizes"]:
+                    self.seed(size, options["seed"], options["profile"])
+                    results = self.run_scenarios(client, options["repeat"])
+                    measurements[str(size)] = results
+                    failures += self.check_budgets(
+                        size, results, budgets.get(str(size), {})
+                    )
+            finally:
+                if not options["keep"]:
+                    call_command("generate_test_data", clear=True, stdout=self.stderr)
+
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(measurements, indent=2))
+
+        if options["update_budgets"]:
+            for size, results in measurements.items():
+                budgets[size] = {name: r["queries"] for name, r in results.items()}
+            budgets_path.write_text(
+                json.dumps(budgets, indent=2, sort_keys=True) + "\n"
+            )
+            self.stdout.write(self.style.SUCCESS(f"Budgets written to {budgets_path}"))
+        elif failures:
+            raise CommandError(
+                "Query budgets exceeded:\n" + "\n".join(f"  {f}" for f in failures)
+            )
+
+    def seed(self, size, seed, profile):
+        self.stderr.write(f"Seeding {size:,} crimes ({profile})...")
+        call_command("generate_test_data", clear=True, stdout=self.stderr)
+        call_command(
+            "generate_test_data",
+            count=size,
+            bulk=True,
+            seed=seed,
+            profile=profile,
+            stdout=self.stderr,
+        )
+
+    def run_scenarios(self, client, repeat):
+        ctx = benchmark_context()
+        results = {}
+        self.stdout.write(
+            f"\n{'scenario':<28} {'status':>6} {'queries':>8} {'ms':>9} "
+            f"{'peak MB':>8} {'KB':>9}"
+        )
+        for name, url_name, url_kwargs, params in SCENARIOS:
+            url_kwargs = url_kwargs(ctx) if callable(url_kwargs) else url_kwargs
+            params = params(ctx) if callable(params) else params
+            url = reverse(url_name, kwargs=url_kwargs)
+
+            # Measure the uncached cost; cache_page would hide repeat runs.
+            # Queries and memory come from one traced run, timings from
+            # separate runs because tracemalloc slows allocation down.
+            cache.clear()
+            tracemalloc.start()
+            queries = QueryCounter()
+            with connection.execute_wrapper(queries):
+                response = client.get(url, params)
+                size = consume(response)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            timings = []
+            for _ in range(repeat):
+                cache.clear()
+                start = time.perf_counter()
+                consume(client.get(url, params))
+                timings.append((time.perf_counter() - start) * 1000)
+
+            result = {
+                "status": response.status_code,
+                "queries": queries.count,
+                "ms": statistics.median(timings) if timings else 0.0,
+                "peak_mb": peak / 1e6,
+                "bytes": size,
+            }
+            results[name] = result
+            self.stdout.write(
+                f"{name:<28} {result['status']:>6} {result['queries']:>8} "
+                f"{result['ms']:>9.1f} {result['peak_mb']:>8.2f} "
+                f"{result['bytes'] / 1024:>9.1f}"
+            )
+        return results
+
+    def check_budgets(self, size, results, budgets):
+        failures = []
+        for name, result in results.items():
+            if result["status"] != 200:
+                failures.append(f"{size}: {name} returned {result['status']}")
+            budget = budgets.get(name)
+            if budget is not None and result["queries"] > budget:
+                failures.append(
+                    f"{size}: {name} ran {result['queries']} queries (budget {budget})"
+                )
+        return failures
@@ -0,0 +1,149 @@
+"""
+Build pre-generated full-dataset exports with checksums and a manifest.
+
+Usage:
+    uv run manage.py build_export_artifacts
+    uv run manage.py build_export_artifacts --format csv --format parquet
+
+Intended to run nightly from cron, e.g.:
+    15 3 * * * cd /app && uv run manage.py build_export_artifacts
+
+Files are written to default storage under settings.EXPORT_ARTIFACTS_DIR
+(media storage, or object storage when OBJ_STORAGE is enabled). Unfiltered
+requests to /data/export.<format> are served from these files (redirected
+to object storage, or streamed from media storage), so the heaviest
+download never queries the database.
+
+Each build goes in its own directory, and manifest.json, which points the
+site at a build, is replaced last, so a download during a rebuild never
+sees a missing or half-written file. Web workers cache the manifest for a
+few minutes, so the previous build is kept until the next one.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+from django.utils import timezone
+
+from mapping_violence.exports import (
+    ARTIFACT_MANIFEST,
+    EXPORT_FORMATS,
+    artifact_path,
+    export_filename,
+    get_export_queryset,
+    iter_export,
+    load_artifact_manifest,
+    parquet_available,
+)
+
+DEFAULT_FORMATS = ["csv", "parquet", "geojson"]
+
+
+class Command(BaseCommand):
+    help = "Build full-dataset export files, checksums and a manifest"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            action="append",
+            choices=sorted(EXPORT_FORMATS),
+            help="Format to build, may be repeated (default: csv, parquet, geojson)",
+        )
+
+    def handle(self, *args, **options):
+        formats = options["format"] or DEFAULT_FORMATS
+        if "parquet" in formats and not parquet_available():
+            if options["format"]:
+                raise CommandError("Parquet export requires the pyarrow package.")
+            self.stderr.write(self.style.WARNING("pyarrow not installed; skipping"))
+            formats = [f for f in formats if f != "parquet"]
+
+        queryset = get_export_queryset(QueryDict())
+        record_count = queryset.count()
+        generated_at = timezone.now()
+        build = generated_at.strftime("%Y%m%dT%H%M%S%fZ")
+        previous = load_artifact_manifest(refresh=True) or {}
+        files = {}
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for fmt in formats:
+                name = export_filename(fmt)
+                local = Path(tmpdir) / name
+                digest = hashlib.sha256()
+                size = 0
+                with open(local, "wb") as fh:
+                    for chunk in iter_export(fmt, queryset):
+                        if isinstance(chunk, str):
+                            chunk = chunk.encode("utf-8")
+                        fh.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+
+                self.save(f"{build}/{name}", local)
+                files[fmt] = {
+                    "name": name,
+                    "path": f"{build}/{name}",
+                    "bytes": size,
+                    "sha256": digest.hexdigest(),
+                }
+                self.stdout.write(f"  {name}: {size:,} bytes")
+
+            checksums = Path(tmpdir) / "SHA256SUMS"
+            checksums.write_text(
+                "".join(f"{f['sha256']}  {f['name']}\n" for f in files.values())
+            )
+            self.save(f"{build}/SHA256SUMS", checksums)
+
+            # Written last so readers never see a manifest for missing files
+            manifest = Path(tmpdir) / ARTIFACT_MANIFEST
+            manifest.write_text(
+                json.dumps(
+                    {
+                        "generated_at": generated_at.isoformat(),
+                        "build": build,
+                        "records": record_count,
+                        "files": files,
+                    },
+                    indent=2,
+                )
+            )
+            self.save(ARTIFACT_MANIFEST, manifest)
+
+        self.prune({build, previous.get("build")})
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Built {len(files)} export(s) of {record_count} crimes "
+                f"in {artifact_path('')}"
+            )
+        )
+
+    @staticmethod
+    def save(name, local_path):
+        """Replace ``name`` in default storage with the file at ``local_path``."""
+        path = artifact_path(name)
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        with open(local_path, "rb") as fh:
+            default_storage.save(path, File(fh, name=name))
+
+    def prune(self, keep):
+        """Delete the files of builds other than those in ``keep``."""
+        builds, _ = default_storage.listdir(artifact_path(""))
+        for build in builds:
+            if build in keep:
+                continue
+            _, names = default_storage.listdir(artifact_path(build))
+            for name in names:
+                default_storage.delete(artifact_path(f"{build}/{name}"))
+            try:
+                os.rmdir(default_storage.path(artifact_path(build)))
+            except NotImplementedError:
+                pass  # object storage has no directories
+            self.stdout.write(f"  removed build {build}")
@@ -18,16 +18,68 @@ This command:
 3. Cleans up the Location name to just the location detail
 4. Deletes the orphaned fake city records
 5. Merges exact duplicates caused by trailing whitespace
+
+Base city names are matched with a prefix trie, counts come from grouped
+queries, and changes are written with bulk updates, so a run takes the same
+number of queries however many cities are involved (up to BATCH_SIZE rows
+per UPDATE).
 """
 
 import csv
-import sys
 
 from django.core.management.base import BaseCommand
 from django.db import transaction
-from django.db.models import Count
-
-from locations.models import City, Location
+from django.db.models import Case, Count, When
+
+from locations.models import City, Location, update_effective_coordinates
+from mapping_violence import network, summaries, timeline
+from mapping_violence.models import Crime, Event
+
+BATCH_SIZE = 2000
+
+SEPARATORS = (",", ";", " ")
+
+
+class BaseCityTrie:
+    """Base cities by name, for finding the one a fake city name starts with."""
+
+    def __init__(self, base_cities):
+        self.root = {}
+        for base in base_cities:
+            key = base.name.strip().rstrip(",").lower()
+            if not key:
+                continue
+            node = self.root
+            for char in key:
+                node = node.setdefault(char, {})
+            # The first city with a name wins
+            node.setdefault(None, base)
+
+    def match(self, fake_name):
+        """Find the best matching base city for a fake city name.
+
+        The longest base name followed by a separator or nothing wins.
+        Returns (base_city, location_detail), with an empty detail for a
+        whitespace dupe, or (None, None).
+        """
+        name = fake_name.strip()
+        lowered = name.lower()
+        best = (None, None)
+        node = self.root
+        for i in range(len(lowered) + 1):
+            base = node.get(None)
+            if base is not None:
+                remainder = name[i:]
+                # Exact match (possibly with whitespace) — a whitespace dupe
+                if not remainder.strip():
+                    best = (base, "")
+                # Must start with a separator to count as "CityName + detail"
+                elif remainder[0] in SEPARATORS:
+                    best = (base, remainder.lstrip(",; ").strip())
+            if i == len(lowered) or lowered[i] not in node:
+                break
+            node = node[lowered[i]]
+        return best
 
 
 def find_base_city(fake_name, base_cities):
@@ -35,28 +87,22 @@ def find_base_city(fake_name, base_cities):
 
     Returns (base_city, location_detail) or (None, None).
     """
-    name = fake_name.strip()
-
-    for base in sorted(base_cities, key=lambda c: -len(c.name.strip())):
-        base_name = base.name.strip().rstrip(",")
-        if not name.lower().startswith(base_name.lower()):
-            continue
-
-        remainder = name[len(base_name) :]
-
-        # Exact match (possibly with whitespace) — this is a whitespace dupe
-        if not remainder.strip():
-            return base, ""
-
-        # Must start with a separator to count as "CityName + detail"
-        if remainder[0] in (",", ";", " "):
-            detail = remainder.lstrip(",; ").strip()
-            if detail:
-                return base, detail
-            else:
-                return base, ""  # whitespace dupe
-
-    return None, None
+    return BaseCityTrie(base_cities).match(fake_name)
+
+
+def repoint(model, field, mapping):
+    """Point ``field`` of ``model`` rows from the keys of ``mapping`` to its
+    values, one UPDATE per BATCH_SIZE keys."""
+    items = list(mapping.items())
+    for i in range(0, len(items), BATCH_SIZE):
+        batch = dict(items[i : i + BATCH_SIZE])
+        model.objects.filter(**{f"{field}__in": batch}).update(
+            **{
+                field: Case(
+                    *(When(**{field: old}, then=new) for old, new in batch.items())
+                )
+            }
+        )
 
 
 class Command(BaseCommand):
@@ -79,6 +125,30 @@ class Command(BaseCommand):
             help="Output a CSV report of all cities and their status",
         )
 
+    def classify(self):
+        """Load every city and sort the fake ones into whitespace dupes
+        (fake city, base), location-in-name cities (fake city, base, detail)
+        and unmatched cities."""
+        cities = list(City.objects.order_by("name", "pk"))
+        # Base cities: those with coordinates
+        base_cities = [city for city in cities if city.latitude is not None]
+        trie = BaseCityTrie(base_cities)
+
+        whitespace_dupes = []
+        location_in_name = []
+        unmatched = []
+        for city in cities:
+            if city.latitude is not None:
+                continue
+            base, detail = trie.match(city.name)
+            if base is None:
+                unmatched.append(city)
+            elif detail == "":
+                whitespace_dupes.append((city, base))
+            else:
+                location_in_name.append((city, base, detail))
+        return cities, whitespace_dupes, location_in_name, unmatched
+
     def handle(self, *args, **options):
         if options["report"]:
             return self.report()
@@ -86,25 +156,7 @@ class Command(BaseCommand):
         apply = options["apply"]
         whitespace_only = options["whitespace"]
 
-        # Base cities: those with coordinates
-        base_cities = list(City.objects.exclude(latitude__isnull=True))
-        # Also include cities without coords that have a clean short name
-        # (not containing location detail)
-
-        fake_cities = City.objects.filter(latitude__isnull=True).order_by("name")
-
-        whitespace_dupes = []  # (fake_city, base_city)
-        location_in_name = []  # (fake_city, base_city, location_detail)
-        unmatched = []
-
-        for fc in fake_cities:
-            base, detail = find_base_city(fc.name, base_cities)
-            if base is None:
-                unmatched.append(fc)
-            elif detail == "":
-                whitespace_dupes.append((fc, base))
-            else:
-                location_in_name.append((fc, base, detail))
+        _, whitespace_dupes, location_in_name, unmatched = self.classify()
 
         # ── Report ───────────────────────────────────────────────────────
         self.stdout.write(
@@ -116,12 +168,13 @@ class Command(BaseCommand):
         )
 
         if whitespace_dupes:
+            loc_counts = self.location_counts()
             self.stdout.write(self.style.WARNING("\n── Whitespace duplicates ──"))
             for fc, base in whitespace_dupes[:10]:
-                loc_count = Location.objects.filter(city=fc).count()
                 self.stdout.write(
                     f"  {repr(fc.name)} (ID={fc.id}) → merge into "
-                    f"{repr(base.name)} (ID={base.id}), {loc_count} locations"
+                    f"{repr(base.name)} (ID={base.id}), "
+                    f"{loc_counts.get(fc.id, 0)} locations"
                 )
             if len(whitespace_dupes) > 10:
                 self.stdout.write(f"  ... and {len(whitespace_dupes) - 10} more")
@@ -147,100 +200,138 @@ class Command(BaseCommand):
             return
 
         # ── Apply changes ────────────────────────────────────────────────
-        merged_count = 0
-        relocated_count = 0
-
+        fixes = [(fc, base, "") for fc, base in whitespace_dupes]
+        if not whitespace_only:
+            fixes += location_in_name
         with transaction.atomic():
-            # 1. Fix whitespace duplicates
-            for fc, base in whitespace_dupes:
-                locs = Location.objects.filter(city=fc)
-                for loc in locs:
-                    # Check if a matching location already exists under base
-                    existing = Location.objects.filter(
-                        city=base, name=loc.name.strip() or base.name.strip()
-                    ).first()
-                    if existing:
-                        # Move crimes from this location to the existing one
-                        from mapping_violence.models import Crime
-
-                        Crime.objects.filter(address=loc).update(address=existing)
-                        loc.delete()
-                    else:
-                        loc.name = loc.name.strip() or base.name.strip()
-                        loc.city = base
-                        loc.save()
-                fc.delete()
-                merged_count += 1
-
-            # 2. Fix location-in-name cities
-            if not whitespace_only:
-                for fc, base, detail in location_in_name:
-                    locs = Location.objects.filter(city=fc)
-                    for loc in locs:
-                        loc_name = detail if detail else loc.name.strip()
-                        # Avoid unique constraint collision
-                        existing = Location.objects.filter(
-                            city=base,
-                            category_of_space=loc.category_of_space,
-                            description_of_location=loc.description_of_location,
-                        ).first()
-                        if (
-                            existing
-                            and existing.name == loc_name
-                            and existing.id != loc.id
-                        ):
-                            # Merge into existing
-                            from mapping_violence.models import Crime
-
-                            Crime.objects.filter(address=loc).update(address=existing)
-                            loc.delete()
-                        else:
-                            loc.name = loc_name
-                            loc.city = base
-                            try:
-                                loc.save()
-                            except Exception:
-                                # Unique constraint — merge instead
-                                from mapping_violence.models import Crime
-
-                                target = (
-                                    Location.objects.filter(
-                                        city=base,
-                                        category_of_space=loc.category_of_space,
-                                        description_of_location=loc.description_of_location,
-                                    )
-                                    .exclude(id=loc.id)
-                                    .first()
-                                )
-                                if target:
-                                    Crime.objects.filter(address=loc).update(
-                                        address=target
-                                    )
-                                    loc.delete()
-                    fc.delete()
-                    relocated_count += 1
+            self.apply(fixes)
 
+        relocated_count = len(fixes) - len(whitespace_dupes)
         self.stdout.write(
             self.style.SUCCESS(
-                f"\nDone! Merged {merged_count} whitespace duplicates, "
+                f"\nDone! Merged {len(whitespace_dupes)} whitespace duplicates, "
                 f"relocated {relocated_count} location-in-name cities."
             )
         )
 
         # Show remaining orphaned cities
-        orphans = City.objects.annotate(loc_count=Count("location")).filter(loc_count=0)
-        if orphans.exists():
+        orphans = City.objects.filter(location__isnull=True).count()
+        if orphans:
             self.stdout.write(
                 self.style.WARNING(
-                    f"\n{orphans.count()} cities now have zero locations "
+                    f"\n{orphans} cities now have zero locations "
                     f"(may be safe to review/delete)."
                 )
             )
 
+    def apply(self, fixes):
+        """Move the locations of each (fake city, base, detail) to the base
+        city, merging them into an existing location where one matches, and
+        delete the fake cities."""
+        target = {fc.pk: (base, detail) for fc, base, detail in fixes}
+        base_ids = {base.pk for base, _ in target.values()}
+        locations = Location.objects.filter(
+            city_id__in=base_ids | set(target)
+        ).order_by("pk")
+
+        # Locations already in the base cities, by the keys a fake city's
+        # location can collide on
+        by_name = {}  # (city, name): whitespace dupes merge on name
+        by_detail = {}  # (city, name, category, description)
+        by_space = {}  # (city, category, description): unique_location_in_city
+        moving = []
+
+        def index(loc):
+            by_name.setdefault((loc.city_id, loc.name), loc.pk)
+            by_detail.setdefault(
+                (
+                    loc.city_id,
+                    loc.name,
+                    loc.category_of_space,
+                    loc.description_of_location,
+                ),
+                loc.pk,
+            )
+            if loc.category_of_space and loc.description_of_location:
+                by_space.setdefault(
+                    (loc.city_id, loc.category_of_space, loc.description_of_location),
+                    loc.pk,
+                )
+
+        for loc in locations:
+            if loc.city_id in target:
+                moving.append(loc)
+            else:
+                index(loc)
+
+        moved = []
+        merges = {}  # location id -> id of the location it merges into
+        for loc in moving:
+            base, detail = target[loc.city_id]
+            if detail:
+                name = detail
+                into = by_detail.get(
+                    (base.pk, name, loc.category_of_space, loc.description_of_location)
+                )
+            else:
+                name = loc.name.strip() or base.name.strip()
+                into = by_name.get((base.pk, name))
+            if into is None and loc.category_of_space and loc.description_of_location:
+                # Moving it would break the unique constraint — merge instead
+                into = by_space.get(
+                    (base.pk, loc.category_of_space, loc.description_of_location)
+                )
+            if into is not None:
+                merges[loc.pk] = into
+            else:
+                loc.city_id = base.pk
+                loc.name = name
+                moved.append(loc)
+                index(loc)
+
+        Location.objects.bulk_update(moved, ["city", "name"], batch_size=BATCH_SIZE)
+        merged_crimes = list(
+            Crime.objects.filter(address_id__in=merges).values_list("pk", flat=True)
+        )
+        repoint(Crime, "address_id", merges)
+        repoint(Event, "location_id", merges)
+        # What is left in the fake cities was merged away
+        Location.objects.filter(city_id__in=target).delete()
+        City.objects.filter(pk__in=target).delete()
+
+        # Moved locations now fall back to the base city's coordinates, and
+        # the people of re-pointed crimes have new places in their summaries
+        update_effective_coordinates(Location.objects.filter(city_id__in=base_ids))
+        summaries.refresh_persons(
+            set().union(*network.participants(merged_crimes).values())
+        )
+        timeline.invalidate()
+
+    def location_counts(self):
+        """{city id: number of locations}"""
+        return dict(
+            Location.objects.values_list("city_id").annotate(n=Count("pk")).order_by()
+        )
+
     def report(self):
         """Output a CSV of all cities with their status."""
-        base_cities = list(City.objects.exclude(latitude__isnull=True))
-        writer = csv.writer(sys.stdout)
+        cities, whitespace_dupes, location_in_name, _ = self.classify()
+        status = {
+            city.pk: ("base", "", "") for city in cities if city.latitude is not None
+        }
+        for fc, base in whitespace_dupes:
+            status[fc.pk] = ("whitespace_dupe", base.name, "")
+        for fc, base, detail in location_in_name:
+            status[fc.pk] = ("location_in_name", base.name, detail)
+        loc_counts = self.location_counts()
+        crime_counts = dict(
+            Crime.objects.filter(address__isnull=False)
+            .values_list("address__city_id")
+            .annotate(n=Count("pk"))
+            .order_by()
+        )
+
+        writer = csv.writer(self.stdout)
         writer.writerow(
             [
                 "id",
@@ -253,37 +344,17 @@ class Command(BaseCommand):
                 "crime_count",
             ]
         )
-
-        for city in City.objects.all().order_by("name"):
-            has_coords = bool(city.latitude)
-            loc_count = Location.objects.filter(city=city).count()
-            from mapping_violence.models import Crime
-
-            crime_count = Crime.objects.filter(address__city=city).count()
-
-            if has_coords:
-                status = "base"
-                base_name = ""
-                detail = ""
-            else:
-                base, detail = find_base_city(city.name, base_cities)
-                if base:
-                    status = "whitespace_dupe" if detail == "" else "location_in_name"
-                    base_name = base.name
-                else:
-                    status = "unmatched"
-                    base_name = ""
-                    detail = ""
-
+        for city in cities:
+            city_status, base_name, detail = status.get(city.pk, ("unmatched", "", ""))
             writer.writerow(
                 [
                     city.id,
                     city.name,
-                    has_coords,
-                    status,
+                    bool(city.latitude),
+                    city_status,
                     base_name,
                     detail,
-                    loc_count,
-                    crime_count,
+                    loc_counts.get(city.pk, 0),
+                    crime_counts.get(city.pk, 0),
                 ]
             )
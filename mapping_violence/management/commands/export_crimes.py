@@ -0,0 +1,81 @@
+"""
+Export crime records to CSV, JSON Lines, GeoJSON or Parquet.
+
+Usage:
+    uv run manage.py export_crimes --format parquet --output crimes.parquet
+    uv run manage.py export_crimes --format geojson --filter city=3 --filter fatality=true
+    uv run manage.py export_crimes --format jsonl > crimes.jsonl
+
+Filters accept the same parameters as the public /data/ table and
+/data/export.csv (country, city, location, crime_type, person, year_from,
+year_to, fatality, weapon_category, weapon_subcategory, urban_rural).
+"""
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+
+from mapping_violence.exports import (
+    EXPORT_FORMATS,
+    get_export_queryset,
+    iter_export,
+    parquet_available,
+)
+
+
+class Command(BaseCommand):
+    help = "Export filtered crime records as CSV, JSON Lines, GeoJSON or Parquet"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            choices=sorted(EXPORT_FORMATS),
+            default="csv",
+            help="Output format (default: csv)",
+        )
+        parser.add_argument(
+            "--output",
+            default="-",
+            help="File to write to (default: stdout)",
+        )
+        parser.add_argument(
+            "--filter",
+            action="append",
+            default=[],
+            metavar="KEY=VALUE",
+            help="CrimeFilter parameter, may be repeated (e.g. --filter year_from=1550)",
+        )
+
+    def handle(self, *args, **options):
+        fmt = options["format"]
+        if fmt == "parquet" and not parquet_available():
+            raise CommandError("Parquet export requires the pyarrow package.")
+
+        params = QueryDict(mutable=True)
+        for item in options["filter"]:
+            key, sep, value = item.partition("=")
+            if not sep:
+                raise CommandError(f"Filters must be KEY=VALUE, got {item!r}")
+            params.appendlist(key.strip(), value.strip())
+
+        queryset = get_export_queryset(params)
+        output = options["output"]
+        if output == "-":
+            written = self.write_chunks(iter_export(fmt, queryset), sys.stdout.buffer)
+        else:
+            with open(output, "wb") as fh:
+                written = self.write_chunks(iter_export(fmt, queryset), fh)
+            self.stderr.write(
+                self.style.SUCCESS(f"Wrote {written:,} bytes of {fmt} to {output}")
+            )
+
+    @staticmethod
+    def write_chunks(chunks, fh):
+        written = 0
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            fh.write(chunk)
+            written += len(chunk)
+        return written
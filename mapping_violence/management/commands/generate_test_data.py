@@ -3,18 +3,34 @@ Generate dummy Crime/Person/Location data for testing the map at scale.
 
 Usage:
     uv run manage.py generate_test_data --count 500
+    uv run manage.py generate_test_data --count 100000 --bulk --seed 42
+    uv run manage.py generate_test_data --count 10000 --profile realistic
     uv run manage.py generate_test_data --clear
 
 Generated records are tagged so --clear only removes test data, not real records.
+--bulk builds objects in memory and writes them (including the victim,
+perpetrator and weapon through-tables) with bulk_create in batches, which
+is what makes 100k-crime benchmark datasets practical. --seed makes the
+generated data reproducible in either mode.
+
+--profile picks how records are distributed. "uniform" draws every location,
+person and weapon with equal probability. "realistic" reproduces the skew of
+the archival data: Zipf-distributed location popularity (a few hot spots
+with thousands of crimes), a small pool of repeat offenders behind a large
+share of perpetrator slots, undated and partially dated crimes, and a
+weapon mix dominated by blades.
 """
 
 import random
 from datetime import date
 from decimal import Decimal
+from itertools import accumulate
 
 from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
 
 from locations.models import City, Location
+from mapping_violence import network, related, summaries, timeline
 from mapping_violence.models import Crime, Person, Weapon
 
 # Tag prefix used to identify generated data
@@ -272,6 +288,64 @@ OCCUPATIONS = [
     "barber",
 ]
 
+# ── Distribution profiles ───────────────────────────────────────────────────
+#
+# location_skew / offender_skew: Zipf exponent over locations (in city order,
+#   so Venice is the hot spot) and over the repeat-offender pool; 0 = uniform.
+# repeat_offenders: fraction of persons in the repeat-offender pool.
+# repeat_share: chance a crime's perpetrators come from that pool.
+# undated / year_only / year_month: fractions of crimes with no date, only a
+#   year, or only a year and month; the rest are fully dated.
+# armed / extra_weapon: chance of one weapon, then of a second one.
+# weapon_mix: weights per weapon category; None picks weapons uniformly.
+
+PROFILES = {
+    "uniform": {
+        "locations_per_city": (5, 12),
+        "location_skew": 0,
+        "persons_per_crime": 1.0,
+        "repeat_offenders": 0,
+        "repeat_share": 0,
+        "offender_skew": 0,
+        "undated": 0,
+        "year_only": 0,
+        "year_month": 0,
+        "armed": 0.7,
+        "extra_weapon": 0,
+        "weapon_mix": None,
+    },
+    "realistic": {
+        "locations_per_city": (5, 30),
+        "location_skew": 1.2,
+        "persons_per_crime": 1.5,
+        "repeat_offenders": 0.02,
+        "repeat_share": 0.35,
+        "offender_skew": 1.0,
+        "undated": 0.15,
+        "year_only": 0.2,
+        "year_month": 0.1,
+        "armed": 0.8,
+        "extra_weapon": 0.1,
+        "weapon_mix": {
+            "blade": 0.55,
+            "blunt_instrument": 0.2,
+            "firearm": 0.1,
+            "no_weapon": 0.1,
+            "other": 0.05,
+        },
+    },
+}
+
+
+def zipf_cum_weights(n, skew):
+    """Cumulative Zipf weights for ``n`` ranked items, for random.choices."""
+    return list(accumulate(1 / rank**skew for rank in range(1, n + 1)))
+
+
+def distinct(items):
+    """Drop repeated draws while keeping order."""
+    return list(dict.fromkeys(items))
+
 
 class Command(BaseCommand):
     help = "Generate dummy crime data for testing the map, or clear it with --clear"
@@ -288,45 +362,70 @@ class Command(BaseCommand):
             action="store_true",
             help="Remove all previously generated test data",
         )
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help="Write records with bulk_create in batches (for large datasets)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Rows per bulk_create batch in --bulk mode (default: 5000)",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            help="Random seed for reproducible data",
+        )
+        parser.add_argument(
+            "--profile",
+            choices=sorted(PROFILES),
+            default="uniform",
+            help="Distribution of crimes over locations, persons, dates and "
+            "weapons (default: uniform)",
+        )
 
     def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.profile = PROFILES[options["profile"]]
         if options["clear"]:
             return self.clear_data()
+        if options["bulk"]:
+            return self.generate_bulk(options["count"], options["batch_size"])
         return self.generate_data(options["count"])
 
     def clear_data(self):
-        # Delete crimes first (they reference persons/locations/weapons)
         crimes = Crime.objects.filter(source__startswith=TAG)
         crime_count = crimes.count()
 
-        # Collect M2M person IDs before deleting crimes
-        victim_ids = set()
-        perp_ids = set()
-        for c in crimes:
-            victim_ids.update(c.victim.values_list("id", flat=True))
-            perp_ids.update(c.perpetrator.values_list("id", flat=True))
-        test_person_ids = victim_ids | perp_ids
+        with transaction.atomic():
+            # Empty the through tables in one statement each so the deletion
+            # collector has nothing left to fetch row by row
+            for m2m in (Crime.victim, Crime.perpetrator, Crime.weapon):
+                m2m.through.objects.filter(crime__in=crimes).delete()
 
-        crimes.delete()
+            crimes.delete()
 
-        # Delete test persons (only those tagged)
-        persons = Person.objects.filter(id__in=test_person_ids, notes__startswith=TAG)
-        person_count = persons.count()
-        persons.delete()
+            # Delete test persons, including any from the bulk pool that
+            # never ended up linked to a crime
+            persons = Person.objects.filter(notes__startswith=TAG)
+            person_count = persons.count()
+            persons.delete()
 
-        # Delete test weapons
-        weapons = Weapon.objects.filter(definition__startswith=TAG)
-        weapon_count = weapons.count()
-        weapons.delete()
+            # Delete test weapons
+            weapons = Weapon.objects.filter(definition__startswith=TAG)
+            weapon_count = weapons.count()
+            weapons.delete()
 
-        # Delete test locations and cities
-        locations = Location.objects.filter(notes__startswith=TAG)
-        loc_count = locations.count()
-        locations.delete()
+            # Delete test locations and cities
+            locations = Location.objects.filter(notes__startswith=TAG)
+            loc_count = locations.count()
+            locations.delete()
 
-        cities = City.objects.filter(notes__startswith=TAG)
-        city_count = cities.count()
-        cities.delete()
+            cities = City.objects.filter(notes__startswith=TAG)
+            city_count = cities.count()
+            cities.delete()
 
         self.stdout.write(
             self.style.SUCCESS(
@@ -335,10 +434,9 @@ class Command(BaseCommand):
             )
         )
 
-    def generate_data(self, count):
-        self.stdout.write(f"Generating {count} test crimes...")
+    # ── Shared setup ─────────────────────────────────────────────────────
 
-        # ── Cities ───────────────────────────────────────────────────────
+    def get_cities(self):
         cities = []
         for name, lat, lng in VENETIAN_CITIES:
             city, _ = City.objects.get_or_create(
@@ -358,52 +456,9 @@ class Command(BaseCommand):
                 city.save()
             cities.append(city)
         self.stdout.write(f"  {len(cities)} cities ready")
+        return cities
 
-        # ── Locations ────────────────────────────────────────────────────
-        locations = []
-        for city in cities:
-            num_locations = random.randint(5, 12)
-            for i in range(num_locations):
-                tmpl = random.choice(LOCATION_TEMPLATES)
-                loc_name = tmpl[0].format(name=random.choice(LOCATION_NAMES))
-                category = tmpl[1]
-                urban_rural = tmpl[2]
-
-                # Use a unique description to avoid unique constraint collisions
-                description = f"Near the {random.choice(LOCATION_NAMES)}, #{i + 1}"
-
-                # 80% get specific coordinates (jittered from city)
-                lat = lng = None
-                if random.random() < 0.8 and city.latitude and city.longitude:
-                    lat = city.latitude + Decimal(
-                        str(round(random.uniform(-0.03, 0.03), 6))
-                    )
-                    lng = city.longitude + Decimal(
-                        str(round(random.uniform(-0.03, 0.03), 6))
-                    )
-
-                try:
-                    location = Location.objects.create(
-                        name=loc_name,
-                        city=city,
-                        category_of_space=category,
-                        description_of_location=description,
-                        urban_rural=urban_rural,
-                        latitude=lat,
-                        longitude=lng,
-                        sestiere=random.choice(SESTIERI)
-                        if city.name == "Venice"
-                        else "",
-                        notes=TAG + "auto-generated location",
-                    )
-                    locations.append(location)
-                except Exception:
-                    # Unique constraint violation — skip duplicate
-                    pass
-
-        self.stdout.write(f"  {len(locations)} locations created")
-
-        # ── Weapons ──────────────────────────────────────────────────────
+    def get_weapons(self):
         weapons = []
         for name, category in WEAPON_NAMES:
             weapon, _ = Weapon.objects.get_or_create(
@@ -415,85 +470,317 @@ class Command(BaseCommand):
             )
             weapons.append(weapon)
         self.stdout.write(f"  {len(weapons)} weapons ready")
+        return weapons
+
+    # ── Object builders (unsaved) ────────────────────────────────────────
+
+    def build_locations(self, city):
+        rng = self.rng
+        num_locations = rng.randint(*self.profile["locations_per_city"])
+        for i in range(num_locations):
+            tmpl = rng.choice(LOCATION_TEMPLATES)
+            loc_name = tmpl[0].format(name=rng.choice(LOCATION_NAMES))
+            category = tmpl[1]
+            urban_rural = tmpl[2]
+
+            # Use a unique description to avoid unique constraint collisions
+            description = f"Near the {rng.choice(LOCATION_NAMES)}, #{i + 1}"
+
+            # 80% get specific coordinates (jittered from city)
+            lat = lng = None
+            if rng.random() < 0.8 and city.latitude and city.longitude:
+                lat = city.latitude + Decimal(str(round(rng.uniform(-0.03, 0.03), 6)))
+                lng = city.longitude + Decimal(str(round(rng.uniform(-0.03, 0.03), 6)))
+
+            location = Location(
+                name=loc_name,
+                city=city,
+                category_of_space=category,
+                description_of_location=description,
+                urban_rural=urban_rural,
+                latitude=lat,
+                longitude=lng,
+                sestiere=rng.choice(SESTIERI) if city.name == "Venice" else "",
+                notes=TAG + "auto-generated location",
+            )
+            # bulk_create skips save(), which fills these in
+            location.set_effective_coordinates()
+            yield location
+
+    def build_person(self):
+        rng = self.rng
+        gender = rng.choice(["M", "F", "U"])
+        if gender == "F":
+            first = rng.choice(FIRST_NAMES_F)
+            honorific = rng.choice(HONORIFICS_F)
+        else:
+            first = rng.choice(FIRST_NAMES_M)
+            honorific = rng.choice(HONORIFICS_M)
+        last = rng.choice(LAST_NAMES)
+
+        return Person(
+            first_name=first,
+            last_name=last,
+            given_name=f"{first} {last}",
+            honorific=honorific,
+            gender=gender,
+            occupation=rng.choice(OCCUPATIONS) if rng.random() < 0.6 else "",
+            citizenship="Venetian"
+            if rng.random() < 0.7
+            else rng.choice(
+                ["Paduan", "Brescian", "Friulian", "Greek", "Ottoman", "German"]
+            ),
+            notes=TAG + "auto-generated person",
+        )
 
-        # ── Persons ──────────────────────────────────────────────────────
-        persons = []
-        num_persons = max(count, 100)  # ensure enough people to reuse
-        for _ in range(num_persons):
-            gender = random.choice(["M", "F", "U"])
-            if gender == "F":
-                first = random.choice(FIRST_NAMES_F)
-                honorific = random.choice(HONORIFICS_F)
-            else:
-                first = random.choice(FIRST_NAMES_M)
-                honorific = random.choice(HONORIFICS_M)
-            last = random.choice(LAST_NAMES)
-
-            person = Person.objects.create(
-                first_name=first,
-                last_name=last,
-                given_name=f"{first} {last}",
-                honorific=honorific,
-                gender=gender,
-                occupation=random.choice(OCCUPATIONS) if random.random() < 0.6 else "",
-                citizenship="Venetian"
-                if random.random() < 0.7
-                else random.choice(
-                    ["Paduan", "Brescian", "Friulian", "Greek", "Ottoman", "German"]
-                ),
-                notes=TAG + "auto-generated person",
+    def num_persons(self, count):
+        # Ensure enough people to reuse
+        return max(int(count * self.profile["persons_per_crime"]), 100)
+
+    def prepare_pools(self, locations, weapons, persons):
+        """Precompute the weighted draws build_crime makes for every crime."""
+        profile = self.profile
+        self.location_weights = None
+        if profile["location_skew"]:
+            self.location_weights = zipf_cum_weights(
+                len(locations), profile["location_skew"]
             )
+
+        self.offenders = persons[
+            : max(1, int(len(persons) * profile["repeat_offenders"]))
+        ]
+        self.offender_weights = zipf_cum_weights(
+            len(self.offenders), profile["offender_skew"]
+        )
+
+        self.weapons_by_category = {}
+        for weapon in weapons:
+            self.weapons_by_category.setdefault(weapon.weapon_category, []).append(
+                weapon
+            )
+        mix = profile["weapon_mix"] or {}
+        self.weapon_mix = [
+            (category, weight)
+            for category, weight in mix.items()
+            if category in self.weapons_by_category
+        ]
+
+    def pick_weapon(self, weapons):
+        rng = self.rng
+        if not self.weapon_mix:
+            return rng.choice(weapons)
+        categories, weights = zip(*self.weapon_mix, strict=True)
+        category = rng.choices(categories, weights)[0]
+        return rng.choice(self.weapons_by_category[category])
+
+    def build_date(self):
+        """Return (date, year, month, day) honouring the profile's sparsity."""
+        rng = self.rng
+        profile = self.profile
+        year = rng.randint(1500, 1700)
+        month = rng.randint(1, 12)
+        day = rng.randint(1, 28)  # safe for all months
+
+        if profile["undated"] or profile["year_only"] or profile["year_month"]:
+            r = rng.random()
+            if r < profile["undated"]:
+                return None, "", "", ""
+            r -= profile["undated"]
+            if r < profile["year_only"]:
+                return None, str(year), "", ""
+            r -= profile["year_only"]
+            if r < profile["year_month"]:
+                return None, str(year), str(month), ""
+        return date(year, month, day), str(year), str(month), str(day)
+
+    def build_crime(self, i, locations, weapons, persons):
+        """Return an unsaved Crime plus its (victims, perpetrators, weapons)."""
+        rng = self.rng
+        profile = self.profile
+        crime_date, year, month, day = self.build_date()
+
+        crime_type = rng.choice(CRIME_TYPES)
+        offense = rng.choice(OFFENSE_CATEGORIES)
+        is_fatal = offense in ("homicide", "premeditated_homicide") or (
+            rng.random() < 0.15
+        )
+
+        if self.location_weights:
+            location = rng.choices(locations, cum_weights=self.location_weights)[0]
+        else:
+            location = rng.choice(locations)
+
+        crime = Crime(
+            number=f"TEST-{i + 1:05d}",
+            crime=crime_type,
+            offense_category=offense,
+            date=crime_date,
+            year=year,
+            month=month,
+            day=day,
+            time_of_day=rng.choice(TIMES_OF_DAY) if rng.random() < 0.5 else "",
+            address=location,
+            fatality=is_fatal,
+            violence_caused_death=is_fatal,
+            court=rng.choice(COURTS) if rng.random() < 0.5 else "",
+            sestiere=location.sestiere,
+            source=TAG + "auto-generated crime",
+            convicted=rng.random() < 0.3,
+            pardoned=rng.random() < 0.1,
+        )
+
+        crime_weapons = []
+        if rng.random() < profile["armed"]:
+            crime_weapons.append(self.pick_weapon(weapons))
+            if profile["extra_weapon"] and rng.random() < profile["extra_weapon"]:
+                crime_weapons = distinct(crime_weapons + [self.pick_weapon(weapons)])
+
+        # 1–3 victims, 1–2 perpetrators
+        num_victims = rng.randint(1, 3)
+        victims = rng.sample(persons, min(num_victims, len(persons)))
+        num_perps = rng.randint(1, 2)
+        if profile["repeat_share"] and rng.random() < profile["repeat_share"]:
+            perpetrators = distinct(
+                rng.choices(
+                    self.offenders, cum_weights=self.offender_weights, k=num_perps
+                )
+            )
+        else:
+            perpetrators = rng.sample(persons, min(num_perps, len(persons)))
+
+        return crime, victims, perpetrators, crime_weapons
+
+    # ── Row-by-row mode ──────────────────────────────────────────────────
+
+    def generate_data(self, count):
+        self.stdout.write(f"Generating {count} test crimes...")
+
+        cities = self.get_cities()
+
+        locations = []
+        for city in cities:
+            for location in self.build_locations(city):
+                try:
+                    with transaction.atomic():
+                        location.save()
+                    locations.append(location)
+                except IntegrityError:
+                    # Unique constraint violation — skip duplicate
+                    pass
+        self.stdout.write(f"  {len(locations)} locations created")
+
+        weapons = self.get_weapons()
+
+        persons = []
+        for _ in range(self.num_persons(count)):
+            person = self.build_person()
+            person.save()
             persons.append(person)
         self.stdout.write(f"  {len(persons)} persons created")
 
-        # ── Crimes ───────────────────────────────────────────────────────
+        self.prepare_pools(locations, weapons, persons)
+
         created = 0
         for i in range(count):
-            year = random.randint(1500, 1700)
-            month = random.randint(1, 12)
-            day = random.randint(1, 28)  # safe for all months
-            crime_date = date(year, month, day)
-
-            crime_type = random.choice(CRIME_TYPES)
-            offense = random.choice(OFFENSE_CATEGORIES)
-            is_fatal = offense in ("homicide", "premeditated_homicide") or (
-                random.random() < 0.15
+            crime, victims, perpetrators, crime_weapons = self.build_crime(
+                i, locations, weapons, persons
             )
+            crime.save()
+            if crime_weapons:
+                crime.weapon.set(crime_weapons)
+            crime.victim.set(victims)
+            crime.perpetrator.set(perpetrators)
+            created += 1
 
-            location = random.choice(locations)
-
-            crime = Crime.objects.create(
-                number=f"TEST-{i + 1:05d}",
-                crime=crime_type,
-                offense_category=offense,
-                date=crime_date,
-                year=str(year),
-                month=str(month),
-                day=str(day),
-                time_of_day=random.choice(TIMES_OF_DAY)
-                if random.random() < 0.5
-                else "",
-                weapon=random.choice(weapons) if random.random() < 0.7 else None,
-                address=location,
-                fatality=is_fatal,
-                violence_caused_death=is_fatal,
-                court=random.choice(COURTS) if random.random() < 0.5 else "",
-                sestiere=location.sestiere,
-                source=TAG + "auto-generated crime",
-                convicted=random.random() < 0.3,
-                pardoned=random.random() < 0.1,
-            )
+        self.report_done(created, locations, cities)
 
-            # Add 1–3 victims
-            num_victims = random.randint(1, 3)
-            crime.victim.set(random.sample(persons, min(num_victims, len(persons))))
+    # ── Bulk mode ────────────────────────────────────────────────────────
 
-            # Add 1–2 perpetrators
-            num_perps = random.randint(1, 2)
-            crime.perpetrator.set(random.sample(persons, min(num_perps, len(persons))))
+    def generate_bulk(self, count, batch_size):
+        self.stdout.write(f"Generating {count} test crimes in bulk...")
 
-            created += 1
+        with transaction.atomic():
+            cities = self.get_cities()
+
+            # Drop in-memory duplicates and anything clashing with existing
+            # rows up front, since bulk_create can't skip rows individually
+            taken = set(
+                Location.objects.filter(city__in=cities)
+                .exclude(category_of_space="")
+                .exclude(description_of_location="")
+                .values_list("city_id", "category_of_space", "description_of_location")
+            )
+            new_locations = []
+            for city in cities:
+                for location in self.build_locations(city):
+                    key = (
+                        city.pk,
+                        location.category_of_space,
+                        location.description_of_location,
+                    )
+                    if key not in taken:
+                        taken.add(key)
+                        new_locations.append(location)
+            locations = Location.objects.bulk_create(new_locations)
+            self.stdout.write(f"  {len(locations)} locations created")
 
+            weapons = self.get_weapons()
+
+            persons = Person.objects.bulk_create(
+                [self.build_person() for _ in range(self.num_persons(count))],
+                batch_size=batch_size,
+            )
+            self.stdout.write(f"  {len(persons)} persons created")
+
+            self.prepare_pools(locations, weapons, persons)
+
+            VictimLink = Crime.victim.through
+            PerpetratorLink = Crime.perpetrator.through
+            WeaponLink = Crime.weapon.through
+
+            created = 0
+            for start in range(0, count, batch_size):
+                batch = [
+                    self.build_crime(i, locations, weapons, persons)
+                    for i in range(start, min(start + batch_size, count))
+                ]
+                Crime.objects.bulk_create([crime for crime, *_ in batch])
+
+                victim_links, perp_links, weapon_links = [], [], []
+                for crime, victims, perpetrators, crime_weapons in batch:
+                    victim_links += [
+                        VictimLink(crime_id=crime.pk, person_id=p.pk) for p in victims
+                    ]
+                    perp_links += [
+                        PerpetratorLink(crime_id=crime.pk, person_id=p.pk)
+                        for p in perpetrators
+                    ]
+                    weapon_links += [
+                        WeaponLink(crime_id=crime.pk, weapon_id=w.pk)
+                        for w in crime_weapons
+                    ]
+                VictimLink.objects.bulk_create(victim_links, batch_size=batch_size)
+                PerpetratorLink.objects.bulk_create(perp_links, batch_size=batch_size)
+                WeaponLink.objects.bulk_create(weapon_links, batch_size=batch_size)
+
+                created += len(batch)
+                self.stdout.write(f"  {created}/{count} crimes")
+
+            # The through rows were written without signals, so build the
+            # derived tables in one pass each
+            links = related.rebuild()
+            self.stdout.write(f"  {links} related-crime links indexed")
+            edges = network.rebuild()
+            self.stdout.write(f"  {edges} person network edges indexed")
+            people = summaries.rebuild()
+            self.stdout.write(f"  {people} person summaries built")
+            offenders = summaries.update_repeat_offenders()
+            self.stdout.write(f"  {offenders} repeat offenders flagged")
+            timeline.invalidate()
+
+        self.report_done(created, locations, cities)
+
+    def report_done(self, created, locations, cities):
         self.stdout.write(
             self.style.SUCCESS(
                 f"Done! Created {created} test crimes across "
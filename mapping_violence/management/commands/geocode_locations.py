@@ -0,0 +1,130 @@
+"""
+Geocode the addresses of locations that have no coordinates of their own.
+
+Usage:
+    uv run manage.py geocode_locations
+    uv run manage.py geocode_locations --backend fixture --limit 500
+    uv run manage.py geocode_locations --retry-misses
+
+Locations sharing an address are looked up once. Answers are stored in the
+geocoding cache (locations.GeocodeResult) and applied a batch at a time,
+so the command can be stopped and rerun: cached addresses, misses included,
+are not sent to the geocoder again unless --retry-misses is given.
+Lookups run on up to --workers threads, capped by the geocoder's own limit
+and spaced by its minimum delay; Nominatim allows one request a second.
+"""
+
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from locations import geocoding
+from locations.models import Location, update_effective_coordinates
+from mapping_violence import timeline
+
+
+class Command(BaseCommand):
+    help = "Geocode location addresses through the geocoding cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--backend",
+            help="Geocoder: nominatim, fixture or a dotted path (default: GEOCODER)",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            help="Look up at most this many addresses not yet in the cache",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Concurrent lookups, capped by the geocoder (default: 4)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Addresses looked up between saves (default: 100)",
+        )
+        parser.add_argument(
+            "--retry-misses",
+            action="store_true",
+            help="Look up again addresses the geocoder found nothing for",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        geocoder = geocoding.get_geocoder(options["backend"])
+
+        # address query -> ids of the locations at that address
+        pending = defaultdict(list)
+        locations = (
+            Location.objects.filter(address__isnull=False)
+            .exclude(address="")
+            .exclude(precision="precise")
+            .select_related("city")
+            .only("pk", "address", "city__name")
+            .order_by("pk")
+        )
+        for location in locations:
+            pending[geocoding.location_query(location)].append(location.pk)
+
+        known = geocoding.cached(geocoder, list(pending))
+        if options["retry_misses"]:
+            known = {q: c for q, c in known.items() if c is not None}
+        updated = self.apply(known, pending)
+
+        queries = [q for q in pending if q not in known][: options["limit"]]
+        workers = max(1, min(options["workers"], geocoder.max_workers))
+        limiter = geocoding.RateLimiter(geocoder.min_delay)
+        found = missed = errors = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for i in range(0, len(queries), options["batch_size"]):
+                batch = queries[i : i + options["batch_size"]]
+                futures = {
+                    q: pool.submit(geocoding.lookup, geocoder, q, limiter)
+                    for q in batch
+                }
+                answers = {}
+                for query, future in futures.items():
+                    try:
+                        answers[query] = future.result()
+                    except geocoding.GeocodingError as exc:
+                        errors += 1
+                        self.stderr.write(f"{query}: {exc}")
+                found += sum(1 for c in answers.values() if c)
+                missed += sum(1 for c in answers.values() if c is None)
+                with transaction.atomic():
+                    geocoding.store(geocoder, answers)
+                    updated += self.apply(answers, pending)
+                self.stdout.write(f"Looked up {i + len(batch)}/{len(queries)}")
+
+        if updated:
+            timeline.invalidate()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Geocoded {updated} locations with {geocoder.name} in "
+                f"{time.perf_counter() - start:.1f}s: {len(known)} addresses "
+                f"cached, {found} found, {missed} not found, {errors} errors, "
+                f"{len(pending) - len(known) - len(queries)} left"
+            )
+        )
+
+    def apply(self, answers, pending):
+        """Set the coordinates of the locations at each found address."""
+        ids = []
+        for query, coordinates in answers.items():
+            if coordinates:
+                latitude, longitude = coordinates
+                Location.objects.filter(pk__in=pending[query]).update(
+                    latitude=latitude, longitude=longitude
+                )
+                ids.extend(pending[query])
+        if ids:
+            update_effective_coordinates(Location.objects.filter(pk__in=ids))
+        return len(ids)
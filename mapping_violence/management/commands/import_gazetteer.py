@@ -0,0 +1,106 @@
+"""
+Load gazetteer places (parishes, sestieri, landmarks) from a local file.
+
+Usage:
+    uv run manage.py import_gazetteer places.csv --city Venice
+    uv run manage.py import_gazetteer parishes.geojson --city Venice
+
+A CSV needs name, kind, latitude and longitude columns and may have a city
+column; a GeoJSON FeatureCollection needs name and kind properties and may
+have city, with Point or (Multi)Polygon geometries, whose centroids are
+used. ``kind`` is landmark, parish or sestiere. Places already in the
+gazetteer under the same city, kind and normalized name are updated, so a
+file can be imported again after corrections. Run match_gazetteer
+afterwards to place locations.
+"""
+
+import time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from locations.gazetteer import KIND_RANK, normalize_name, read_places
+from locations.models import City, Location, Place, update_effective_coordinates
+from mapping_violence import timeline
+
+
+class Command(BaseCommand):
+    help = "Import gazetteer places from a CSV or GeoJSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or GeoJSON file of places")
+        parser.add_argument(
+            "--city",
+            help="City of places whose row or feature names none",
+        )
+        parser.add_argument(
+            "--source",
+            help="Source recorded on each place (default: the file name)",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        path = Path(options["path"])
+        if not path.exists():
+            raise CommandError(f"File not found: {path}")
+        source = options["source"] or path.name
+
+        try:
+            rows = list(read_places(path))
+        except (KeyError, ValueError) as exc:
+            raise CommandError(f"Could not read {path}: {exc}") from exc
+
+        names = {row["city"] or options["city"] for row in rows} - {None, ""}
+        cities = City.objects.in_bulk(names, field_name="name")
+        missing = names - set(cities)
+        if missing:
+            raise CommandError(f"Unknown cities: {', '.join(sorted(missing))}")
+
+        places = {}
+        for number, row in enumerate(rows, start=1):
+            city = cities.get(row["city"] or options["city"])
+            if city is None:
+                raise CommandError(f"Place {number} has no city; pass --city")
+            if row["kind"] not in KIND_RANK:
+                raise CommandError(
+                    f"Place {number} has kind {row['kind']!r}; expected one of "
+                    f"{', '.join(KIND_RANK)}"
+                )
+            normalized = normalize_name(row["name"])
+            if not normalized:
+                raise CommandError(f"Place {number} has no name")
+            try:
+                latitude = round(Decimal(str(row["latitude"])), 6)
+                longitude = round(Decimal(str(row["longitude"])), 6)
+            except (InvalidOperation, TypeError) as exc:
+                raise CommandError(f"Place {number} has bad coordinates") from exc
+            # Later rows win over earlier ones with the same key
+            places[city.pk, row["kind"], normalized] = Place(
+                city=city,
+                name=row["name"].strip(),
+                kind=row["kind"],
+                normalized_name=normalized,
+                latitude=latitude,
+                longitude=longitude,
+                source=source,
+            )
+
+        with transaction.atomic():
+            Place.objects.bulk_create(
+                places.values(),
+                update_conflicts=True,
+                unique_fields=["city", "kind", "normalized_name"],
+                update_fields=["name", "latitude", "longitude", "source"],
+            )
+            # Locations already matched to updated places move with them
+            update_effective_coordinates(Location.objects.filter(place__isnull=False))
+        timeline.invalidate()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {len(places)} places from {path.name} in "
+                f"{time.perf_counter() - start:.1f}s"
+            )
+        )
@@ -0,0 +1,87 @@
+"""
+Place locations without coordinates at their gazetteer parish, sestiere or
+landmark.
+
+Usage:
+    uv run manage.py match_gazetteer
+    uv run manage.py match_gazetteer --city Venice --rematch
+
+Each location's landmark, name, religious order and sestiere are matched,
+in that order, against the gazetteer places of its city by normalized
+name, and the first hit becomes its place. Locations with coordinates of
+their own are left alone. The map then shows matched locations at the
+place's centroid (precision "gazetteer") instead of the city centre.
+Runs in a fixed number of queries whatever the number of locations.
+"""
+
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from locations.gazetteer import MATCH_FIELDS, Gazetteer
+from locations.models import City, Location, update_effective_coordinates
+from mapping_violence import timeline
+
+
+class Command(BaseCommand):
+    help = "Match locations without coordinates to gazetteer places"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--city", help="Only match locations in this city")
+        parser.add_argument(
+            "--rematch",
+            action="store_true",
+            help="Also match locations that already have a place",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Rows per UPDATE batch (default: 2000)",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        locations = Location.objects.exclude(precision="precise").only(
+            "pk", "city", "place", *MATCH_FIELDS
+        )
+        if options["city"]:
+            city = City.objects.filter(name=options["city"]).first()
+            if city is None:
+                raise CommandError(f"Unknown city: {options['city']}")
+            locations = locations.filter(city=city)
+        if not options["rematch"]:
+            locations = locations.filter(place__isnull=True)
+        locations = list(locations)
+
+        gazetteer = Gazetteer.for_locations(locations)
+        changed = []
+        kinds = Counter()
+        for location in locations:
+            place = gazetteer.match(location)
+            if place is not None and place.pk != location.place_id:
+                location.place = place
+                changed.append(location)
+                kinds[place.kind] += 1
+
+        with transaction.atomic():
+            Location.objects.bulk_update(
+                changed, ["place"], batch_size=options["batch_size"]
+            )
+            if changed:
+                update_effective_coordinates(
+                    Location.objects.filter(place__isnull=False)
+                )
+        if changed:
+            timeline.invalidate()
+
+        by_kind = ", ".join(f"{n} by {kind}" for kind, n in kinds.most_common())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Matched {len(changed)} of {len(locations)} locations"
+                f"{f' ({by_kind})' if by_kind else ''} in "
+                f"{time.perf_counter() - start:.1f}s"
+            )
+        )
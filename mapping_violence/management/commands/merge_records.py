@@ -0,0 +1,55 @@
+"""
+Merge duplicate cities, locations, people or weapons into one record.
+
+Usage:
+    uv run manage.py merge_records person 12 34 35 --dry-run
+    uv run manage.py merge_records weapon 7 9
+
+The first id is the record kept; everything referring to the others is
+moved to it and they are deleted (see mapping_violence.merging). With
+--dry-run the merge is rolled back and only reported.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mapping_violence import merging
+
+MODELS = {model._meta.model_name: model for model in merging.MERGEABLE}
+
+
+class Command(BaseCommand):
+    help = "Merge duplicate records into the first one given"
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", choices=sorted(MODELS))
+        parser.add_argument("keep", type=int, help="Id of the record to keep")
+        parser.add_argument("duplicates", type=int, nargs="+", help="Ids to merge")
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would change without changing anything",
+        )
+
+    def handle(self, *args, **options):
+        model = MODELS[options["model"]]
+        records = model._default_manager.in_bulk(
+            [options["keep"], *options["duplicates"]]
+        )
+        missing = {options["keep"], *options["duplicates"]} - set(records)
+        if missing:
+            raise CommandError(
+                f"No {model._meta.verbose_name} with id "
+                f"{', '.join(map(str, sorted(missing)))}"
+            )
+
+        keep = records.pop(options["keep"])
+        report = merging.merge(keep, records.values(), dry_run=options["dry_run"])
+        for line in merging.describe(report):
+            self.stdout.write(f"  {line}")
+        verb = "Would merge" if options["dry_run"] else "Merged"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {report['deleted']} {model._meta.verbose_name_plural} "
+                f'into "{keep}"'
+            )
+        )
@@ -0,0 +1,30 @@
+"""
+Rebuild the person network from crimes, witnesses and relationships.
+
+Usage:
+    uv run manage.py rebuild_person_network
+
+The network is kept current by signals on crime participants, witnesses
+and person relationships, so this is only needed after loading data in
+ways that skip signals (raw SQL, or bulk_create on those tables).
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from mapping_violence import network
+
+
+class Command(BaseCommand):
+    help = "Rebuild the person co-occurrence network"
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rows = network.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Indexed {rows} person network edges "
+                f"in {time.perf_counter() - start:.1f}s"
+            )
+        )
@@ -0,0 +1,30 @@
+"""
+Rebuild the per-person summaries shown on profile pages.
+
+Usage:
+    uv run manage.py rebuild_person_summaries
+
+Summaries are kept current by signals on crimes, their victims,
+perpetrators, witnesses and weapons, so this is only needed after loading
+data in ways that skip signals (raw SQL, bulk_create or queryset
+update()) or after deleting weapons or locations.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from mapping_violence import summaries
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-person summaries"
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rows = summaries.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Summarized {rows} people in {time.perf_counter() - start:.1f}s"
+            )
+        )
@@ -0,0 +1,32 @@
+"""
+Rebuild the related-crimes index from the victim and perpetrator links.
+
+Usage:
+    uv run manage.py rebuild_related_crimes
+
+The index is kept current by signals on the victim and perpetrator M2Ms,
+so this is only needed after loading data in ways that skip signals
+(raw SQL or bulk_create on the through tables), after changing
+RELATED_CRIMES_PLACEHOLDER_NAMES or RELATED_CRIMES_MAX_PER_PERSON, or after
+renaming someone to or from a placeholder name.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from mapping_violence import related
+
+
+class Command(BaseCommand):
+    help = "Rebuild the related-crimes index"
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rows = related.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Indexed {rows} related-crime links "
+                f"in {time.perf_counter() - start:.1f}s"
+            )
+        )
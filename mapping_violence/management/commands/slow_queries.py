@@ -0,0 +1,115 @@
+"""
+Summarize the slow queries captured with SLOW_QUERY_MS.
+
+Usage:
+    uv run manage.py slow_queries
+    uv run manage.py slow_queries --top 20 --plans
+    uv run manage.py slow_queries --view locations_geojson --sort max
+
+Groups the entries in SLOW_QUERY_LOG by normalized fingerprint and ranks
+them by total time spent, so the queries worth an index come first. With
+--plans the EXPLAIN output of each query's slowest run is printed as well.
+"""
+
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SORT_KEYS = {
+    "total": lambda row: row["total_ms"],
+    "max": lambda row: row["max_ms"],
+    "count": lambda row: row["count"],
+}
+
+
+class Command(BaseCommand):
+    help = "Summarize captured slow queries by fingerprint"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--log",
+            default=settings.SLOW_QUERY_LOG,
+            help="Slow query log to read (default: SLOW_QUERY_LOG)",
+        )
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=10,
+            help="Number of queries to show (default: 10)",
+        )
+        parser.add_argument(
+            "--sort",
+            choices=sorted(SORT_KEYS),
+            default="total",
+            help="Rank by total time, slowest run or number of runs (default: total)",
+        )
+        parser.add_argument(
+            "--view",
+            help="Only include queries issued by this view",
+        )
+        parser.add_argument(
+            "--plans",
+            action="store_true",
+            help="Print the EXPLAIN output of each query's slowest run",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["log"])
+        if not path.exists():
+            raise CommandError(
+                f"{path} does not exist. Set SLOW_QUERY_MS to start capturing."
+            )
+
+        queries = {}
+        entries = 0
+        for line in path.read_text().splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if options["view"] and entry["view"] != options["view"]:
+                continue
+            entries += 1
+            row = queries.setdefault(
+                entry["fingerprint"],
+                {
+                    "fingerprint": entry["fingerprint"],
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "views": set(),
+                    "slowest": entry,
+                },
+            )
+            row["count"] += 1
+            row["total_ms"] += entry["ms"]
+            row["views"].add(entry["view"])
+            if entry["ms"] >= row["max_ms"]:
+                row["max_ms"] = entry["ms"]
+                row["slowest"] = entry
+
+        if not queries:
+            self.stdout.write("No slow queries recorded.")
+            return
+
+        ranked = sorted(queries.values(), key=SORT_KEYS[options["sort"]], reverse=True)
+        self.stdout.write(
+            f"{entries} slow queries, {len(queries)} distinct, from {path}\n"
+        )
+        self.stdout.write(
+            f"{'#':>3} {'count':>6} {'total ms':>10} {'mean ms':>9} {'max ms':>9}  views"
+        )
+        for rank, row in enumerate(ranked[: options["top"]], start=1):
+            self.stdout.write(
+                f"{rank:>3} {row['count']:>6} {row['total_ms']:>10.1f} "
+                f"{row['total_ms'] / row['count']:>9.1f} {row['max_ms']:>9.1f}  "
+                + ", ".join(sorted(row["views"]))
+            )
+            self.stdout.write(f"    {row['fingerprint'][:200]}")
+            if options["plans"]:
+                self.stdout.write("    plan:")
+                for line in row["slowest"]["plan"].splitlines():
+                    self.stdout.write(f"      {line}")
+            self.stdout.write("")
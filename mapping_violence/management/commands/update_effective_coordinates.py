@@ -0,0 +1,39 @@
+"""
+Recompute the coordinates the map uses for every location.
+
+Usage:
+    uv run manage.py update_effective_coordinates
+
+Each location stores its own coordinates or, failing that, those of the
+gazetteer place it was matched to, or else its city's, with where they
+came from. Saving a location, place or city keeps them current, so this
+is only needed after changing coordinates or place links with raw SQL,
+queryset update() or bulk_create.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from locations.models import Location, update_effective_coordinates
+
+
+class Command(BaseCommand):
+    help = "Recompute the effective coordinates of every location"
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rows = update_effective_coordinates()
+        by_precision = dict(
+            Location.objects.values_list("precision").annotate(n=Count("pk")).order_by()
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Updated {rows} locations in {time.perf_counter() - start:.1f}s: "
+                f"{by_precision.get('precise', 0)} with their own coordinates, "
+                f"{by_precision.get('gazetteer', 0)} at a gazetteer place's, "
+                f"{by_precision.get('city', 0)} at their city's, "
+                f"{by_precision.get('', 0)} without"
+            )
+        )
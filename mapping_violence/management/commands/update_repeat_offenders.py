@@ -0,0 +1,32 @@
+"""
+Recompute the repeat offender flag on every person.
+
+Usage:
+    uv run manage.py update_repeat_offenders
+
+The flag is kept current by signals on crime perpetrators, so this is only
+needed after loading data in ways that skip signals (raw SQL, bulk_create
+or queryset update()) or after changing REPEAT_OFFENDER_MIN_CRIMES.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mapping_violence import summaries
+
+
+class Command(BaseCommand):
+    help = "Recompute Person.repeat_offender from perpetrator counts"
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        changed = summaries.update_repeat_offenders()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Updated {changed} people (threshold "
+                f"{settings.REPEAT_OFFENDER_MIN_CRIMES} crimes) in "
+                f"{time.perf_counter() - start:.1f}s"
+            )
+        )
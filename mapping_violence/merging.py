@@ -0,0 +1,201 @@
+"""
+Merging duplicate records.
+
+``merge(keep, duplicates)`` points everything that refers to the
+duplicates at ``keep`` and deletes them, in one transaction. The relations
+are found from the model's _meta: every foreign key to it, including the
+columns of many-to-many through tables, is repointed with one UPDATE.
+Rows that would then break a unique constraint (a crime linked to both the
+kept and a duplicate victim, two locations with the same description in
+merged cities) are merged into the row they collide with instead, which
+for tables nothing refers to, like through tables, means deleting them.
+Rows linking two of the merged records to each other (a relationship
+between two duplicate people, their network edge) would link ``keep`` to
+itself, and are deleted first.
+
+``dry_run=True`` runs the same merge and rolls it back, so the report is
+exactly what a real merge would do. Derived data (person summaries,
+network, related crimes, repeat offender flags, effective coordinates and
+the cached timeline) is refreshed for what changed.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, UniqueConstraint
+from django.db.models.functions import Coalesce
+
+from locations.models import City, Location, Place, update_effective_coordinates
+from mapping_violence import network, related, summaries, timeline
+from mapping_violence.models import Crime, Person, Weapon
+
+
+class Rollback(Exception):
+    """Raised to roll back a dry run."""
+
+
+def relations(model):
+    """Foreign keys pointing at ``model``, through tables included, as
+    (related model, field name)."""
+    return [
+        (rel.related_model, rel.field.name)
+        for rel in model._meta.get_fields(include_hidden=True)
+        if rel.auto_created and not rel.concrete and (rel.one_to_many or rel.one_to_one)
+    ]
+
+
+def unique_sets(model, field):
+    """(field names, condition) of the unique constraints of ``model`` that
+    include ``field``."""
+    sets = [(tuple(fields), None) for fields in model._meta.unique_together]
+    sets += [
+        (constraint.fields, constraint.condition)
+        for constraint in model._meta.constraints
+        if isinstance(constraint, UniqueConstraint) and constraint.fields
+    ]
+    if model._meta.get_field(field).unique:
+        sets.append(((field,), None))
+    return [(fields, condition) for fields, condition in sets if field in fields]
+
+
+def pair_fields(model, field):
+    """The other foreign keys of ``model`` to the same model as ``field``,
+    which together with it make the row a link between two records."""
+    target = model._meta.get_field(field).related_model
+    return [
+        other.name
+        for other in model._meta.concrete_fields
+        if other.is_relation and other.related_model is target and other.name != field
+    ]
+
+
+def conflicts(model, field, keep, dup_ids):
+    """{row pk: pk of the row it merges into} for rows of ``model`` pointing
+    at the duplicates that would collide once repointed at ``keep``: with a
+    row of ``keep``'s or, failing that, an earlier one of another duplicate."""
+    manager = model._default_manager
+    into = {}
+    for fields, condition in unique_sets(model, field):
+        scope = manager.filter(condition) if condition else manager.all()
+        same = {name: OuterRef(name) for name in fields if name != field}
+        kept = scope.filter(**{field: keep.pk}, **same).order_by("pk")
+        earlier = scope.filter(
+            **{f"{field}__in": dup_ids}, pk__lt=OuterRef("pk"), **same
+        ).order_by("pk")
+        rows = (
+            scope.filter(**{f"{field}__in": dup_ids})
+            .annotate(
+                into=Coalesce(
+                    Subquery(kept.values("pk")[:1]), Subquery(earlier.values("pk")[:1])
+                )
+            )
+            .filter(into__isnull=False)
+        )
+        for pk, target in rows.values_list("pk", "into"):
+            into.setdefault(pk, target)
+
+    # An earlier duplicate's row may itself merge into one of keep's
+    for pk, target in into.items():
+        while target in into:
+            target = into[target]
+        into[pk] = target
+    return into
+
+
+def _merge(keep, dup_ids, report, touched):
+    model = type(keep)
+    touched[model].add(keep.pk)
+    for related_model, field in relations(model):
+        label = f"{related_model._meta.label}.{field}"
+        manager = related_model._default_manager
+        # Links between the merged records would become self-links
+        linked = 0
+        for other in pair_fields(related_model, field):
+            _, deleted = manager.filter(
+                **{f"{field}__in": dup_ids, f"{other}__in": [keep.pk, *dup_ids]}
+            ).delete()
+            linked += deleted.get(related_model._meta.label, 0)
+        into = conflicts(related_model, field, keep, dup_ids)
+        if into:
+            if relations(related_model):
+                by_target = defaultdict(list)
+                for pk, target in into.items():
+                    by_target[target].append(pk)
+                for target, pks in by_target.items():
+                    _merge(manager.get(pk=target), pks, report, touched)
+            else:
+                manager.filter(pk__in=into).delete()
+        moved = manager.filter(**{f"{field}__in": dup_ids}).update(**{field: keep.pk})
+        if moved or into or linked:
+            entry = report["relations"].setdefault(label, {"moved": 0, "merged": 0})
+            entry["moved"] += moved
+            entry["merged"] += len(into) + linked
+    model._default_manager.filter(pk__in=dup_ids).delete()
+    if model is type(report["keep"]):
+        report["deleted"] += len(dup_ids)
+
+
+def _people_of(crimes):
+    return set().union(*network.participants(crimes.values("pk")).values())
+
+
+def _refresh_people(person_ids):
+    related.refresh_persons(person_ids)
+    network.refresh_persons(person_ids)
+    summaries.refresh_persons(person_ids)
+    summaries.update_repeat_offenders(person_ids)
+
+
+# What to recompute after merging into the given ids of each model
+REFRESH = {
+    Person: _refresh_people,
+    Weapon: lambda ids: summaries.refresh_persons(
+        _people_of(Crime.objects.filter(weapon__in=ids))
+    ),
+    Location: lambda ids: summaries.refresh_persons(
+        _people_of(Crime.objects.filter(address__in=ids))
+    ),
+    City: lambda ids: update_effective_coordinates(
+        Location.objects.filter(city__in=ids)
+    ),
+    Place: lambda ids: update_effective_coordinates(
+        Location.objects.filter(place__in=ids)
+    ),
+}
+
+MERGEABLE = (City, Location, Person, Weapon)
+
+
+def merge(keep, duplicates, dry_run=False):
+    """Merge ``duplicates`` into ``keep``; return a report of
+    {"keep", "deleted", "relations": {label: {"moved", "merged"}}}."""
+    model = type(keep)
+    duplicates = list(duplicates)
+    dup_ids = [obj.pk for obj in duplicates if obj.pk != keep.pk]
+    if any(type(obj) is not model for obj in duplicates):
+        raise ValueError(f"Can only merge {model.__name__} records together")
+
+    report = {"keep": keep, "deleted": 0, "relations": {}}
+    touched = defaultdict(set)
+    try:
+        with transaction.atomic():
+            if dup_ids:
+                _merge(keep, dup_ids, report, touched)
+                for touched_model, ids in touched.items():
+                    if touched_model in REFRESH:
+                        REFRESH[touched_model](ids)
+            if dry_run:
+                raise Rollback
+    except Rollback:
+        return report
+    if touched.keys() & {City, Location, Place}:
+        timeline.invalidate()
+    return report
+
+
+def describe(report):
+    """One line per relation of a merge report."""
+    return [
+        f"{label}: {entry['moved']} moved, {entry['merged']} merged"
+        for label, entry in sorted(report["relations"].items())
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def rebuild_related_crimes(apps, schema_editor):
+    # Index the crimes existing people already link; signals keep it current
+    # from here on. This uses the current models through
+    # mapping_violence.related, like manage.py rebuild_related_crimes.
+    from mapping_violence import related
+
+    related.rebuild()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        (
+            "mapping_violence",
+            "0020_convert_weapon_fk_to_m2m_and_remove_weapon_category",
+        ),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RelatedCrime",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "crime_role",
+                    models.CharField(
+                        choices=[
+                            ("victim", "Victim"),
+                            ("perpetrator", "Perpetrator"),
+                            ("both", "Victim and perpetrator"),
+                        ],
+                        max_length=11,
+                    ),
+                ),
+                (
+                    "related_role",
+                    models.CharField(
+                        choices=[
+                            ("victim", "Victim"),
+                            ("perpetrator", "Perpetrator"),
+                            ("both", "Victim and perpetrator"),
+                        ],
+                        max_length=11,
+                    ),
+                ),
+                (
+                    "shared_count",
+                    models.PositiveIntegerField(
+                        default=1,
+                        help_text="Number of people the two crimes have in common",
+                    ),
+                ),
+                (
+                    "crime",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="related_crime_links",
+                        to="mapping_violence.crime",
+                    ),
+                ),
+                (
+                    "person",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="mapping_violence.person",
+                    ),
+                ),
+                (
+                    "related",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="mapping_violence.crime",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["crime", "-shared_count"], name="related_crime_rank_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("crime", "related", "person"),
+                        name="unique_related_crime_person",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(rebuild_related_crimes, migrations.RunPython.noop),
+    ]
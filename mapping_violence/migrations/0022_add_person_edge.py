@@ -0,0 +1,103 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def rebuild_person_network(apps, schema_editor):
+    # Link the people existing crimes and relationships already connect;
+    # signals keep the edges current from here on. This uses the current
+    # models through mapping_violence.network, like rebuild_person_network.
+    from mapping_violence import network
+
+    network.rebuild()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("mapping_violence", "0021_add_related_crime"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PersonEdge",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "victim",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Crimes in which both were victims"
+                    ),
+                ),
+                (
+                    "perpetrator",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Crimes in which both were perpetrators"
+                    ),
+                ),
+                (
+                    "opposed",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="Crimes in which one was a victim and the other a perpetrator",
+                    ),
+                ),
+                (
+                    "witness",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="Shared crimes in which either was a witness",
+                    ),
+                ),
+                (
+                    "relation",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Recorded relationships between them"
+                    ),
+                ),
+                (
+                    "weight",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Shared crimes plus recorded relationships"
+                    ),
+                ),
+                (
+                    "source",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="network_edges",
+                        to="mapping_violence.person",
+                    ),
+                ),
+                (
+                    "target",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="mapping_violence.person",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["source", "-weight"], name="person_edge_weight_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("source", "target"), name="unique_person_edge"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(rebuild_person_network, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def rebuild_person_summaries(apps, schema_editor):
+    # Summarize every person already in a crime; signals keep summaries
+    # current from here on. This uses the current models through
+    # mapping_violence.summaries, like rebuild_person_summaries.
+    from mapping_violence import summaries
+
+    summaries.rebuild()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("mapping_violence", "0022_add_person_edge"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PersonSummary",
+            fields=[
+                (
+                    "person",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="summary",
+                        serialize=False,
+                        to="mapping_violence.person",
+                    ),
+                ),
+                (
+                    "crime_count",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="Crimes the person took part in, in any role",
+                    ),
+                ),
+                ("victim_count", models.PositiveIntegerField(default=0)),
+                ("perpetrator_count", models.PositiveIntegerField(default=0)),
+                ("witness_count", models.PositiveIntegerField(default=0)),
+                ("fatal_count", models.PositiveIntegerField(default=0)),
+                ("first_year", models.PositiveSmallIntegerField(blank=True, null=True)),
+                ("last_year", models.PositiveSmallIntegerField(blank=True, null=True)),
+                ("locations", models.JSONField(blank=True, default=list)),
+                ("weapons", models.JSONField(blank=True, default=list)),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name_plural": "Person summaries",
+            },
+        ),
+        migrations.RunPython(rebuild_person_summaries, migrations.RunPython.noop),
+    ]
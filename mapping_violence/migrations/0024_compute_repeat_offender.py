@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+def compute_repeat_offenders(apps, schema_editor):
+    # Replace the hand-maintained flags with values derived from
+    # perpetrator counts (see mapping_violence.summaries)
+    Crime = apps.get_model("mapping_violence", "Crime")
+    Person = apps.get_model("mapping_violence", "Person")
+    repeat = models.Exists(
+        Crime.perpetrator.through.objects.filter(person_id=models.OuterRef("pk"))
+        .values("person_id")
+        .annotate(n=models.Count("crime_id"))
+        .filter(n__gte=settings.REPEAT_OFFENDER_MIN_CRIMES)
+    )
+    Person.objects.update(repeat_offender=repeat)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("mapping_violence", "0023_add_person_summary"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="person",
+            name="repeat_offender",
+            field=models.BooleanField(
+                default=False,
+                editable=False,
+                help_text="Set automatically for perpetrators of REPEAT_OFFENDER_MIN_CRIMES or more crimes",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="person",
+            index=models.Index(
+                condition=models.Q(("repeat_offender", True)),
+                fields=["repeat_offender"],
+                name="person_repeat_offender_idx",
+            ),
+        ),
+        migrations.RunPython(compute_repeat_offenders, migrations.RunPython.noop),
+    ]
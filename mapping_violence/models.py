@@ -106,7 +106,11 @@ class Person(models.Model):
         verbose_name="Nationality/Ethnicity",
         help_text="Input nationality or ethnicity if recorded in the source, e.g. Ottoman, Jewish, Greek",
     )
-    repeat_offender = models.BooleanField(default=False)
+    repeat_offender = models.BooleanField(
+        default=False,
+        editable=False,
+        help_text="Set automatically for perpetrators of REPEAT_OFFENDER_MIN_CRIMES or more crimes",
+    )
     notes = models.TextField(null=True, blank=True)
 
     class Meta:
@@ -114,6 +118,12 @@ class Person(models.Model):
         indexes = [
             models.Index(fields=["last_name", "first_name"], name="person_name_idx"),
             models.Index(fields=["given_name"], name="person_given_name_idx"),
+            # Repeat offenders are a small share of people; index only them
+            models.Index(
+                fields=["repeat_offender"],
+                condition=models.Q(repeat_offender=True),
+                name="person_repeat_offender_idx",
+            ),
         ]
 
     def __str__(self):
@@ -484,6 +494,125 @@ class CrimeImage(models.Model):
         return self.caption or f"Image for {self.crime}"
 
 
+class RelatedCrime(models.Model):
+    """Two crimes sharing a victim or perpetrator, one row per shared person.
+
+    Stored in both directions and kept up to date from the victim and
+    perpetrator M2M signals (see mapping_violence.related), so crime_detail
+    can rank related cases with one indexed query.
+    """
+
+    ROLE_CHOICES = [
+        ("victim", "Victim"),
+        ("perpetrator", "Perpetrator"),
+        ("both", "Victim and perpetrator"),
+    ]
+
+    crime = models.ForeignKey(
+        Crime, on_delete=models.CASCADE, related_name="related_crime_links"
+    )
+    related = models.ForeignKey(Crime, on_delete=models.CASCADE, related_name="+")
+    person = models.ForeignKey(Person, on_delete=models.CASCADE, related_name="+")
+    crime_role = models.CharField(max_length=11, choices=ROLE_CHOICES)
+    related_role = models.CharField(max_length=11, choices=ROLE_CHOICES)
+    shared_count = models.PositiveIntegerField(
+        default=1, help_text="Number of people the two crimes have in common"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("crime", "related", "person"),
+                name="unique_related_crime_person",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["crime", "-shared_count"], name="related_crime_rank_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.crime_id} -> {self.related_id} via {self.person_id}"
+
+
+class PersonEdge(models.Model):
+    """Two people linked by shared crimes or a recorded relationship.
+
+    Stored in both directions with the same counts and kept up to date by
+    signals (see mapping_violence.network), so a person's neighbours are
+    one indexed lookup.
+    """
+
+    source = models.ForeignKey(
+        Person, on_delete=models.CASCADE, related_name="network_edges"
+    )
+    target = models.ForeignKey(Person, on_delete=models.CASCADE, related_name="+")
+    victim = models.PositiveIntegerField(
+        default=0, help_text="Crimes in which both were victims"
+    )
+    perpetrator = models.PositiveIntegerField(
+        default=0, help_text="Crimes in which both were perpetrators"
+    )
+    opposed = models.PositiveIntegerField(
+        default=0,
+        help_text="Crimes in which one was a victim and the other a perpetrator",
+    )
+    witness = models.PositiveIntegerField(
+        default=0, help_text="Shared crimes in which either was a witness"
+    )
+    relation = models.PositiveIntegerField(
+        default=0, help_text="Recorded relationships between them"
+    )
+    weight = models.PositiveIntegerField(
+        default=0, help_text="Shared crimes plus recorded relationships"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("source", "target"), name="unique_person_edge"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["source", "-weight"], name="person_edge_weight_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.source_id} -> {self.target_id} ({self.weight})"
+
+
+class PersonSummary(models.Model):
+    """Precomputed statistics shown on a person's profile.
+
+    Kept up to date by signals on crimes, their participants and weapons
+    (see mapping_violence.summaries). Places and weapons are stored as
+    [id, crimes] pairs, most frequent first, and named when displayed.
+    """
+
+    person = models.OneToOneField(
+        Person, on_delete=models.CASCADE, primary_key=True, related_name="summary"
+    )
+    crime_count = models.PositiveIntegerField(
+        default=0, help_text="Crimes the person took part in, in any role"
+    )
+    victim_count = models.PositiveIntegerField(default=0)
+    perpetrator_count = models.PositiveIntegerField(default=0)
+    witness_count = models.PositiveIntegerField(default=0)
+    fatal_count = models.PositiveIntegerField(default=0)
+    first_year = models.PositiveSmallIntegerField(null=True, blank=True)
+    last_year = models.PositiveSmallIntegerField(null=True, blank=True)
+    locations = models.JSONField(default=list, blank=True)
+    weapons = models.JSONField(default=list, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Person summaries"
+
+    def __str__(self):
+        return f"Summary for {self.person}"
+
+
 class PersonRelationTypeManager(models.Manager):
     def get_by_natural_key(self, name):
         "natural key lookup, based on name"
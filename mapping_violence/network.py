@@ -0,0 +1,205 @@
+"""
+The person co-occurrence network.
+
+PersonEdge rows link two people who took part in the same crime (as
+victims, perpetrators or witnesses) or have a recorded PersonRelation,
+with counts per kind of link. Edges only depend on the crimes and
+relations of their two endpoints, so when someone's participation
+changes ``refresh_persons`` recomputes just that person's edges;
+``rebuild`` recreates the whole table.
+
+``neighborhood`` walks the stored edges breadth first, one query per
+level, and stops at PERSON_NETWORK_MAX_NODES people or
+PERSON_NETWORK_MAX_EDGES links so that hubs such as placeholder "unknown"
+persons can't blow up a response.
+"""
+
+from collections import Counter, defaultdict
+from itertools import combinations
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from mapping_violence.models import Crime, Person, PersonEdge, PersonRelation, Witness
+
+BATCH_SIZE = 5000
+
+KINDS = ("victim", "perpetrator", "opposed", "witness", "relation")
+
+
+def participants(crime_ids=None):
+    """Return {crime id: {person id: set of roles}}."""
+    by_crime = defaultdict(lambda: defaultdict(set))
+    sources = (
+        (Crime.victim.through.objects.values_list("crime_id", "person_id"), "victim"),
+        (
+            Crime.perpetrator.through.objects.values_list("crime_id", "person_id"),
+            "perpetrator",
+        ),
+        (
+            Witness.objects.filter(crime__isnull=False, name__isnull=False).values_list(
+                "crime_id", "name_id"
+            ),
+            "witness",
+        ),
+    )
+    for rows, role in sources:
+        if crime_ids is not None:
+            rows = rows.filter(crime_id__in=crime_ids)
+        for crime_id, person_id in rows:
+            by_crime[crime_id][person_id].add(role)
+    return by_crime
+
+
+def crimes_of(person_ids):
+    """Ids of the crimes ``person_ids`` took part in, in any role."""
+    return set(
+        Crime.victim.through.objects.filter(person_id__in=person_ids).values_list(
+            "crime_id", flat=True
+        )
+    ).union(
+        Crime.perpetrator.through.objects.filter(person_id__in=person_ids).values_list(
+            "crime_id", flat=True
+        ),
+        Witness.objects.filter(name_id__in=person_ids, crime__isnull=False).values_list(
+            "crime_id", flat=True
+        ),
+    )
+
+
+def kinds(roles, other_roles):
+    """How two people in the same crime are linked."""
+    if "witness" in roles or "witness" in other_roles:
+        return {"witness"}
+    found = set()
+    for role in roles:
+        for other in other_roles:
+            found.add(role if role == other else "opposed")
+    return found
+
+
+def tally(by_crime, person_ids=None):
+    """Count links per pair (smaller id first), optionally only pairs
+    involving ``person_ids``."""
+    pairs = defaultdict(Counter)
+    for people in by_crime.values():
+        for a, b in combinations(sorted(people), 2):
+            if person_ids is not None and a not in person_ids and b not in person_ids:
+                continue
+            counts = pairs[a, b]
+            counts["crimes"] += 1
+            for kind in kinds(people[a], people[b]):
+                counts[kind] += 1
+
+    relations = PersonRelation.objects.values_list("from_person_id", "to_person_id")
+    if person_ids is not None:
+        relations = relations.filter(
+            Q(from_person_id__in=person_ids) | Q(to_person_id__in=person_ids)
+        )
+    for a, b in relations:
+        pairs[min(a, b), max(a, b)]["relation"] += 1
+    return pairs
+
+
+def edges(pairs):
+    """PersonEdge rows in both directions for tallied pairs."""
+    for (a, b), counts in pairs.items():
+        values = {kind: counts[kind] for kind in KINDS}
+        values["weight"] = counts["crimes"] + counts["relation"]
+        yield PersonEdge(source_id=a, target_id=b, **values)
+        yield PersonEdge(source_id=b, target_id=a, **values)
+
+
+@transaction.atomic
+def refresh_persons(person_ids):
+    """Recompute every edge touching ``person_ids``."""
+    person_ids = set(person_ids)
+    PersonEdge.objects.filter(
+        Q(source_id__in=person_ids) | Q(target_id__in=person_ids)
+    ).delete()
+    pairs = tally(participants(crimes_of(person_ids)), person_ids)
+    PersonEdge.objects.bulk_create(edges(pairs), batch_size=BATCH_SIZE)
+
+
+@transaction.atomic
+def rebuild():
+    """Recreate the whole table; return the number of rows written."""
+    PersonEdge.objects.all().delete()
+    rows = list(edges(tally(participants())))
+    PersonEdge.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return len(rows)
+
+
+def neighborhood(person_id, depth=1, max_nodes=None, max_edges=None):
+    """Breadth-first walk of the network around one person.
+
+    Returns (nodes, edges, truncated): nodes as {"id", "label", "depth"}
+    dicts, edges between returned nodes once per pair, and whether a limit
+    cut the walk short. Neighbours are taken heaviest edge first, so a
+    truncated network keeps the strongest links.
+    """
+    max_nodes = max_nodes or settings.PERSON_NETWORK_MAX_NODES
+    max_edges = max_edges or settings.PERSON_NETWORK_MAX_EDGES
+    fields = ("source_id", "target_id", "weight", *KINDS)
+    depth_of = {person_id: 0}
+    found = {}
+    truncated = False
+
+    frontier = [person_id]
+    for level in range(1, depth + 1):
+        if not frontier:
+            break
+        # Links between two frontier people come back in both directions
+        limit = 2 * (max_edges - len(found))
+        rows = list(
+            PersonEdge.objects.filter(source_id__in=frontier)
+            .order_by("-weight", "source_id", "target_id")
+            .values(*fields)[:limit]
+        )
+        truncated |= len(rows) == limit
+        next_frontier = []
+        for row in rows:
+            target = row["target_id"]
+            if target not in depth_of:
+                if len(depth_of) >= max_nodes:
+                    truncated = True
+                    continue
+                depth_of[target] = level
+                next_frontier.append(target)
+            found[tuple(sorted((row["source_id"], target)))] = row
+            if len(found) >= max_edges:
+                break
+        frontier = next_frontier
+        if len(found) >= max_edges:
+            truncated = True
+            frontier = []
+            break
+
+    # Links among the outermost ring aren't seen by the walk
+    if frontier:
+        limit = max_edges - len(found)
+        rows = list(
+            PersonEdge.objects.filter(
+                source_id__in=frontier,
+                target_id__in=frontier,
+                source_id__lt=F("target_id"),
+            )
+            .order_by("-weight", "source_id", "target_id")
+            .values(*fields)[: limit + 1]
+        )
+        truncated |= len(rows) > limit
+        for row in rows[:limit]:
+            found[row["source_id"], row["target_id"]] = row
+
+    people = Person.objects.in_bulk(list(depth_of))
+    nodes = [
+        {"id": pk, "label": str(people[pk]), "depth": level}
+        for pk, level in sorted(depth_of.items(), key=lambda item: (item[1], item[0]))
+        if pk in people
+    ]
+    links = [
+        {"source": a, "target": b, **{f: row[f] for f in ("weight", *KINDS)}}
+        for (a, b), row in sorted(found.items())
+    ]
+    return nodes, links, truncated
@@ -0,0 +1,198 @@
+"""
+Sampling request profiler for production traffic.
+
+ProfilingMiddleware profiles a random PROFILING_SAMPLE_RATE share of
+requests. For each sampled request it records wall time, database time,
+query count, repeated query fingerprints (the signature of an N+1) and the
+size of the serialized response. Samples go into an in-process ring buffer
+of PROFILING_BUFFER_SIZE entries, shown on the staff-only performance page
+in the admin, and are logged to the ``mapping_violence.profiling`` logger
+(at WARNING when slower than PROFILING_SLOW_MS) so samples from every
+worker process end up in the logs.
+
+Unsampled requests only pay for one random() call. Queries run while a
+streaming response is consumed happen after the middleware returns and
+are not counted.
+"""
+
+import json
+import logging
+import random
+import re
+import statistics
+import time
+from collections import Counter, deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Repeated fingerprints kept per sample
+MAX_DUPLICATES = 5
+
+_samples = deque(maxlen=getattr(settings, "PROFILING_BUFFER_SIZE", 1000))
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+\b")
+_IN_LIST = re.compile(r"\(\s*%s(?:\s*,\s*%s)*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """Normalize SQL so queries differing only in parameters compare equal."""
+    sql = _STRING.sub("%s", sql)
+    sql = _NUMBER.sub("%s", sql)
+    sql = _IN_LIST.sub("(...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def samples():
+    """Return the buffered samples, oldest first."""
+    return list(_samples)
+
+
+def clear_samples():
+    _samples.clear()
+
+
+class QueryRecorder:
+    """Execute wrapper timing and fingerprinting every query of a request."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        self.record(request, response, recorder, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        # Database connections are per thread and the async ORM runs this
+        # request's queries in its thread-sensitive sync_to_async thread, so
+        # the wrapper has to be installed and removed from that thread
+        recorder = QueryRecorder()
+        wrapper = await sync_to_async(self.enter_wrapper)(recorder)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(wrapper.__exit__)(None, None, None)
+        self.record(request, response, recorder, time.perf_counter() - start)
+        return response
+
+    def enter_wrapper(self, recorder):
+        wrapper = connection.execute_wrapper(recorder)
+        wrapper.__enter__()
+        return wrapper
+
+    def sampled(self):
+        rate = getattr(settings, "PROFILING_SAMPLE_RATE", 0)
+        return rate > 0 and random.random() < rate
+
+    def record(self, request, response, recorder, seconds):
+        match = request.resolver_match
+        sample = {
+            "time": time.time(),
+            "view": match.view_name if match else request.path,
+            "path": request.path,
+            "method": request.method,
+            "status": response.status_code,
+            "ms": round(seconds * 1000, 2),
+            "db_ms": round(recorder.seconds * 1000, 2),
+            "queries": recorder.count,
+            "duplicates": [
+                [sql, n]
+                for sql, n in recorder.fingerprints.most_common(MAX_DUPLICATES)
+                if n > 1
+            ],
+            "bytes": None if response.streaming else len(response.content),
+        }
+        _samples.append(sample)
+
+        slow = sample["ms"] >= getattr(settings, "PROFILING_SLOW_MS", 1000)
+        logger.log(logging.WARNING if slow else logging.INFO, json.dumps(sample))
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summarize_endpoints(samples):
+    """Aggregate samples per view, slowest (by p95) first."""
+    by_view = {}
+    for sample in samples:
+        by_view.setdefault(sample["view"], []).append(sample)
+
+    rows = []
+    for view, group in by_view.items():
+        ms = [s["ms"] for s in group]
+        sizes = [s["bytes"] for s in group if s["bytes"] is not None]
+        rows.append(
+            {
+                "view": view,
+                "requests": len(group),
+                "p50_ms": _percentile(ms, 50),
+                "p95_ms": _percentile(ms, 95),
+                "max_ms": max(ms),
+                "db_ms": statistics.mean(s["db_ms"] for s in group),
+                "queries": statistics.mean(s["queries"] for s in group),
+                "max_queries": max(s["queries"] for s in group),
+                "kb": statistics.mean(sizes) / 1024 if sizes else None,
+            }
+        )
+    return sorted(rows, key=lambda row: row["p95_ms"], reverse=True)
+
+
+def summarize_duplicates(samples, limit=20):
+    """Repeated queries per view, most repeats within one request first."""
+    offenders = {}
+    for sample in samples:
+        for sql, n in sample["duplicates"]:
+            row = offenders.setdefault(
+                (sample["view"], sql),
+                {"view": sample["view"], "sql": sql, "max_repeats": 0, "requests": 0},
+            )
+            row["max_repeats"] = max(row["max_repeats"], n)
+            row["requests"] += 1
+    rows = sorted(
+        offenders.values(),
+        key=lambda row: (row["max_repeats"], row["requests"]),
+        reverse=True,
+    )
+    return rows[:limit]
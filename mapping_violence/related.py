@@ -0,0 +1,186 @@
+"""
+Maintenance of the RelatedCrime index.
+
+Rows link every pair of crimes that share a person, once per shared person
+and in both directions, with the number of people the pair shares copied
+onto each row for ranking. A change in who took part in a crime only
+affects the rows of the people added or removed, so ``refresh_persons``
+regenerates just those; ``rebuild`` recreates the whole table.
+
+Placeholder people (whose whole name is one of
+RELATED_CRIMES_PLACEHOLDER_NAMES, such as "unknown") don't link cases.
+Through anyone else, a crime links to at most RELATED_CRIMES_MAX_PER_PERSON
+of their other crimes, the nearest in date, so a prolific offender still
+connects their cases but adds rows linearly rather than quadratically.
+Which crimes are nearest is worked out when the person's rows are
+regenerated, so a changed crime date only takes effect then.
+"""
+
+from collections import defaultdict
+from datetime import date
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Concat, Lower, Trim
+
+from mapping_violence.models import Crime, Person, RelatedCrime
+
+BATCH_SIZE = 5000
+
+
+def participations(person_ids=None):
+    """Return {person id: {crime id: role}} from the victim and perpetrator M2Ms."""
+    by_person = defaultdict(dict)
+    for through, role in (
+        (Crime.victim.through, "victim"),
+        (Crime.perpetrator.through, "perpetrator"),
+    ):
+        links = through.objects.all()
+        if person_ids is not None:
+            links = links.filter(person_id__in=person_ids)
+        for crime_id, person_id in links.values_list("crime_id", "person_id"):
+            current = by_person[person_id].get(crime_id, role)
+            by_person[person_id][crime_id] = role if current == role else "both"
+    return by_person
+
+
+def placeholder_ids(person_ids=None):
+    """Ids of the people named only with a RELATED_CRIMES_PLACEHOLDER_NAMES name."""
+    names = [name.lower() for name in settings.RELATED_CRIMES_PLACEHOLDER_NAMES]
+    people = Person.objects.annotate(
+        full_name=Lower(Trim(Concat("first_name", Value(" "), "last_name")))
+    ).filter(full_name__in=names)
+    if person_ids is not None:
+        people = people.filter(pk__in=person_ids)
+    return set(people.values_list("pk", flat=True))
+
+
+def chronology(by_person):
+    """{person id: (crime ids in date order, {crime id: position})} for the
+    people in too many crimes for each to link to all the others."""
+    limit = settings.RELATED_CRIMES_MAX_PER_PERSON
+    prolific = {
+        person_id: crimes
+        for person_id, crimes in by_person.items()
+        if len(crimes) > limit + 1
+    }
+    if not prolific:
+        return {}
+    dates = dict(
+        Crime.objects.filter(pk__in=set().union(*prolific.values())).values_list(
+            "pk", "date"
+        )
+    )
+    order = {}
+    for person_id, crimes in prolific.items():
+        ordered = sorted(
+            crimes, key=lambda pk: (dates[pk] is None, dates[pk] or date.min, pk)
+        )
+        order[person_id] = (ordered, {pk: i for i, pk in enumerate(ordered)})
+    return order
+
+
+def linked_crimes(crime_id, crimes, order=None):
+    """The crimes ``crime_id`` links to through a person in ``crimes``: all
+    the others or, given the person's ``chronology``, the nearest in date.
+    Both are symmetric, so every pair is stored in both directions."""
+    if order is None:
+        return [pk for pk in crimes if pk != crime_id]
+    ordered, position = order
+    half = settings.RELATED_CRIMES_MAX_PER_PERSON // 2
+    i = position[crime_id]
+    return [pk for pk in ordered[max(0, i - half) : i + half + 1] if pk != crime_id]
+
+
+def update_shared_counts(crime_ids):
+    """Recount shared people for the pairs starting at ``crime_ids``."""
+    if not crime_ids:
+        return
+    shared = (
+        RelatedCrime.objects.filter(
+            crime=OuterRef("crime"), related=OuterRef("related")
+        )
+        .values("crime")
+        .annotate(n=Count("pk"))
+        .values("n")
+    )
+    RelatedCrime.objects.filter(crime_id__in=crime_ids).update(
+        shared_count=Subquery(shared)
+    )
+
+
+@transaction.atomic
+def refresh_persons(person_ids):
+    """Regenerate the rows of people whose crimes changed."""
+    person_ids = set(person_ids)
+    links = RelatedCrime.objects.filter(person_id__in=person_ids)
+    # Crimes the people were linked through before the change
+    affected = set(links.values_list("crime_id", flat=True).distinct())
+    links.delete()
+
+    by_person = participations(person_ids)
+    for person_id in placeholder_ids(person_ids):
+        affected.update(by_person.pop(person_id, ()))
+    order = chronology(by_person)
+
+    rows = []
+    for person_id, crimes in by_person.items():
+        affected.update(crimes)
+        rows += [
+            RelatedCrime(
+                crime_id=crime_id,
+                related_id=related_id,
+                person_id=person_id,
+                crime_role=crime_role,
+                related_role=crimes[related_id],
+            )
+            for crime_id, crime_role in crimes.items()
+            for related_id in linked_crimes(crime_id, crimes, order.get(person_id))
+        ]
+    RelatedCrime.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    update_shared_counts(affected)
+
+
+@transaction.atomic
+def rebuild():
+    """Recreate the whole table; return the number of rows written."""
+    RelatedCrime.objects.all().delete()
+
+    by_person = participations()
+    for person_id in placeholder_ids():
+        by_person.pop(person_id, None)
+    order = chronology(by_person)
+    by_crime = defaultdict(dict)
+    for person_id, crimes in by_person.items():
+        for crime_id, role in crimes.items():
+            by_crime[crime_id][person_id] = role
+
+    # Crime by crime, so shared counts are known before rows are written
+    # and only one crime's pairs are held in memory
+    total = 0
+    batch = []
+    for crime_id, persons in by_crime.items():
+        pairs = defaultdict(list)
+        for person_id, crime_role in persons.items():
+            crimes = by_person[person_id]
+            for related_id in linked_crimes(crime_id, crimes, order.get(person_id)):
+                pairs[related_id].append((person_id, crime_role, crimes[related_id]))
+        for related_id, shared in pairs.items():
+            batch += [
+                RelatedCrime(
+                    crime_id=crime_id,
+                    related_id=related_id,
+                    person_id=person_id,
+                    crime_role=crime_role,
+                    related_role=related_role,
+                    shared_count=len(shared),
+                )
+                for person_id, crime_role, related_role in shared
+            ]
+        if len(batch) >= BATCH_SIZE:
+            RelatedCrime.objects.bulk_create(batch)
+            total += len(batch)
+            batch = []
+    RelatedCrime.objects.bulk_create(batch, batch_size=BATCH_SIZE)
+    return total + len(batch)
@@ -7,6 +7,7 @@ from import_export.widgets import BooleanWidget
 
 from locations.models import City, Location
 
+from .metrics import ImportMetricsMixin
 from .models import Crime, Event, Person, Weapon
 
 
@@ -297,7 +298,7 @@ class HistoricalDateWidget(widgets.Widget):
         return value
 
 
-class CrimeResource(resources.ModelResource):
+class CrimeResource(ImportMetricsMixin, resources.ModelResource):
     """Import/Export resource for Crime model"""
 
     def __init__(self, user=None, **kwargs):
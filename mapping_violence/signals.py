@@ -0,0 +1,184 @@
+"""
+Signal receivers keeping derived tables in step with edits.
+"""
+
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from locations.models import City, Location, Place, update_effective_coordinates
+from mapping_violence import network, related, summaries, timeline
+from mapping_violence.models import Crime, Person, PersonRelation, RelatedCrime, Witness
+
+
+def _participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear":
+        # The cleared people are gone by post_clear, so note them now
+        if reverse:
+            instance._cleared_persons = [instance.pk]
+        else:
+            instance._cleared_persons = list(
+                sender.objects.filter(crime=instance).values_list(
+                    "person_id", flat=True
+                )
+            )
+        return
+    if action == "post_clear":
+        person_ids = getattr(instance, "_cleared_persons", [])
+    elif action in ("post_add", "post_remove"):
+        person_ids = [instance.pk] if reverse else pk_set
+    else:
+        return
+    if person_ids:
+        related.refresh_persons(person_ids)
+        network.refresh_persons(person_ids)
+        summaries.refresh_persons(person_ids)
+        if sender is Crime.perpetrator.through:
+            summaries.update_repeat_offenders(person_ids)
+
+
+m2m_changed.connect(
+    _participants_changed,
+    sender=Crime.victim.through,
+    dispatch_uid="related_crimes_victim",
+)
+m2m_changed.connect(
+    _participants_changed,
+    sender=Crime.perpetrator.through,
+    dispatch_uid="related_crimes_perpetrator",
+)
+
+
+@receiver(pre_delete, sender=Person, dispatch_uid="related_crimes_person_pre")
+def _person_pre_delete(sender, instance, **kwargs):
+    instance._related_crime_ids = list(
+        RelatedCrime.objects.filter(person=instance)
+        .values_list("crime_id", flat=True)
+        .distinct()
+    )
+
+
+@receiver(post_delete, sender=Person, dispatch_uid="related_crimes_person_post")
+def _person_post_delete(sender, instance, **kwargs):
+    # The person's rows went with the cascade; the pairs they shared with
+    # others now have one person fewer in common
+    related.update_shared_counts(getattr(instance, "_related_crime_ids", []))
+
+
+def _participants_of(crime_ids):
+    people = set()
+    for participants in network.participants(crime_ids).values():
+        people.update(participants)
+    return people
+
+
+@receiver(post_save, sender=Crime, dispatch_uid="person_summary_crime_save")
+def _crime_saved(sender, instance, created, raw, **kwargs):
+    # Year, fatality or place may have changed; a new crime has no
+    # participants yet
+    if not created and not raw:
+        summaries.refresh_persons(_participants_of([instance.pk]))
+
+
+@receiver(pre_delete, sender=Crime, dispatch_uid="person_network_crime_pre")
+def _crime_pre_delete(sender, instance, **kwargs):
+    # Participation rows go with the cascade without m2m_changed, and
+    # witnesses are detached with a plain UPDATE
+    instance._participant_ids = _participants_of([instance.pk])
+
+
+@receiver(post_delete, sender=Crime, dispatch_uid="person_network_crime_post")
+def _crime_post_delete(sender, instance, **kwargs):
+    person_ids = getattr(instance, "_participant_ids", None)
+    if person_ids:
+        network.refresh_persons(person_ids)
+        summaries.refresh_persons(person_ids)
+        summaries.update_repeat_offenders(person_ids)
+
+
+@receiver(
+    m2m_changed, sender=Crime.weapon.through, dispatch_uid="person_summary_weapon"
+)
+def _weapons_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        crime_ids = [instance.pk]
+    elif action == "pre_clear":
+        instance._cleared_crimes = list(
+            sender.objects.filter(weapon=instance).values_list("crime_id", flat=True)
+        )
+        return
+    elif action == "post_clear":
+        crime_ids = getattr(instance, "_cleared_crimes", [])
+    else:
+        crime_ids = pk_set
+    if action in ("post_add", "post_remove", "post_clear") and crime_ids:
+        summaries.refresh_persons(_participants_of(crime_ids))
+
+
+def _stash_endpoints(sender, instance, fields):
+    """Remember the people a row pointed to before it is saved."""
+    if instance.pk is None:
+        return []
+    return list(
+        sender.objects.filter(pk=instance.pk).values_list(*fields).first() or []
+    )
+
+
+@receiver(pre_save, sender=Witness, dispatch_uid="person_network_witness_pre")
+def _witness_pre_save(sender, instance, **kwargs):
+    instance._previous_people = _stash_endpoints(sender, instance, ["name_id"])
+
+
+@receiver(pre_save, sender=PersonRelation, dispatch_uid="person_network_relation_pre")
+def _relation_pre_save(sender, instance, **kwargs):
+    instance._previous_people = _stash_endpoints(
+        sender, instance, ["from_person_id", "to_person_id"]
+    )
+
+
+@receiver(post_save, sender=Witness, dispatch_uid="person_network_witness_save")
+@receiver(post_delete, sender=Witness, dispatch_uid="person_network_witness_delete")
+def _witness_changed(sender, instance, **kwargs):
+    person_ids = {instance.name_id, *getattr(instance, "_previous_people", [])}
+    person_ids.discard(None)
+    if person_ids:
+        network.refresh_persons(person_ids)
+        summaries.refresh_persons(person_ids)
+
+
+@receiver(post_save, sender=PersonRelation, dispatch_uid="person_network_relation_save")
+@receiver(
+    post_delete, sender=PersonRelation, dispatch_uid="person_network_relation_delete"
+)
+def _relation_changed(sender, instance, **kwargs):
+    network.refresh_persons(
+        {
+            instance.from_person_id,
+            instance.to_person_id,
+            *getattr(instance, "_previous_people", []),
+        }
+    )
+
+
+@receiver(post_save, sender=Crime, dispatch_uid="timeline_crime_save")
+@receiver(post_delete, sender=Crime, dispatch_uid="timeline_crime_delete")
+@receiver(post_save, sender=Location, dispatch_uid="timeline_location_save")
+@receiver(post_delete, sender=Location, dispatch_uid="timeline_location_delete")
+@receiver(post_save, sender=City, dispatch_uid="timeline_city_save")
+@receiver(post_save, sender=Place, dispatch_uid="timeline_place_save")
+@receiver(post_delete, sender=Place, dispatch_uid="timeline_place_delete")
+def _timeline_changed(sender, **kwargs):
+    timeline.invalidate()
+
+
+@receiver(post_delete, sender=Place, dispatch_uid="place_delete")
+def _place_deleted(sender, **kwargs):
+    # Its locations were unlinked with a queryset update, which skips save()
+    update_effective_coordinates(
+        Location.objects.filter(place__isnull=True, precision="gazetteer")
+    )
@@ -0,0 +1,134 @@
+"""
+Opt-in capture of slow SQL with EXPLAIN plans.
+
+When SLOW_QUERY_MS is above zero, every database connection gets an
+execute wrapper that times each statement. SELECTs slower than the
+threshold are re-run under EXPLAIN (EXPLAIN ANALYZE with
+SLOW_QUERY_EXPLAIN_ANALYZE, which executes the query a second time) and
+logged as one JSON object per line to the ``mapping_violence.slow_queries``
+logger: duration, normalized fingerprint, SQL, plan and the view that
+issued it. The logger writes to SLOW_QUERY_LOG, which
+``manage.py slow_queries`` summarizes.
+
+SlowQueryMiddleware only records which view is running; queries from
+management commands are logged with the command's name instead.
+"""
+
+import json
+import logging
+import sys
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from mapping_violence.profiling import fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Longest SQL text kept per record
+MAX_SQL_LENGTH = 5000
+
+current_view = ContextVar("current_view", default=None)
+_explaining = ContextVar("explaining", default=False)
+
+
+def origin():
+    view = current_view.get()
+    if view:
+        return view
+    if len(sys.argv) > 1 and sys.argv[0].endswith("manage.py"):
+        return f"manage.py {sys.argv[1]}"
+    return "unknown"
+
+
+def explain(connection, sql, params):
+    """Return the query plan for ``sql`` as text."""
+    options = {}
+    if settings.SLOW_QUERY_EXPLAIN_ANALYZE:
+        options["analyze"] = True
+    try:
+        prefix = connection.ops.explain_query_prefix(None, **options)
+    except ValueError:
+        # The backend doesn't support ANALYZE (e.g. SQLite)
+        prefix = connection.ops.explain_query_prefix(None)
+
+    token = _explaining.set(True)
+    try:
+        # A savepoint keeps a failed EXPLAIN from breaking the caller's
+        # transaction
+        with transaction.atomic(using=connection.alias), connection.cursor() as c:
+            c.execute(f"{prefix} {sql}", params)
+            rows = c.fetchall()
+    except DatabaseError as e:
+        return f"EXPLAIN failed: {e}"
+    finally:
+        _explaining.reset(token)
+    return "\n".join(str(row[-1]) for row in rows)
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    start = time.perf_counter()
+    # Only queries that succeed are recorded: after a failure PostgreSQL
+    # rejects further statements until the transaction is rolled back
+    result = execute(sql, params, many, context)
+    ms = (time.perf_counter() - start) * 1000
+    if (
+        ms >= settings.SLOW_QUERY_MS
+        and not many
+        and not _explaining.get()
+        and sql.lstrip()[:6].upper() in ("SELECT", "WITH")
+    ):
+        record(context["connection"], sql, params, ms)
+    return result
+
+
+def record(connection, sql, params, ms):
+    entry = {
+        "time": time.time(),
+        "ms": round(ms, 2),
+        "view": origin(),
+        "database": connection.alias,
+        "fingerprint": fingerprint(sql),
+        "sql": sql[:MAX_SQL_LENGTH],
+        "plan": explain(connection, sql, params),
+    }
+    logger.warning(json.dumps(entry))
+
+
+def install(sender, connection, **kwargs):
+    """connection_created receiver adding the wrapper to new connections."""
+    # Persistent connections reconnect on the same wrapper object
+    if slow_query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(slow_query_wrapper)
+
+
+class SlowQueryMiddleware:
+    """Remember which view is running so slow queries can be attributed."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        try:
+            return self.get_response(request)
+        finally:
+            current_view.set(None)
+
+    async def __acall__(self, request):
+        try:
+            return await self.get_response(request)
+        finally:
+            current_view.set(None)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current_view.set(request.resolver_match.view_name)
@@ -0,0 +1,190 @@
+"""
+Per-person summary statistics.
+
+A PersonSummary row holds what a profile needs: crimes by role, fatal
+crimes, the span of years, and where and with what weapons the crimes
+happened. ``refresh_persons`` recomputes the rows of given people from
+the crime links, and the receivers in mapping_violence.signals call it
+whenever those links or the crimes themselves change. ``rebuild``
+recreates every row; ``profile`` turns a summary into the dict served by
+the profile page and the JSON endpoint.
+
+``update_repeat_offenders`` derives Person.repeat_offender from
+perpetrator counts in a single UPDATE, for everyone or for the people
+whose perpetrator links just changed.
+"""
+
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
+
+from locations.models import Location
+from mapping_violence.models import Crime, Person, PersonSummary, Weapon, Witness
+
+BATCH_SIZE = 2000
+
+
+def crime_year(year, date):
+    """Year of a crime from its year field or, failing that, its date."""
+    year = (year or "").strip()
+    if year.isdigit():
+        return int(year)
+    return date.year if date else None
+
+
+def summarize(person_ids=None):
+    """Build unsaved PersonSummary objects for people with any crimes."""
+    links = (
+        (Crime.victim.through.objects.all(), "person_id", "victim"),
+        (Crime.perpetrator.through.objects.all(), "person_id", "perpetrator"),
+        (
+            Witness.objects.filter(crime__isnull=False, name__isnull=False),
+            "name_id",
+            "witness",
+        ),
+    )
+    by_person = defaultdict(lambda: defaultdict(set))
+    for rows, person_field, role in links:
+        if person_ids is not None:
+            rows = rows.filter(**{f"{person_field}__in": person_ids})
+        for person_id, crime_id in rows.values_list(person_field, "crime_id"):
+            by_person[person_id][role].add(crime_id)
+
+    crime_ids = None
+    if person_ids is not None:
+        crime_ids = set().union(
+            *(c for roles in by_person.values() for c in roles.values())
+        )
+    crimes = Crime.objects.values_list("pk", "fatality", "year", "date", "address_id")
+    weapon_links = Crime.weapon.through.objects.values_list("crime_id", "weapon_id")
+    if crime_ids is not None:
+        crimes = crimes.filter(pk__in=crime_ids)
+        weapon_links = weapon_links.filter(crime_id__in=crime_ids)
+    details = {
+        pk: (fatal, crime_year(year, date), address_id)
+        for pk, fatal, year, date, address_id in crimes
+    }
+    weapons_of = defaultdict(list)
+    for crime_id, weapon_id in weapon_links:
+        weapons_of[crime_id].append(weapon_id)
+
+    summaries = []
+    for person_id, roles in by_person.items():
+        ids = set().union(*roles.values())
+        years = [details[c][1] for c in ids if details[c][1] is not None]
+        locations = Counter(details[c][2] for c in ids if details[c][2])
+        weapons = Counter(w for c in ids for w in weapons_of[c])
+        summaries.append(
+            PersonSummary(
+                person_id=person_id,
+                crime_count=len(ids),
+                victim_count=len(roles["victim"]),
+                perpetrator_count=len(roles["perpetrator"]),
+                witness_count=len(roles["witness"]),
+                fatal_count=sum(1 for c in ids if details[c][0]),
+                first_year=min(years, default=None),
+                last_year=max(years, default=None),
+                locations=[list(item) for item in locations.most_common()],
+                weapons=[list(item) for item in weapons.most_common()],
+            )
+        )
+    return summaries
+
+
+@transaction.atomic
+def refresh_persons(person_ids):
+    """Recompute the summaries of ``person_ids``."""
+    person_ids = set(person_ids) - {None}
+    if not person_ids:
+        return
+    PersonSummary.objects.filter(person_id__in=person_ids).delete()
+    PersonSummary.objects.bulk_create(summarize(person_ids), batch_size=BATCH_SIZE)
+
+
+@transaction.atomic
+def rebuild():
+    """Recreate every summary; return the number written."""
+    PersonSummary.objects.all().delete()
+    return len(PersonSummary.objects.bulk_create(summarize(), batch_size=BATCH_SIZE))
+
+
+def repeat_offender_expression():
+    """True for a Person perpetrating REPEAT_OFFENDER_MIN_CRIMES or more crimes."""
+    return Exists(
+        Crime.perpetrator.through.objects.filter(person_id=OuterRef("pk"))
+        .values("person_id")
+        .annotate(n=Count("crime_id"))
+        .filter(n__gte=settings.REPEAT_OFFENDER_MIN_CRIMES)
+    )
+
+
+def update_repeat_offenders(person_ids=None):
+    """Recompute Person.repeat_offender; return the number of people changed."""
+    repeat = repeat_offender_expression()
+    # Only rows whose flag is wrong are written
+    people = Person.objects.exclude(repeat_offender=repeat)
+    if person_ids is not None:
+        people = people.filter(pk__in=person_ids)
+    return people.update(repeat_offender=repeat)
+
+
+def profile(person, limit=None):
+    """Profile data for a person, from their summary.
+
+    ``limit`` caps the locations and weapons listed; cities are totalled
+    over all locations.
+    """
+    summary = PersonSummary.objects.filter(person=person).first()
+    if summary is None:
+        summary = PersonSummary(person=person)
+
+    locations = Location.objects.select_related("city").in_bulk(
+        [pk for pk, _ in summary.locations]
+    )
+    cities = {}
+    for pk, n in summary.locations:
+        city = locations[pk].city if pk in locations else None
+        if city:
+            entry = cities.setdefault(city.pk, {"id": city.pk, "name": city.name})
+            entry["crimes"] = entry.get("crimes", 0) + n
+    weapons = Weapon.objects.in_bulk([pk for pk, _ in summary.weapons[:limit]])
+
+    return {
+        "id": person.pk,
+        "name": str(person),
+        "gender": person.get_gender_display(),
+        "occupation": person.occupation,
+        "repeat_offender": person.repeat_offender,
+        "crimes": {
+            "total": summary.crime_count,
+            "victim": summary.victim_count,
+            "perpetrator": summary.perpetrator_count,
+            "witness": summary.witness_count,
+            "fatal": summary.fatal_count,
+        },
+        "first_year": summary.first_year,
+        "last_year": summary.last_year,
+        "cities": sorted(cities.values(), key=lambda c: (-c["crimes"], c["name"])),
+        "locations": [
+            {
+                "id": pk,
+                "name": locations[pk].name,
+                "city": locations[pk].city.name if locations[pk].city else None,
+                "crimes": n,
+            }
+            for pk, n in summary.locations[:limit]
+            if pk in locations
+        ],
+        "weapons": [
+            {
+                "id": pk,
+                "name": weapons[pk].name,
+                "category": weapons[pk].get_weapon_category_display(),
+                "crimes": n,
+            }
+            for pk, n in summary.weapons[:limit]
+            if pk in weapons
+        ],
+    }
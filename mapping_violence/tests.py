@@ -1,3 +1,1225 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import shutil
+import tempfile
+import unittest
+from datetime import date
 
-# Create your tests here.
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from prometheus_client import REGISTRY
+from tablib import Dataset
+
+from locations.models import City, Location
+from mapping_violence import merging, network, profiling
+from mapping_violence.exports import parquet_available
+from mapping_violence.models import (
+    Crime,
+    Person,
+    PersonEdge,
+    PersonRelation,
+    PersonSummary,
+    RelatedCrime,
+    Weapon,
+    Witness,
+)
+from mapping_violence.resources import CrimeResource
+from mapping_violence.slow_queries import slow_query_wrapper
+
+
+class ExportTestCase(TestCase):
+    """Test cases for the bulk export formats"""
+
+    def setUp(self):
+        # Export views are rate limited per IP through the default cache
+        cache.clear()
+        self.city = City.objects.create(
+            name="Venice", country="Italy", latitude=45.4408, longitude=12.3155
+        )
+        self.location = Location.objects.create(
+            name="Campo San Polo", city=self.city, latitude=45.4380, longitude=12.3280
+        )
+        self.victim = Person.objects.create(
+            first_name="Angelo", last_name="Badoer", gender="M"
+        )
+        self.perpetrator = Person.objects.create(
+            first_name="Francesco", last_name="Badoer"
+        )
+        self.weapon = Weapon.objects.create(name="Dagger", weapon_category="blade")
+
+        self.crime = Crime.objects.create(
+            number="ABC-001",
+            crime="assault",
+            date=date(1542, 3, 15),
+            year="1542",
+            month="3",
+            day="15",
+            address=self.location,
+            fatality=True,
+        )
+        self.crime.victim.add(self.victim)
+        self.crime.perpetrator.add(self.perpetrator)
+        self.crime.weapon.add(self.weapon)
+
+        # An unlocated crime that the city filter should exclude
+        Crime.objects.create(number="ABC-002", crime="insult", year="1600")
+
+    def get_content(self, fmt, **params):
+        response = self.client.get(reverse("crime_export", kwargs={"fmt": fmt}), params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    async def test_csv_export_keeps_columns(self):
+        """Test that the CSV download keeps its human-readable columns"""
+        response = await self.async_client.get(reverse("crime_export_csv"))
+        content = b"".join([c async for c in response.streaming_content]).decode()
+        header, *rows = content.splitlines()
+
+        self.assertTrue(header.startswith("Case Number,Crime,Date,Year"))
+        # Where undated crimes sort depends on the database
+        row = next(row for row in rows if row.startswith("ABC-001,"))
+        self.assertIn("ABC-001,assault,1542-03-15,1542", row)
+
+    def test_jsonl_export_is_typed(self):
+        """Test that JSON Lines rows carry typed values"""
+        lines = self.get_content("jsonl", city=self.city.pk).decode().splitlines()
+
+        self.assertEqual(len(lines), 1)
+        record = json.loads(lines[0])
+        self.assertEqual(record["number"], "ABC-001")
+        self.assertEqual(record["year"], 1542)
+        self.assertIs(record["fatality"], True)
+        self.assertEqual(record["victims"], ["Angelo Badoer"])
+        self.assertEqual(record["weapons"], ["Dagger"])
+        self.assertAlmostEqual(record["latitude"], 45.438)
+
+    def test_geojson_export(self):
+        """Test that GeoJSON features carry a point or a null geometry"""
+        collection = json.loads(self.get_content("geojson"))
+
+        self.assertEqual(collection["type"], "FeatureCollection")
+        geometries = {
+            f["properties"]["number"]: f["geometry"] for f in collection["features"]
+        }
+        self.assertEqual(geometries["ABC-001"]["coordinates"], [12.328, 45.438])
+        self.assertIsNone(geometries["ABC-002"])
+
+    @unittest.skipUnless(parquet_available(), "pyarrow is not installed")
+    def test_parquet_export(self):
+        """Test that the Parquet download round-trips through pyarrow"""
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(io.BytesIO(self.get_content("parquet")))
+
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(str(table.schema.field("year").type), "int32")
+
+    def test_unknown_format(self):
+        """Test that unsupported formats return 404"""
+        response = self.client.get(reverse("crime_export", kwargs={"fmt": "xlsx"}))
+
+        self.assertEqual(response.status_code, 404)
+
+
+class ExportArtifactsTestCase(TestCase):
+    """Test cases for the pre-built full-dataset exports"""
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        Crime.objects.create(number="ABC-001", crime="assault", year="1542")
+
+    def build(self):
+        call_command("build_export_artifacts", "--format", "csv", stdout=io.StringIO())
+        cache.clear()
+        with open(f"{self.media_root}/exports/manifest.json") as fh:
+            return json.load(fh)
+
+    def test_build_and_serve(self):
+        """Test that unfiltered exports are served from the built files"""
+        with override_settings(MEDIA_ROOT=self.media_root):
+            manifest = self.build()
+            response = self.client.get(reverse("crime_export_csv"))
+            content = b"".join(response.streaming_content)
+            filtered = self.client.get(reverse("crime_export_csv"), {"year_from": 1500})
+
+        self.assertEqual(manifest["records"], 1)
+        self.assertEqual(len(manifest["files"]["csv"]["sha256"]), 64)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"ABC-001", content)
+        self.assertIn("attachment", response["Content-Disposition"])
+        self.assertEqual(filtered.status_code, 200)
+
+    def test_redirect_to_object_storage(self):
+        """Test that object storage downloads redirect to the build's file"""
+        with override_settings(MEDIA_ROOT=self.media_root, OBJ_STORAGE=True):
+            manifest = self.build()
+            response = self.client.get(reverse("crime_export_csv"))
+
+        self.assertRedirects(
+            response,
+            f"/media/exports/{manifest['build']}/mapping_violence_data.csv",
+            fetch_redirect_response=False,
+        )
+
+    def test_rebuild_keeps_previous_build(self):
+        """Test that a rebuild keeps the files of the build it replaces"""
+        with override_settings(MEDIA_ROOT=self.media_root):
+            builds = [self.build()["build"] for _ in range(3)]
+            kept, _ = default_storage.listdir("exports")
+
+        self.assertEqual(len(set(builds)), 3)
+        self.assertEqual(sorted(kept), builds[1:])
+
+    def test_no_artifacts_streams(self):
+        """Test that exports stream from the database until artifacts exist"""
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.client.get(reverse("crime_export_csv"))
+
+        self.assertEqual(response.status_code, 200)
+
+
+class PersonSearchTestCase(TestCase):
+    """Test cases for the person autocomplete endpoint"""
+
+    def setUp(self):
+        cache.clear()
+        city = City.objects.create(name="Venice")
+        location = Location.objects.create(name="Rialto", city=city)
+        self.city = city
+        self.badoer = Person.objects.create(first_name="Angelo", last_name="Badoer")
+        Person.objects.create(first_name="Marco", last_name="Badoer")
+        crime = Crime.objects.create(crime="assault", address=location)
+        crime.victim.add(self.badoer)
+
+    async def test_search(self):
+        """Test that matches are returned as value/text pairs"""
+        response = await self.async_client.get(reverse("person_search"), {"q": "bado"})
+
+        self.assertEqual(len(response.json()), 2)
+
+    async def test_search_scoped_to_city(self):
+        """Test that the city parameter limits results to people in its crimes"""
+        response = await self.async_client.get(
+            reverse("person_search"), {"q": "bado", "city": self.city.pk}
+        )
+
+        self.assertEqual(
+            response.json(), [{"value": str(self.badoer.pk), "text": "Angelo Badoer"}]
+        )
+
+    async def test_short_query(self):
+        """Test that queries under two characters return nothing"""
+        response = await self.async_client.get(reverse("person_search"), {"q": "b"})
+
+        self.assertEqual(response.json(), [])
+
+
+class BenchmarkViewsTestCase(TestCase):
+    """Test cases for the view benchmark harness"""
+
+    def test_budget_exceeded(self):
+        """Test that a view over its query budget fails the run"""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        budgets = f"{tmpdir}/budgets.json"
+        output = f"{tmpdir}/results.json"
+        with open(budgets, "w") as fh:
+            json.dump({"20": {"index": 0, "person_search": 100}}, fh)
+
+        with self.assertRaisesMessage(CommandError, "20: index ran"):
+            call_command(
+                "benchmark_views",
+                sizes=[20],
+                repeat=0,
+                budgets=budgets,
+                output=output,
+                stdout=io.StringIO(),
+                stderr=io.StringIO(),
+            )
+
+        with open(output) as fh:
+            results = json.load(fh)["20"]
+        self.assertEqual(results["locations_geojson"]["status"], 200)
+        self.assertGreater(results["crime_list"]["queries"], 0)
+        self.assertFalse(Crime.objects.exists())
+
+
+class GenerateTestDataTestCase(TestCase):
+    """Test cases for the generate_test_data command"""
+
+    def generate(self, **options):
+        call_command("generate_test_data", stdout=io.StringIO(), **options)
+
+    def snapshot(self):
+        return [
+            (c.number, c.crime, c.year, c.address.name, c.victim.count())
+            for c in Crime.objects.order_by("number")
+        ]
+
+    def test_bulk_is_seeded_and_clears(self):
+        """Test that --bulk with a seed is reproducible and fully cleared"""
+        self.generate(count=50, bulk=True, seed=7, batch_size=20)
+        self.assertEqual(Crime.objects.count(), 50)
+        self.assertTrue(Crime.weapon.through.objects.exists())
+        self.assertTrue(Crime.victim.through.objects.exists())
+        first = self.snapshot()
+
+        self.generate(clear=True)
+        self.assertFalse(Crime.objects.exists())
+        self.assertFalse(Person.objects.exists())
+        self.assertFalse(Location.objects.exists())
+        self.assertFalse(Weapon.objects.exists())
+
+        self.generate(count=50, bulk=True, seed=7, batch_size=20)
+        self.assertEqual(self.snapshot(), first)
+
+    def test_realistic_profile_is_skewed(self):
+        """Test that the realistic profile concentrates crimes and drops dates"""
+        self.generate(count=300, bulk=True, seed=3, profile="realistic")
+        crimes = Crime.objects.all()
+        self.assertTrue(crimes.filter(date__isnull=True, year="").exists())
+        self.assertTrue(crimes.filter(date__isnull=True).exclude(year="").exists())
+
+        per_location = crimes.values("address").annotate(n=Count("pk"))
+        busiest = max(row["n"] for row in per_location)
+        self.assertGreater(busiest, 5 * 300 / len(per_location))
+
+        busiest_perpetrator = (
+            Person.objects.annotate(n=Count("crime_perpetrator")).order_by("-n").first()
+        )
+        self.assertGreater(busiest_perpetrator.n, 10)
+
+
+@override_settings(PROFILING_SAMPLE_RATE=1)
+class ProfilingTestCase(TestCase):
+    """Test cases for the sampling profiler and its admin page"""
+
+    def setUp(self):
+        cache.clear()
+        profiling.clear_samples()
+        city = City.objects.create(name="Venice", latitude=45.44, longitude=12.32)
+        for name in ("Rialto", "San Marco"):
+            location = Location.objects.create(name=name, city=city)
+            crime = Crime.objects.create(crime="assault", address=location)
+            crime.victim.add(Person.objects.create(first_name="Angelo"))
+
+    async def test_async_view_sampled(self):
+        """Test that queries run by async views are recorded"""
+        with self.assertLogs("mapping_violence.profiling", "INFO"):
+            await self.async_client.get(reverse("person_search"), {"q": "ang"})
+
+        sample = profiling.samples()[-1]
+        self.assertEqual(sample["view"], "person_search")
+        self.assertEqual(sample["queries"], 1)
+        self.assertGreater(sample["bytes"], 0)
+
+    def test_repeated_queries(self):
+        """Test that a per-row query shows up as a repeated fingerprint"""
+
+        def per_row_view(request):
+            for location in Location.objects.all():
+                list(location.crime_set.all())
+            return HttpResponse()
+
+        middleware = profiling.ProfilingMiddleware(per_row_view)
+        with self.assertLogs("mapping_violence.profiling", "INFO") as logs:
+            middleware(RequestFactory().get("/per-row/"))
+
+        self.assertEqual(logs.records[0].levelname, "INFO")
+        self.assertEqual(json.loads(logs.records[0].getMessage())["view"], "/per-row/")
+        offenders = profiling.summarize_duplicates(profiling.samples())
+        self.assertEqual(offenders[0]["view"], "/per-row/")
+        self.assertEqual(offenders[0]["max_repeats"], 2)
+
+    @override_settings(PROFILING_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        """Test that nothing is recorded when sampling is off"""
+        self.client.get(reverse("person_search"), {"q": "ang"})
+
+        self.assertEqual(profiling.samples(), [])
+
+    def test_dashboard_staff_only(self):
+        """Test that the performance page lists endpoints for staff only"""
+        url = reverse("performance_dashboard")
+        with self.assertLogs("mapping_violence.profiling", "INFO"):
+            self.assertEqual(self.client.get(url).status_code, 302)
+            self.client.get(reverse("person_search"), {"q": "ang"})
+            self.client.force_login(
+                User.objects.create_user("staff", password="x", is_staff=True)
+            )
+            response = self.client.get(url)
+
+        self.assertContains(response, "person_search")
+
+
+class MetricsTestCase(TestCase):
+    """Test cases for the Prometheus metrics endpoint and instrumentation"""
+
+    def setUp(self):
+        cache.clear()
+        City.objects.create(name="Venice", latitude=45.44, longitude=12.32)
+
+    def metric(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_metrics_endpoint(self):
+        """Test that scrapers with the token get the text format, others don't"""
+        url = reverse("metrics")
+        response = self.client.get(url, headers={"Authorization": "Bearer s3cret"})
+        self.assertContains(response, "mv_request_duration_seconds_bucket")
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+
+        self.assertEqual(self.client.get(url).status_code, 403)
+        wrong = self.client.get(url, headers={"Authorization": "Bearer guess"})
+        self.assertEqual(wrong.status_code, 403)
+        with self.settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_cache_page_hits(self):
+        """Test that cache_page lookups are counted as misses then hits"""
+        labels = {"view": "locations_geojson"}
+        misses = self.metric("mv_cache_page_total", result="miss", **labels)
+        hits = self.metric("mv_cache_page_total", result="hit", **labels)
+
+        self.client.get(reverse("locations_geojson"))
+        self.client.get(reverse("locations_geojson"))
+
+        self.assertEqual(
+            self.metric("mv_cache_page_total", result="miss", **labels), misses + 1
+        )
+        self.assertEqual(
+            self.metric("mv_cache_page_total", result="hit", **labels), hits + 1
+        )
+
+    def test_ratelimit_blocked(self):
+        """Test that rejected requests are counted"""
+        blocked = self.metric("mv_ratelimit_blocked_total", view="crime_export")
+        url = reverse("crime_export", kwargs={"fmt": "jsonl"})
+        for _ in range(11):
+            response = self.client.get(url, {"year_from": 1500})
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(
+            self.metric("mv_ratelimit_blocked_total", view="crime_export"),
+            blocked + 1,
+        )
+
+    def test_export_bytes(self):
+        """Test that streamed export bytes, not characters, are counted"""
+        Crime.objects.create(number="T1", crime="omicidio à Città", year="1600")
+        before = self.metric("mv_export_bytes_total", format="jsonl")
+
+        response = self.client.get(
+            reverse("crime_export", kwargs={"fmt": "jsonl"}), {"year_from": 1500}
+        )
+        size = len(b"".join(response.streaming_content))
+
+        self.assertGreater(size, 0)
+        self.assertEqual(
+            self.metric("mv_export_bytes_total", format="jsonl"), before + size
+        )
+
+    def test_import_rows(self):
+        """Test that import duration and row outcomes are recorded"""
+        labels = {"resource": "CrimeResource", "mode": "dry_run"}
+        imports = self.metric("mv_import_duration_seconds_count", **labels)
+
+        dataset = Dataset(headers=["Number", "Crime"])
+        dataset.append(["T1", "assault"])
+        CrimeResource().import_data(dataset, dry_run=True)
+
+        self.assertEqual(
+            self.metric("mv_import_duration_seconds_count", **labels), imports + 1
+        )
+        self.assertEqual(self.metric("mv_import_rows_total", result="new", **labels), 1)
+
+
+@override_settings(SLOW_QUERY_MS=0)
+class SlowQueriesTestCase(TestCase):
+    """Test cases for slow query capture and its summary command"""
+
+    def test_capture_with_plan(self):
+        """Test that slow SELECTs are logged with plan and originating view"""
+        crime = Crime.objects.create(number="T1", crime="assault")
+
+        with (
+            connection.execute_wrapper(slow_query_wrapper),
+            self.assertLogs("mapping_violence.slow_queries", "WARNING") as logs,
+        ):
+            self.client.get(reverse("crime_detail", kwargs={"crime_id": crime.pk}))
+
+        entries = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertEqual({entry["view"] for entry in entries}, {"crime_detail"})
+        self.assertTrue(all(entry["plan"] for entry in entries))
+        self.assertFalse(any("EXPLAIN" in entry["sql"] for entry in entries))
+
+    def test_failed_query_not_recorded(self):
+        """Test that a failing SELECT is re-raised without an EXPLAIN"""
+        with (
+            connection.execute_wrapper(slow_query_wrapper),
+            self.assertNoLogs("mapping_violence.slow_queries", "WARNING"),
+            self.assertRaises(DatabaseError),
+            transaction.atomic(),
+            connection.cursor() as cursor,
+        ):
+            cursor.execute("SELECT * FROM no_such_table")
+
+    def test_summary(self):
+        """Test that log entries are grouped by fingerprint and ranked"""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        log = f"{tmpdir}/slow.jsonl"
+        with open(log, "w") as fh:
+            for ms, view, sql in [
+                (50, "crime_list", "SELECT a"),
+                (70, "index", "SELECT a"),
+                (100, "crime_list", "SELECT b"),
+            ]:
+                entry = {"ms": ms, "view": view, "fingerprint": sql, "plan": "SCAN"}
+                fh.write(json.dumps(entry) + "\n")
+
+        out = io.StringIO()
+        call_command("slow_queries", log=log, plans=True, stdout=out)
+        output = out.getvalue()
+
+        self.assertIn("3 slow queries, 2 distinct", output)
+        self.assertLess(output.index("SELECT a"), output.index("SELECT b"))
+        self.assertIn("crime_list, index", output)
+
+        out = io.StringIO()
+        call_command("slow_queries", log=log, view="index", stdout=out)
+        self.assertNotIn("SELECT b", out.getvalue())
+
+    def test_summary_missing_log(self):
+        """Test that a missing log file is reported"""
+        with self.assertRaisesMessage(CommandError, "SLOW_QUERY_MS"):
+            call_command("slow_queries", log="/nonexistent/slow.jsonl")
+
+
+class RelatedCrimesTestCase(TestCase):
+    """Test cases for the related-crimes index and its use in crime_detail"""
+
+    def setUp(self):
+        location = Location.objects.create(
+            name="Rialto", city=City.objects.create(name="Venice")
+        )
+        self.crimes = [
+            Crime.objects.create(
+                crime=f"case {i}", address=location, year=str(1500 + i)
+            )
+            for i in range(4)
+        ]
+        self.anna, self.bruno, self.carlo = (
+            Person.objects.create(first_name=name)
+            for name in ("Anna", "Bruno", "Carlo")
+        )
+
+    def links(self):
+        return sorted(
+            RelatedCrime.objects.values_list(
+                "crime_id", "related_id", "person_id", "related_role", "shared_count"
+            )
+        )
+
+    def test_signals_maintain_index(self):
+        """Test that M2M edits and deletions keep the rows and counts current"""
+        a, b, c, d = self.crimes
+        a.victim.add(self.anna, self.bruno)
+        b.perpetrator.add(self.anna)
+        b.victim.add(self.bruno)
+        self.carlo.crime_victim.add(a, c)
+
+        self.assertEqual(
+            RelatedCrime.objects.get(crime=a, related=b, person=self.anna).related_role,
+            "perpetrator",
+        )
+        self.assertEqual(
+            set(
+                RelatedCrime.objects.filter(crime=b, related=a).values_list(
+                    "shared_count", flat=True
+                )
+            ),
+            {2},
+        )
+        self.assertEqual(RelatedCrime.objects.get(crime=c).related_id, a.pk)
+
+        b.victim.add(self.anna)
+        self.assertEqual(
+            RelatedCrime.objects.get(crime=a, related=b, person=self.anna).related_role,
+            "both",
+        )
+
+        b.victim.clear()
+        self.assertEqual(
+            RelatedCrime.objects.get(crime=a, related=b).person_id, self.anna.pk
+        )
+        self.assertEqual(RelatedCrime.objects.get(crime=a, related=b).shared_count, 1)
+
+        self.carlo.delete()
+        self.assertFalse(RelatedCrime.objects.filter(related=c).exists())
+        self.assertFalse(RelatedCrime.objects.filter(crime=d).exists())
+
+        signalled = self.links()
+        call_command("rebuild_related_crimes", stdout=io.StringIO())
+        self.assertEqual(self.links(), signalled)
+
+    def test_placeholders_are_skipped(self):
+        """Test that placeholder people such as "unknown" don't link crimes"""
+        unknown = Person.objects.create(last_name="Unknown")
+        for crime in self.crimes:
+            crime.victim.add(unknown)
+        self.crimes[0].victim.add(self.bruno)
+        self.crimes[1].victim.add(self.bruno)
+
+        self.assertEqual(
+            set(RelatedCrime.objects.values_list("person_id", flat=True)),
+            {self.bruno.pk},
+        )
+        call_command("rebuild_related_crimes", stdout=io.StringIO())
+        self.assertEqual(RelatedCrime.objects.count(), 2)
+
+    @override_settings(RELATED_CRIMES_MAX_PER_PERSON=2)
+    def test_prolific_people_link_nearest_crimes(self):
+        """Test that a person in many crimes links each to the nearest in date"""
+        a, b, c, d = self.crimes
+        for day, crime in zip((1, 4, 2, 3), self.crimes):
+            Crime.objects.filter(pk=crime.pk).update(date=date(1500, 1, day))
+        for crime in self.crimes:
+            crime.perpetrator.add(self.anna)
+
+        pairs = {(a, c), (c, d), (d, b)}
+        expected = {(x.pk, y.pk) for pair in pairs for x, y in (pair, pair[::-1])}
+        self.assertEqual(
+            set(RelatedCrime.objects.values_list("crime_id", "related_id")), expected
+        )
+        signalled = self.links()
+        call_command("rebuild_related_crimes", stdout=io.StringIO())
+        self.assertEqual(self.links(), signalled)
+
+    def test_detail_ranks_related_crimes(self):
+        """Test that cases sharing more people come first, with names and roles"""
+        a, b, c, d = self.crimes
+        a.victim.add(self.anna, self.bruno)
+        b.victim.add(self.anna)
+        c.victim.add(self.anna, self.bruno)
+        d.perpetrator.add(self.bruno)
+
+        with self.assertNumQueries(8):
+            response = self.client.get(reverse("crime_detail", args=[a.pk]))
+
+        related = response.context["related_crimes"]
+        self.assertEqual([entry["crime"] for entry in related], [c, d, b])
+        self.assertEqual(
+            related[0]["shared"],
+            [
+                {"name": "Anna", "role": "Victim"},
+                {"name": "Bruno", "role": "Victim"},
+            ],
+        )
+        self.assertEqual(
+            related[1]["shared"], [{"name": "Bruno", "role": "Perpetrator"}]
+        )
+
+
+class PersonNetworkTestCase(TestCase):
+    """Test cases for the person network edges and API"""
+
+    def setUp(self):
+        cache.clear()
+        self.location = Location.objects.create(
+            name="Rialto", city=City.objects.create(name="Venice")
+        )
+        self.anna, self.bruno, self.carlo, self.dora, self.erin = (
+            Person.objects.create(first_name=name)
+            for name in ("Anna", "Bruno", "Carlo", "Dora", "Erin")
+        )
+
+    def crime(self, victims=(), perpetrators=()):
+        crime = Crime.objects.create(crime="assault", address=self.location)
+        crime.victim.add(*victims)
+        crime.perpetrator.add(*perpetrators)
+        return crime
+
+    def edge(self, source, target):
+        return PersonEdge.objects.filter(source=source, target=target).first()
+
+    def edges(self):
+        return sorted(
+            PersonEdge.objects.values_list(
+                "source_id", "target_id", "weight", *network.KINDS
+            )
+        )
+
+    def test_signals_maintain_edges(self):
+        """Test that participants, witnesses and relations keep edges current"""
+        crime = self.crime(victims=[self.anna, self.bruno], perpetrators=[self.carlo])
+        witness = Witness.objects.create(crime=crime, name=self.dora)
+        PersonRelation.objects.create(from_person=self.anna, to_person=self.erin)
+
+        self.assertEqual(self.edge(self.anna, self.bruno).victim, 1)
+        self.assertEqual(self.edge(self.bruno, self.carlo).opposed, 1)
+        self.assertEqual(self.edge(self.carlo, self.dora).witness, 1)
+        self.assertEqual(self.edge(self.erin, self.anna).relation, 1)
+
+        self.crime(perpetrators=[self.anna, self.carlo])
+        edge = self.edge(self.carlo, self.anna)
+        self.assertEqual((edge.opposed, edge.perpetrator, edge.weight), (1, 1, 2))
+
+        witness.name = self.erin
+        witness.save()
+        self.assertIsNone(self.edge(self.dora, self.carlo))
+        self.assertEqual(self.edge(self.erin, self.anna).weight, 2)
+
+        crime.victim.remove(self.bruno)
+        self.assertFalse(PersonEdge.objects.filter(source=self.bruno).exists())
+
+        signalled = self.edges()
+        call_command("rebuild_person_network", stdout=io.StringIO())
+        self.assertEqual(self.edges(), signalled)
+
+        crime.delete()
+        self.assertEqual(self.edge(self.anna, self.carlo).weight, 1)
+        self.assertEqual(self.edge(self.anna, self.erin).weight, 1)
+        self.assertIsNone(self.edge(self.carlo, self.erin))
+
+    def test_network_walk(self):
+        """Test that depth widens the network and limits truncate it"""
+        self.crime(victims=[self.anna, self.bruno])
+        self.crime(victims=[self.anna, self.bruno], perpetrators=[self.carlo])
+        self.crime(victims=[self.carlo], perpetrators=[self.dora])
+        url = reverse("person_network", args=[self.anna.pk])
+
+        data = self.client.get(url).json()
+        self.assertEqual(
+            [node["label"] for node in data["nodes"]], ["Anna", "Bruno", "Carlo"]
+        )
+        self.assertEqual(
+            data["edges"][0],
+            {
+                "source": self.anna.pk,
+                "target": self.bruno.pk,
+                "weight": 2,
+                "victim": 2,
+                "perpetrator": 0,
+                "opposed": 0,
+                "witness": 0,
+                "relation": 0,
+            },
+        )
+        self.assertEqual(len(data["edges"]), 3)
+        self.assertFalse(data["truncated"])
+
+        data = self.client.get(url, {"depth": 2}).json()
+        self.assertEqual(
+            data["nodes"][-1], {"id": self.dora.pk, "label": "Dora", "depth": 2}
+        )
+
+        with override_settings(PERSON_NETWORK_MAX_NODES=2):
+            data = self.client.get(url, {"depth": 2}).json()
+        self.assertTrue(data["truncated"])
+        self.assertEqual([node["label"] for node in data["nodes"]], ["Anna", "Bruno"])
+
+    def test_network_errors(self):
+        """Test that bad depths and unknown people are rejected"""
+        url = reverse("person_network", args=[self.anna.pk])
+        self.assertEqual(self.client.get(url, {"depth": 9}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"depth": "x"}).status_code, 400)
+        missing = reverse("person_network", args=[0])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+
+class PersonSummaryTestCase(TestCase):
+    """Test cases for per-person summaries and the profile page"""
+
+    def setUp(self):
+        cache.clear()
+        self.rialto = Location.objects.create(
+            name="Rialto", city=City.objects.create(name="Venice")
+        )
+        self.arena = Location.objects.create(
+            name="Arena", city=City.objects.create(name="Verona")
+        )
+        self.sword = Weapon.objects.create(name="Sword", weapon_category="blade")
+        self.anna = Person.objects.create(first_name="Anna")
+        self.first = Crime.objects.create(
+            crime="homicide", address=self.rialto, year="1540", fatality=True
+        )
+        self.first.perpetrator.add(self.anna)
+        self.first.weapon.add(self.sword)
+        self.second = Crime.objects.create(
+            crime="assault", address=self.arena, date=date(1552, 3, 1)
+        )
+        self.second.victim.add(self.anna)
+        Witness.objects.create(
+            crime=Crime.objects.create(crime="insult", address=self.rialto),
+            name=self.anna,
+        )
+
+    def summary(self):
+        return PersonSummary.objects.get(person=self.anna)
+
+    def test_signals_maintain_summary(self):
+        """Test that participant, crime and weapon edits update the summary"""
+        summary = self.summary()
+        self.assertEqual(
+            (
+                summary.crime_count,
+                summary.perpetrator_count,
+                summary.victim_count,
+                summary.witness_count,
+                summary.fatal_count,
+                summary.first_year,
+                summary.last_year,
+            ),
+            (3, 1, 1, 1, 1, 1540, 1552),
+        )
+        self.assertEqual(summary.locations, [[self.rialto.pk, 2], [self.arena.pk, 1]])
+        self.assertEqual(summary.weapons, [[self.sword.pk, 1]])
+
+        self.second.fatality = True
+        self.second.save()
+        self.assertEqual(self.summary().fatal_count, 2)
+
+        self.sword.crime_set.clear()
+        self.assertEqual(self.summary().weapons, [])
+
+        signalled = self.summary()
+        call_command("rebuild_person_summaries", stdout=io.StringIO())
+        rebuilt = self.summary()
+        self.assertEqual(rebuilt.fatal_count, signalled.fatal_count)
+        self.assertEqual(rebuilt.locations, signalled.locations)
+
+        self.first.delete()
+        self.assertEqual(self.summary().perpetrator_count, 0)
+        self.assertEqual(self.summary().first_year, 1552)
+
+        self.second.victim.clear()
+        Witness.objects.all().delete()
+        self.assertFalse(PersonSummary.objects.exists())
+
+    def test_profile(self):
+        """Test that the JSON endpoint and profile page show the summary"""
+        response = self.client.get(reverse("person_profile", args=[self.anna.pk]))
+        data = response.json()
+        self.assertEqual(data["crimes"]["total"], 3)
+        self.assertEqual(
+            data["cities"],
+            [
+                {"id": self.rialto.city_id, "name": "Venice", "crimes": 2},
+                {"id": self.arena.city_id, "name": "Verona", "crimes": 1},
+            ],
+        )
+        self.assertEqual(data["weapons"][0]["category"], "Blade")
+
+        response = self.client.get(reverse("person_detail", args=[self.anna.pk]))
+        self.assertContains(response, "Repeat offender", count=0)
+        self.assertContains(response, "1540&ndash;1552")
+
+        response = self.client.get(reverse("person_profile", args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+
+class RepeatOffenderTestCase(TestCase):
+    """Test cases for the computed repeat offender flag"""
+
+    def setUp(self):
+        cache.clear()
+        self.location = Location.objects.create(
+            name="Rialto",
+            city=City.objects.create(name="Venice"),
+            latitude=45.438,
+            longitude=12.336,
+        )
+        self.anna = Person.objects.create(first_name="Anna")
+        self.marco = Person.objects.create(first_name="Marco")
+        self.first = Crime.objects.create(crime="homicide", address=self.location)
+        self.second = Crime.objects.create(crime="assault", address=self.location)
+        self.third = Crime.objects.create(crime="theft", address=self.location)
+
+    def flags(self):
+        return dict(Person.objects.values_list("first_name", "repeat_offender"))
+
+    def test_signals_maintain_flag(self):
+        """Test that perpetrator edits and crime deletes update the flag"""
+        self.first.perpetrator.add(self.anna, self.marco)
+        self.assertEqual(self.flags(), {"Anna": False, "Marco": False})
+
+        self.anna.crime_perpetrator.add(self.second)
+        self.assertEqual(self.flags(), {"Anna": True, "Marco": False})
+
+        # Being a victim doesn't count
+        self.third.victim.add(self.marco)
+        self.assertFalse(self.flags()["Marco"])
+
+        self.first.perpetrator.remove(self.anna)
+        self.assertFalse(self.flags()["Anna"])
+
+        self.first.perpetrator.add(self.anna)
+        self.second.delete()
+        self.assertFalse(self.flags()["Anna"])
+
+    def test_command_fixes_drift(self):
+        """Test that the command recomputes flags changed behind its back"""
+        self.first.perpetrator.add(self.anna)
+        self.second.perpetrator.add(self.anna)
+        Person.objects.update(repeat_offender=False)
+        Person.objects.filter(pk=self.marco.pk).update(repeat_offender=True)
+
+        out = io.StringIO()
+        call_command("update_repeat_offenders", stdout=out)
+        self.assertIn("Updated 2 people", out.getvalue())
+        self.assertEqual(self.flags(), {"Anna": True, "Marco": False})
+
+        with override_settings(REPEAT_OFFENDER_MIN_CRIMES=3):
+            call_command("update_repeat_offenders", stdout=io.StringIO())
+        self.assertFalse(self.flags()["Anna"])
+
+    def test_filters(self):
+        """Test filtering the table and the map by repeat offenders"""
+        self.first.perpetrator.add(self.anna)
+        self.second.perpetrator.add(self.anna)
+        self.third.perpetrator.add(self.marco)
+
+        response = self.client.get(reverse("crime_list"), {"repeat_offender": "true"})
+        crimes = {c.pk for c in response.context["table"].data}
+        self.assertEqual(crimes, {self.first.pk, self.second.pk})
+
+        response = self.client.get(
+            reverse("locations_geojson"), {"repeat_offender": "true"}
+        )
+        (feature,) = response.json()["features"]
+        self.assertEqual(
+            sorted(c["id"] for c in feature["properties"]["crimes"]),
+            [self.first.pk, self.second.pk],
+        )
+
+
+class TimelineTestCase(TestCase):
+    """Test cases for the per-location crime counts behind the time slider"""
+
+    def setUp(self):
+        cache.clear()
+        city = City.objects.create(name="Venice", latitude=45.44, longitude=12.32)
+        self.rialto = Location.objects.create(
+            name="Rialto", city=city, latitude=45.438, longitude=12.336
+        )
+        self.somewhere = Location.objects.create(name="Somewhere", city=city)
+        Crime.objects.create(
+            crime="homicide", address=self.rialto, year="1541", fatality=True
+        )
+        Crime.objects.create(crime="homicide", address=self.rialto, year="1548")
+        Crime.objects.create(
+            crime="assault", address=self.somewhere, date=date(1552, 3, 1)
+        )
+        Crime.objects.create(crime="assault", address=self.somewhere)
+
+    def get(self, **params):
+        return self.client.get(reverse("crime_timeline"), params)
+
+    def cells(self, data):
+        return {
+            (
+                data["locations"][loc]["name"],
+                data["periods"][period],
+                data["crime_types"][crime_type],
+            ): (crimes, fatal)
+            for loc, period, crime_type, crimes, fatal in data["cells"]
+        }
+
+    def test_cube(self):
+        """Test counts per location, period and crime type"""
+        data = self.get().json()
+        self.assertEqual(data["periods"], [1541, 1548, 1552])
+        self.assertEqual(data["undated"], 1)
+        self.assertEqual(
+            [(loc["name"], loc["precision"]) for loc in data["locations"]],
+            [("Rialto", "precise"), ("Somewhere", "city")],
+        )
+        self.assertEqual(
+            self.cells(data),
+            {
+                ("Rialto", 1541, "homicide"): (1, 1),
+                ("Rialto", 1548, "homicide"): (1, 0),
+                ("Somewhere", 1552, "assault"): (1, 0),
+            },
+        )
+
+        data = self.get(bucket="decade").json()
+        self.assertEqual(
+            self.cells(data),
+            {
+                ("Rialto", 1540, "homicide"): (2, 1),
+                ("Somewhere", 1550, "assault"): (1, 0),
+            },
+        )
+
+        self.assertEqual(self.get(bucket="century").status_code, 400)
+
+    def test_cache_invalidated_on_edit(self):
+        """Test that the cached cube is served until a crime changes"""
+        self.get()
+        with self.assertNumQueries(0):
+            self.get()
+
+        Crime.objects.create(crime="theft", address=self.rialto, year="1560")
+        data = self.get().json()
+        self.assertIn(1560, data["periods"])
+
+
+class CleanupCitiesTestCase(TestCase):
+    """Test cases for merging location-in-name cities into their base city"""
+
+    def setUp(self):
+        self.bologna = City.objects.create(
+            name="Bologna", latitude=44.49, longitude=11.34
+        )
+        self.venice = City.objects.create(
+            name="Venice", latitude=45.44, longitude=12.32
+        )
+        self.persiceto = City.objects.create(
+            name="San Giovanni in Persiceto", latitude=44.64, longitude=11.18
+        )
+        City.objects.create(name="San Giovanni", latitude=44.0, longitude=11.0)
+        self.rialto = Location.objects.create(name="Rialto", city=self.venice)
+
+        self.crimes = {}
+        for name in (
+            "Bologna piazza san martino",
+            "Bologna, piazza san martino",
+            "Venice ",
+            "San Giovanni in Persiceto; chiesa",
+            "Atlantis",
+        ):
+            city = City.objects.create(name=name)
+            location = Location.objects.create(
+                name="Rialto" if name == "Venice " else name, city=city
+            )
+            self.crimes[name] = Crime.objects.create(crime="assault", address=location)
+        self.anna = Person.objects.create(first_name="Anna")
+        self.crimes["Venice "].victim.add(self.anna)
+
+    def test_find_base_city(self):
+        """Test that the longest base name followed by a separator wins"""
+        from mapping_violence.management.commands.cleanup_cities import BaseCityTrie
+
+        trie = BaseCityTrie(City.objects.exclude(latitude__isnull=True))
+        self.assertEqual(
+            trie.match("San Giovanni in Persiceto; chiesa"),
+            (self.persiceto, "chiesa"),
+        )
+        self.assertEqual(trie.match("bologna  "), (self.bologna, ""))
+        self.assertEqual(trie.match("Bolognaccio"), (None, None))
+        self.assertEqual(trie.match("Atlantis"), (None, None))
+
+    def test_dry_run(self):
+        """Test that the default run only reports"""
+        out = io.StringIO()
+        call_command("cleanup_cities", stdout=out)
+        self.assertIn(
+            "1 whitespace duplicates, 3 location-in-name cities, 1 unmatched",
+            out.getvalue(),
+        )
+        self.assertEqual(City.objects.count(), 9)
+
+    def test_apply(self):
+        """Test that locations move to their base city or merge into a match"""
+        call_command("cleanup_cities", apply=True, stdout=io.StringIO())
+        self.assertEqual(
+            sorted(City.objects.values_list("name", flat=True)),
+            [
+                "Atlantis",
+                "Bologna",
+                "San Giovanni",
+                "San Giovanni in Persiceto",
+                "Venice",
+            ],
+        )
+
+        def place(name):
+            crime = Crime.objects.select_related("address__city").get(
+                pk=self.crimes[name].pk
+            )
+            return crime.address.city.name, crime.address.name
+
+        self.assertEqual(
+            place("Bologna piazza san martino"), ("Bologna", "piazza san martino")
+        )
+        # The second spelling merged into the location the first became
+        self.assertEqual(
+            Crime.objects.get(pk=self.crimes["Bologna, piazza san martino"].pk).address,
+            Crime.objects.get(pk=self.crimes["Bologna piazza san martino"].pk).address,
+        )
+        self.assertEqual(
+            place("San Giovanni in Persiceto; chiesa"),
+            ("San Giovanni in Persiceto", "chiesa"),
+        )
+        self.assertEqual(
+            Crime.objects.get(pk=self.crimes["Venice "].pk).address, self.rialto
+        )
+        self.assertEqual(
+            PersonSummary.objects.get(person=self.anna).locations, [[self.rialto.pk, 1]]
+        )
+
+        moved = Location.objects.get(name="chiesa")
+        self.assertEqual(moved.precision, "city")
+        self.assertEqual(float(moved.effective_latitude), self.persiceto.latitude)
+
+    def test_report(self):
+        """Test the CSV report of every city"""
+        out = io.StringIO()
+        call_command("cleanup_cities", report=True, stdout=out)
+        rows = {row[1]: row for row in csv.reader(io.StringIO(out.getvalue()))}
+        self.assertEqual(rows["Bologna"][3], "base")
+        self.assertEqual(
+            rows["Venice "][3:8], ["whitespace_dupe", "Venice", "", "1", "1"]
+        )
+        self.assertEqual(
+            rows["Bologna, piazza san martino"][3:6],
+            ["location_in_name", "Bologna", "piazza san martino"],
+        )
+        self.assertEqual(rows["Atlantis"][3], "unmatched")
+
+
+class MergeTestCase(TestCase):
+    """Test cases for merging duplicate records"""
+
+    def setUp(self):
+        self.venice = City.objects.create(
+            name="Venice", latitude=45.44, longitude=12.32
+        )
+        self.rialto = Location.objects.create(name="Rialto", city=self.venice)
+        self.anna = Person.objects.create(first_name="Anna", last_name="Bon")
+        self.anna2 = Person.objects.create(first_name="Ana", last_name="Bon")
+        self.marco = Person.objects.create(first_name="Marco")
+        self.theft = Crime.objects.create(crime="theft", address=self.rialto)
+        self.assault = Crime.objects.create(crime="assault", address=self.rialto)
+        self.theft.victim.add(self.anna, self.anna2)
+        self.assault.perpetrator.add(self.anna2)
+        self.assault.victim.add(self.marco)
+        Witness.objects.create(name=self.anna2, crime=self.theft)
+
+    def test_merge_people(self):
+        """Test that links move to the kept person without duplicate rows"""
+        report = merging.merge(self.anna, [self.anna2], dry_run=True)
+        self.assertEqual(report["deleted"], 1)
+        self.assertEqual(
+            report["relations"]["mapping_violence.Crime_victim.person"],
+            {"moved": 0, "merged": 1},
+        )
+        self.assertTrue(Person.objects.filter(pk=self.anna2.pk).exists())
+
+        self.assertEqual(merging.merge(self.anna, [self.anna2]), report)
+        self.assertFalse(Person.objects.filter(pk=self.anna2.pk).exists())
+        self.assertEqual(list(self.theft.victim.all()), [self.anna])
+        self.assertEqual(list(self.assault.perpetrator.all()), [self.anna])
+        self.assertEqual(Witness.objects.get().name, self.anna)
+
+        summary = PersonSummary.objects.get(person=self.anna)
+        self.assertEqual(
+            (summary.crime_count, summary.victim_count, summary.witness_count),
+            (2, 1, 1),
+        )
+        self.assertTrue(
+            PersonEdge.objects.filter(source=self.anna, target=self.marco).exists()
+        )
+        self.assertTrue(
+            RelatedCrime.objects.filter(person=self.anna, crime=self.theft).exists()
+        )
+
+    def test_merge_related_people(self):
+        """Test that relations between merged people are dropped, not looped"""
+        PersonRelation.objects.create(from_person=self.anna2, to_person=self.anna)
+        PersonRelation.objects.create(from_person=self.anna, to_person=self.marco)
+        PersonRelation.objects.create(from_person=self.marco, to_person=self.anna2)
+
+        report = merging.merge(self.anna, [self.anna2])
+        self.assertEqual(report["deleted"], 1)
+        self.assertEqual(
+            sorted(
+                PersonRelation.objects.values_list("from_person_id", "to_person_id")
+            ),
+            sorted([(self.anna.pk, self.marco.pk), (self.marco.pk, self.anna.pk)]),
+        )
+        self.assertFalse(PersonEdge.objects.filter(source=self.anna, target=self.anna))
+        self.assertEqual(
+            PersonEdge.objects.get(source=self.anna, target=self.marco).relation, 2
+        )
+
+    def test_merge_cities(self):
+        """Test that colliding locations of merged cities are merged too"""
+        venezia = City.objects.create(name="Venezia")
+        church = {"category_of_space": "sacred", "description_of_location": "church"}
+        kept = Location.objects.create(name="San Polo", city=self.venice, **church)
+        dup = Location.objects.create(name="S. Polo", city=venezia, **church)
+        other = Location.objects.create(name="Rialto", city=venezia)
+        crime = Crime.objects.create(crime="homicide", address=dup)
+
+        report = merging.merge(self.venice, [venezia])
+        self.assertEqual(
+            report["relations"]["locations.Location.city"], {"moved": 1, "merged": 1}
+        )
+        self.assertEqual(Crime.objects.get(pk=crime.pk).address, kept)
+        other.refresh_from_db()
+        self.assertEqual((other.city, other.precision), (self.venice, "city"))
+        self.assertFalse(Location.objects.filter(pk=dup.pk).exists())
+
+    def test_admin_merge_weapons(self):
+        """Test the admin merge action with a preview"""
+        dagger = Weapon.objects.create(name="dagger")
+        pugnale = Weapon.objects.create(name="pugnale")
+        self.theft.weapon.add(dagger, pugnale)
+        self.assault.weapon.add(pugnale)
+        self.client.force_login(
+            User.objects.create_superuser("admin", password="x", email="a@b.c")
+        )
+        url = reverse("admin:mapping_violence_weapon_changelist")
+        data = {
+            "action": "merge_selected",
+            "_selected_action": [dagger.pk, pugnale.pk],
+            "primary": dagger.pk,
+        }
+
+        response = self.client.post(url, {**data, "preview": ""})
+        self.assertContains(response, "mapping_violence.Crime_weapon.weapon: 1 moved")
+        self.assertEqual(Weapon.objects.count(), 2)
+
+        self.client.post(url, {**data, "apply": ""})
+        self.assertEqual(list(Weapon.objects.all()), [dagger])
+        self.assertEqual(list(self.assault.weapon.all()), [dagger])
+        self.assertEqual(self.theft.weapon.count(), 1)
+
+    def test_admin_merge_needs_delete_permission(self):
+        """Test that the merge action is only offered to users who may delete"""
+        editor = User.objects.create_user("editor", password="x", is_staff=True)
+        editor.user_permissions.set(
+            Permission.objects.filter(codename__in=["view_person", "change_person"])
+        )
+        self.client.force_login(editor)
+        url = reverse("admin:mapping_violence_person_changelist")
+        self.assertNotContains(self.client.get(url), "merge_selected")
+
+        editor.user_permissions.add(Permission.objects.get(codename="delete_person"))
+        self.assertContains(self.client.get(url), "merge_selected")
+
+    def test_merge_records_command(self):
+        """Test the command's dry run and errors"""
+        out = io.StringIO()
+        call_command(
+            "merge_records", "person", self.anna.pk, self.anna2.pk, dry_run=True,
+            stdout=out,
+        )  # fmt: skip
+        self.assertIn("Would merge 1 persons", out.getvalue())
+        self.assertEqual(Person.objects.count(), 3)
+        with self.assertRaises(CommandError):
+            call_command("merge_records", "person", self.anna.pk, 999)
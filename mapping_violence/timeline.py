@@ -0,0 +1,108 @@
+"""
+Crime counts per location and period for animating the map over time.
+
+``cube`` counts crimes by location, year or decade and crime type, with
+how many of them were fatal, in one grouped query. The result is cached
+for CACHE_SECONDS and dropped by the receivers in
+mapping_violence.signals when a crime or location changes, so a time
+slider can fetch it once and filter and animate client-side. The cache is
+per worker with LocMemCache, so other workers may serve a stale cube
+until it expires.
+"""
+
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from locations.models import Location
+from mapping_violence.models import Crime
+from mapping_violence.summaries import crime_year
+
+BUCKETS = {"year": 1, "decade": 10}
+
+CACHE_KEY = "crime_timeline:{bucket}"
+CACHE_SECONDS = 60 * 60
+
+
+def compute(bucket="year"):
+    """Build the cube for ``bucket`` (a key of BUCKETS) from the database."""
+    width = BUCKETS[bucket]
+    rows = (
+        Crime.objects.filter(address__isnull=False)
+        .values_list("address_id", "year", "date__year", "crime", "fatality")
+        .annotate(n=Count("pk"))
+        .order_by()
+    )
+
+    # (location, period, crime type) -> [crimes, fatal crimes]
+    counts = defaultdict(lambda: [0, 0])
+    undated = 0
+    for location_id, year, date_year, crime_type, fatal, n in rows:
+        year = crime_year(year, None) or date_year
+        if year is None:
+            undated += n
+            continue
+        cell = counts[location_id, year - year % width, crime_type or ""]
+        cell[0] += n
+        if fatal:
+            cell[1] += n
+
+    locations = Location.objects.exclude(precision="").in_bulk(
+        {key[0] for key in counts}
+    )
+
+    periods = sorted({period for _, period, _ in counts})
+    crime_types = sorted({crime_type for _, _, crime_type in counts})
+    location_ids = sorted(locations)
+    period_index = {p: i for i, p in enumerate(periods)}
+    type_index = {t: i for i, t in enumerate(crime_types)}
+    location_index = {pk: i for i, pk in enumerate(location_ids)}
+
+    return {
+        "bucket": bucket,
+        "periods": periods,
+        "crime_types": crime_types,
+        "locations": [
+            {
+                "id": pk,
+                "name": locations[pk].name,
+                "city_id": locations[pk].city_id,
+                "coordinates": [
+                    float(locations[pk].effective_longitude),
+                    float(locations[pk].effective_latitude),
+                ],
+                "precision": locations[pk].precision,
+            }
+            for pk in location_ids
+        ],
+        "cells": [
+            [
+                location_index[location_id],
+                period_index[period],
+                type_index[crime_type],
+                crimes,
+                fatal,
+            ]
+            for (location_id, period, crime_type), (crimes, fatal) in sorted(
+                counts.items()
+            )
+            if location_id in location_index
+        ],
+        "undated": undated,
+    }
+
+
+def cube(bucket="year"):
+    """The cached cube for ``bucket``, computed on first use."""
+    key = CACHE_KEY.format(bucket=bucket)
+    data = cache.get(key)
+    if data is None:
+        data = compute(bucket)
+        cache.set(key, data, CACHE_SECONDS)
+    return data
+
+
+def invalidate():
+    """Drop the cached cubes."""
+    cache.delete_many([CACHE_KEY.format(bucket=bucket) for bucket in BUCKETS])
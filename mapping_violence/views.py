@@ -1,17 +1,32 @@
-import csv
-
-from django.db.models import Q
-from django.http import StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from django.db.models import F, Window
+from django.db.models.functions import DenseRank
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
-from django_ratelimit.decorators import ratelimit
 from django_tables2 import RequestConfig
 
 from content.models import HomePageContent, ProjectPerson
 from mapping_violence.context_helpers import get_filter_context
+from mapping_violence.decorators import ratelimit
+from mapping_violence.exports import (
+    EXPORT_FORMATS,
+    aiter_csv,
+    artifact_response,
+    export_filename,
+    get_export_queryset,
+    is_unfiltered,
+    iter_export,
+    parquet_available,
+)
 from mapping_violence.filters import CrimeFilter
-from mapping_violence.models import Crime
+from mapping_violence.metrics import acount_bytes, count_bytes
+from mapping_violence.models import Crime, Person, RelatedCrime
+from mapping_violence.summaries import profile
 from mapping_violence.tables import CrimeTable
 
+RELATED_CRIMES_SHOWN = 10
+PROFILE_ITEMS_SHOWN = 10
+
 
 def index(request):
     # Get active home page content
@@ -44,37 +59,29 @@ def crime_detail(request, crime_id):
         pk=crime_id,
     )
 
-    # Find cases sharing a victim or perpetrator with this crime
-    person_pks = set(
-        list(crime.victim.values_list("pk", flat=True))
-        + list(crime.perpetrator.values_list("pk", flat=True))
+    # Cases sharing a victim or perpetrator, most people in common first,
+    # from the precomputed index (see mapping_violence.related)
+    recency = [
+        F("related__date").desc(nulls_last=True),
+        F("related__year").desc(nulls_last=True),
+        F("related_id").desc(),
+    ]
+    links = (
+        RelatedCrime.objects.filter(crime=crime)
+        .annotate(
+            rank=Window(DenseRank(), order_by=[F("shared_count").desc(), *recency])
+        )
+        .filter(rank__lte=RELATED_CRIMES_SHOWN)
+        .select_related("related__address__city", "person")
+        .order_by("rank", "person_id")
     )
-    if person_pks:
-        related_qs = (
-            Crime.objects.filter(
-                Q(victim__in=person_pks) | Q(perpetrator__in=person_pks)
-            )
-            .exclude(pk=crime.pk)
-            .select_related("address", "address__city")
-            .prefetch_related("victim", "perpetrator")
-            .distinct()
-            .order_by("-date", "-year")[:10]
+    related_crimes = []
+    for link in links:
+        if not related_crimes or related_crimes[-1]["crime"].pk != link.related_id:
+            related_crimes.append({"crime": link.related, "shared": []})
+        related_crimes[-1]["shared"].append(
+            {"name": str(link.person), "role": link.get_related_role_display()}
         )
-        related_crimes = []
-        for rel in related_qs:
-            shared = []
-            seen_pks = set()
-            for v in rel.victim.all():
-                if v.pk in person_pks and v.pk not in seen_pks:
-                    shared.append(str(v))
-                    seen_pks.add(v.pk)
-            for p in rel.perpetrator.all():
-                if p.pk in person_pks and p.pk not in seen_pks:
-                    shared.append(str(p))
-                    seen_pks.add(p.pk)
-            related_crimes.append({"crime": rel, "shared": shared})
-    else:
-        related_crimes = []
 
     context = {
         "crime": crime,
@@ -84,6 +91,16 @@ def crime_detail(request, crime_id):
     return render(request, "crimes/detail.html", context)
 
 
+def person_detail(request, person_id):
+    """Profile of a person: their crimes by role, years, places and weapons"""
+    person = get_object_or_404(Person, pk=person_id)
+    context = {
+        "person": person,
+        "profile": profile(person, limit=PROFILE_ITEMS_SHOWN),
+    }
+    return render(request, "persons/detail.html", context)
+
+
 def crime_list(request):
     """Display a data table of all crimes with filtering"""
     crimes = (
@@ -108,70 +125,51 @@ def crime_list(request):
     return render(request, "crimes/list.html", context)
 
 
-class Echo:
-    """Pseudo-buffer for StreamingHttpResponse with csv.writer."""
+def _export_response(request, fmt):
+    # Unfiltered downloads are served from the nightly pre-built files
+    if is_unfiltered(request.GET):
+        response = artifact_response(fmt)
+        if response:
+            return response
 
-    def write(self, value):
-        return value
+    if fmt == "parquet" and not parquet_available():
+        return HttpResponse(
+            "Parquet export is not available on this server.",
+            status=501,
+            content_type="text/plain",
+        )
+
+    queryset = get_export_queryset(request.GET)
+    content_type, _ = EXPORT_FORMATS[fmt]
+    response = StreamingHttpResponse(
+        count_bytes(iter_export(fmt, queryset), fmt),
+        content_type=content_type,
+    )
+    response["Content-Disposition"] = f'attachment; filename="{export_filename(fmt)}"'
+    return response
 
 
 @ratelimit(key="ip", rate="10/m", method="GET", block=True)
-def crime_export_csv(request):
+async def crime_export_csv(request):
     """Export filtered crimes as a CSV download."""
-    crimes = (
-        Crime.objects.select_related("address", "address__city", "connected_event")
-        .prefetch_related("victim", "perpetrator", "weapon")
-        .order_by("-date", "-year")
-    )
-    crime_filter = CrimeFilter(request.GET, queryset=crimes)
-    queryset = crime_filter.qs
-
-    columns = [
-        ("Case Number", lambda c: c.number),
-        ("Crime", lambda c: c.crime),
-        ("Date", lambda c: str(c.date) if c.date else ""),
-        ("Year", lambda c: c.year),
-        ("Month", lambda c: c.month),
-        ("Day", lambda c: c.day),
-        ("City", lambda c: c.address.city.name if c.address and c.address.city else ""),
-        ("Location", lambda c: c.address.name if c.address else ""),
-        ("Victim(s)", lambda c: "; ".join(str(v) for v in c.victim.all())),
-        (
-            "Victim Gender",
-            lambda c: "; ".join(v.gender for v in c.victim.all() if v.gender),
-        ),
-        ("Perpetrator(s)", lambda c: "; ".join(str(p) for p in c.perpetrator.all())),
-        (
-            "Perpetrator Gender",
-            lambda c: "; ".join(p.gender for p in c.perpetrator.all() if p.gender),
-        ),
-        ("Weapon", lambda c: "; ".join(str(w) for w in c.weapon.all())),
-        ("Motive", lambda c: c.motive),
-        ("Fatality", lambda c: "Y" if c.fatality else "N"),
-        (
-            "Convicted",
-            lambda c: "Y" if c.convicted else "N" if c.convicted is False else "",
-        ),
-        ("Sentence", lambda c: c.sentence),
-        ("Description", lambda c: c.description_of_case),
-        (
-            "Connected Event",
-            lambda c: str(c.connected_event) if c.connected_event else "",
-        ),
-        ("Archival Location", lambda c: c.archival_location),
-        ("Reference", lambda c: c.reference),
-    ]
-
-    def rows():
-        yield [col[0] for col in columns]
-        for crime in queryset.iterator(chunk_size=500):
-            yield [col[1](crime) for col in columns]
+    if is_unfiltered(request.GET):
+        response = await sync_to_async(artifact_response)("csv")
+        if response:
+            return response
 
-    pseudo_buffer = Echo()
-    writer = csv.writer(pseudo_buffer)
+    # Building the filter form validates choices against the database
+    queryset = await sync_to_async(get_export_queryset)(request.GET)
     response = StreamingHttpResponse(
-        (writer.writerow(row) for row in rows()),
-        content_type="text/csv",
+        acount_bytes(aiter_csv(queryset), "csv"),
+        content_type=EXPORT_FORMATS["csv"][0],
     )
-    response["Content-Disposition"] = 'attachment; filename="mapping_violence_data.csv"'
+    response["Content-Disposition"] = f'attachment; filename="{export_filename("csv")}"'
     return response
+
+
+@ratelimit(key="ip", rate="10/m", method="GET", block=True)
+def crime_export(request, fmt):
+    """Export filtered crimes as JSON Lines, GeoJSON or Parquet."""
+    if fmt not in EXPORT_FORMATS:
+        raise Http404(f"Unsupported export format: {fmt}")
+    return _export_response(request, fmt)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Simple load test for the public map and data endpoints.
+
+Usage:
+    python util/loadtest.py --base-url http://localhost:8000 --concurrency 20 --duration 30
+
+Fires concurrent GET requests at each endpoint for a fixed duration and
+reports throughput and latency percentiles. Run the server with
+RATELIMIT_ENABLE=False, otherwise most requests will be rejected by the
+per-IP rate limits.
+"""
+
+import argparse
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ENDPOINTS = [
+    ("map geojson", "/api/locations.geojson"),
+    ("map geojson (fatal)", "/api/locations.geojson?fatality=true"),
+    ("person search", "/api/persons/search/?q=an"),
+    ("data table", "/data/"),
+    ("data table (filtered)", "/data/?year_from=1550&year_to=1600"),
+    ("csv export (filtered)", "/data/export.csv?year_from=1550&year_to=1600"),
+]
+
+
+def fetch(url, timeout):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            size = len(response.read())
+            status = response.status
+    except urllib.error.HTTPError as e:
+        size = 0
+        status = e.code
+    except (urllib.error.URLError, TimeoutError):
+        size = 0
+        status = "error"
+    return status, time.perf_counter() - start, size
+
+
+def run_endpoint(url, concurrency, duration, timeout):
+    """Hammer one URL from ``concurrency`` threads for ``duration`` seconds."""
+    deadline = time.perf_counter() + duration
+    latencies = []
+    statuses = Counter()
+    total_bytes = 0
+    lock = threading.Lock()
+
+    def worker():
+        nonlocal total_bytes
+        while time.perf_counter() < deadline:
+            status, elapsed, size = fetch(url, timeout)
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+                total_bytes += size
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    wall = time.perf_counter() - started
+    return latencies, statuses, total_bytes, wall
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=15, help="seconds")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds")
+    parser.add_argument(
+        "--only", action="append", help="Only run endpoints whose name contains this"
+    )
+    args = parser.parse_args()
+
+    endpoints = ENDPOINTS
+    if args.only:
+        endpoints = [e for e in ENDPOINTS if any(o in e[0] for o in args.only)]
+
+    print(
+        f"{'endpoint':<24} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'p99 ms':>8} {'MB/s':>7}  statuses"
+    )
+    failed = False
+    for name, path in endpoints:
+        url = args.base_url.rstrip("/") + path
+        latencies, statuses, total_bytes, wall = run_endpoint(
+            url, args.concurrency, args.duration, args.timeout
+        )
+        ms = [latency * 1000 for latency in latencies]
+        print(
+            f"{name:<24} {len(latencies) / wall:>8.1f} "
+            f"{statistics.median(ms) if ms else 0:>8.1f} "
+            f"{percentile(ms, 95):>8.1f} {percentile(ms, 99):>8.1f} "
+            f"{total_bytes / wall / 1e6:>7.2f}  "
+            + ", ".join(f"{k}={v}" for k, v in sorted(statuses.items(), key=str))
+        )
+        failed = failed or any(s != 200 for s in statuses)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())